@@ -1,80 +1,218 @@
-import re
-import pandas as pd
-import nltk
-from nltk import CFG, ChartParser, Tree, Nonterminal, Production
+import numpy as np
+from nltk import CFG, Tree
 import sys
 import time
 import json
 import csv
 import os
+import argparse
+
+from translator_core import (load_grammar, load_lexicon, load_dictionary, build_productions,
+                             simple_lexical_translate, rewrite, rewrite_leaves)
+from parse_budget import parse_corpus, STATUS_NO_PARSE, DEFAULT_TIME_BUDGET, DEFAULT_EDGE_BUDGET
+from chunk_fallback import chunk_leaves, format_chunks
+from pcfg_model import (load_model, rule_log_probabilities, viterbi_parser_factory,
+                        DEFAULT_MODEL_FILE, DEFAULT_BEAM_WIDTH)
+from chart_arena import arena_parser_factory
+from earley_parser import EarleyGrammar, earley_parser_factory, select_engine, DEFAULT_SELECTION_FILE
+from parser_codegen import load_generated, DEFAULT_GENERATED_DIR
+from skeleton_cache import SkeletonCache
+from morphology import MorphAnalyzer
+from fuzzy_lexicon import FuzzyResolver, DEFAULT_MAX_DISTANCE
+from pos_tagger import BigramTagger, prune_skeletons, DEFAULT_TAGGER_FILE, DEFAULT_MAX_TAGS
+from batched_cyk import BinarizedGrammar, recognize_corpus
+from rule_profiler import RuleProfile, print_report, DEFAULT_REPORT_FILE
+from corpus_columns import TokenizedCorpus
+from id_pipeline import (to_id_productions, IdTranslator, decode_words, decode_tree, decode_chunks,
+                         encode_tree)
+from result_store import ResultStore, fingerprint, file_fingerprint, production_key, DEFAULT_STORE_FILE
+from checkpoint import Checkpoint, ranges, DEFAULT_CHECKPOINT_DIR, DEFAULT_CHECKPOINT_EVERY
+from corpus_ingest import AtomicWriter
+from line_index import LineIndex, parse_row_range
+from shard_runner import run_statistics
+from stream_mode import STREAM_FORMATS
+from tree_serializer import serialize_tree
+
+FIELDNAMES = [
+    'Original Tagalog', 'Tokens', 'Reference English', 'Parsed', 'Parse Status',
+    'Parsed Tree (Compact)', 'Parsed Tree (Pretty Single Line)',
+    'Rewritten Tree (Compact)', 'Rewritten Tree (Pretty Single Line)',
+    'Rewritten Tagalog Text', 'Fallback Chunks', 'Simple Lexical Translation'
+]
+
+DEFAULT_OUTPUT_FILE = 'translation_analysis_output.csv'
+
+# Short names accepted by --columns, in FIELDNAMES order.
+COLUMN_ALIASES = dict(zip(
+    ['original', 'tokens', 'reference', 'parsed', 'status',
+     'parsed_tree', 'parsed_pretty', 'rewritten_tree', 'rewritten_pretty',
+     'rewritten_text', 'chunks', 'translation'],
+    FIELDNAMES))
+
+def parse_columns(value):
+    columns = []
+    for name in value.split(','):
+        name = name.strip()
+        if name == 'all':
+            columns.extend(FIELDNAMES)
+        elif name in COLUMN_ALIASES:
+            columns.append(COLUMN_ALIASES[name])
+        elif name in FIELDNAMES:
+            columns.append(name)
+        elif name:
+            raise argparse.ArgumentTypeError(
+                f"unknown column '{name}' (choose from: all, {', '.join(COLUMN_ALIASES)})")
+    if not columns:
+        raise argparse.ArgumentTypeError("no columns selected")
+    return list(dict.fromkeys(columns))
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="CFG-based Tagalog to English translator.")
+    arg_parser.add_argument('--data', default='Appendix_A_Parallel_Corpus_Tagalog_English.tsv',
+                            help="Parallel corpus TSV to translate.")
+    arg_parser.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv',
+                            help="POS lexicon TSV. The compacted lexicon written by 'python morphology.py "
+                                 "compact' gives the same tags with --morphology.")
+    arg_parser.add_argument('--rows', type=parse_row_range, default=None, metavar='START:STOP',
+                            help="Translate only rows START to STOP-1 of the corpus, read through its line "
+                                 "index ('<corpus>.idx', built on first use) instead of the whole file.")
+    arg_parser.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET,
+                            help="Wall-time budget per sentence in seconds (0 disables).")
+    arg_parser.add_argument('--edge-budget', type=int, default=DEFAULT_EDGE_BUDGET,
+                            help="Chart-edge budget per sentence (0 disables).")
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help="Parser worker processes (longest sentences are scheduled first).")
+    arg_parser.add_argument('--no-chunk-fallback', dest='chunk_fallback', action='store_false',
+                            help="Translate unparsed sentences word by word instead of by chart chunks.")
+    arg_parser.add_argument('--morphology', action='store_true',
+                            help="Give corpus words missing from the lexicon and dictionary the tags and "
+                                 "translation of known words with the same root, instead of a default N.")
+    arg_parser.add_argument('--fuzzy', nargs='?', type=int, const=DEFAULT_MAX_DISTANCE, default=None,
+                            metavar='MAX_DISTANCE',
+                            help="Give corpus words still missing from the lexicon and dictionary the tags and "
+                                 "translation of the nearest known word within MAX_DISTANCE edits.")
+    arg_parser.add_argument('--pcfg', nargs='?', const=DEFAULT_MODEL_FILE, default=None, metavar='MODEL',
+                            help="Use the beam-pruned Viterbi parser with rule counts from MODEL "
+                                 "(see 'python pcfg_model.py train').")
+    arg_parser.add_argument('--beam-width', type=int, default=DEFAULT_BEAM_WIDTH,
+                            help="Labels kept per span by the Viterbi parser.")
+    arg_parser.add_argument('--no-chart-arena', dest='chart_arena', action='store_false',
+                            help="Give the Viterbi parser a fresh dict-based chart per sentence instead of "
+                                 "reusing one preallocated chart arena.")
+    arg_parser.add_argument('--skeleton-cache', action='store_true',
+                            help="Parse each distinct POS-tag sequence once instead of every sentence. Pays "
+                                 "off when many sentences share a sequence; implied by --pretag.")
+    arg_parser.add_argument('--pretag', nargs='?', const=DEFAULT_TAGGER_FILE, default=None, metavar='MODEL',
+                            help="Keep only the most probable POS tags of each token, scored by the bigram "
+                                 "tagger in MODEL (see 'python pos_tagger.py train'); sentences that do not "
+                                 "parse are retried with all tags.")
+    arg_parser.add_argument('--pretag-tags', type=int, default=DEFAULT_MAX_TAGS, metavar='K',
+                            help="Tags kept per token with --pretag.")
+    arg_parser.add_argument('--cyk-prefilter', action='store_true',
+                            help="Recognize all sentences first with the batched CYK recognizer and only parse "
+                                 "those that have a parse. Needs --no-chunk-fallback.")
+    arg_parser.add_argument('--parser', choices=['chart', 'earley', 'auto'], default='chart',
+                            help="Parser for the all-parses mode: nltk's chart parser, the Earley backend, or "
+                                 "'auto' for the one benchmarked fastest on this grammar. Ignored with --pcfg.")
+    arg_parser.add_argument('--no-codegen', dest='codegen', action='store_false',
+                            help="Run the Earley parser's table-driven item loop instead of the one generated "
+                                 f"for this grammar in '{DEFAULT_GENERATED_DIR}/'.")
+    arg_parser.add_argument('--profile-rules', nargs='?', const=DEFAULT_REPORT_FILE, default=None, metavar='REPORT',
+                            help="Count rule usage and chart edges per structural rule and write a ranked report.")
+    arg_parser.add_argument('--token-ids', action='store_true',
+                            help="Parse, rewrite and translate integer token IDs; words are only looked up for output.")
+    arg_parser.add_argument('--tree-format', choices=['flat', 'nltk'], default='flat',
+                            help="'flat' writes tree columns as one bracketed line in a single pass; "
+                                 "'nltk' uses str()/pformat() as older outputs did.")
+    arg_parser.add_argument('--output', default=DEFAULT_OUTPUT_FILE, metavar='CSV',
+                            help="Where the detailed results are written.")
+    arg_parser.add_argument('--stats', default=None, metavar='JSON',
+                            help="Also write the run's coverage and timing counts to JSON "
+                                 "(read by 'python shard_runner.py merge').")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="Translate sentences read line by line from stdin, writing one result per line "
+                                 "to stdout, instead of translating the --data corpus.")
+    arg_parser.add_argument('--stream-format', choices=STREAM_FORMATS, default='json',
+                            help="Result format of --stream: one JSON object or one TSV row per line.")
+    arg_parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                            help="With --stream, serve live counters and latency histograms in the Prometheus "
+                                 "text format at http://127.0.0.1:PORT/metrics (0 picks a free port).")
+    arg_parser.add_argument('--examples', type=int, default=10,
+                            help="Number of parsed examples to pretty-print (0 disables).")
+    arg_parser.add_argument('--columns', type=parse_columns, default=FIELDNAMES,
+                            help="Comma-separated output columns, e.g. 'translation,parsed'. "
+                                 "Only the requested fields are computed. Default: all.")
+    arg_parser.add_argument('--result-store', nargs='?', const=DEFAULT_STORE_FILE, default=None, metavar='STORE',
+                            help="Keep parse results in STORE and on later runs re-parse only the sentences "
+                                 "that grammar or lexicon edits can affect.")
+    arg_parser.add_argument('--checkpoint', nargs='?', const=DEFAULT_CHECKPOINT_DIR, default=None, metavar='DIR',
+                            help="Save parse results to DIR after every --checkpoint-every sentences so an "
+                                 "interrupted run can be continued with --resume.")
+    arg_parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_CHECKPOINT_EVERY, metavar='N',
+                            help="Sentences parsed between checkpoints.")
+    arg_parser.add_argument('--resume', action='store_true',
+                            help="Continue an interrupted checkpointed run, parsing only unfinished sentences.")
+    args = arg_parser.parse_args()
+    if args.resume and not args.checkpoint:
+        args.checkpoint = DEFAULT_CHECKPOINT_DIR
+    return args
+
+args = parse_args()
+run_start_time = time.time()
+
+if args.stream:
+    from stream_mode import run_stream
+    sys.exit(run_stream(args, 'Appendix_D_Resource_Grammar_Tagalog_CFG.cfg', args.lexicon,
+                        'Appendix_C_Resource_Dictionary_Tagalog_English.json'))
+
+# Only batch runs need pandas; stream mode starts without it.
+import pandas as pd
+
+if args.metrics_port is not None:
+    print("Note: --metrics-port is only used with --stream.")
+
+# Columns that are actually written; nothing feeding only other columns is computed.
+output_columns = set(args.columns)
+need_rewritten_trees = bool(output_columns & {'Rewritten Tree (Compact)', 'Rewritten Tree (Pretty Single Line)'})
+need_rewritten_leaves = bool(output_columns & {'Rewritten Tagalog Text', 'Simple Lexical Translation'})
+need_chunks = need_rewritten_leaves or 'Fallback Chunks' in output_columns
 
 def clear_console():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    # Only a terminal is cleared; redirected output (e.g. a shard worker's log) keeps its first line.
+    if sys.stdout.isatty():
+        os.system('cls' if os.name == 'nt' else 'clear')
 
 clear_console()
 
-def load_grammar(filepath):
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            grammar_string = f.read()
-        return CFG.fromstring(grammar_string)
-    except FileNotFoundError:
-        print(f"Error: Grammar file not found at '{filepath}'.")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error loading grammar from '{filepath}': {e}")
-        sys.exit(1)
-
-def load_lexicon(filepath):
-    lexicon = []
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f, delimiter='\t')
-            for row in reader:
-                if row and len(row) == 2:
-                    pos, word = row
-                    lexicon.append((pos, word))
-                elif row:
-                    print(f"Warning: Skipping malformed lexicon line: {row}")
-            return lexicon
-    except FileNotFoundError:
-        print(f"Error: Lexicon file not found at '{filepath}'.")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error loading lexicon from '{filepath}': {e}")
-        sys.exit(1)
-
-def load_dictionary(filepath):
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            translation_dict = json.load(f)
-        return translation_dict
-    except FileNotFoundError:
-        print(f"Error: Dictionary file not found at '{filepath}'.")
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON dictionary file '{filepath}': {e}")
-        print("Please ensure the file is valid JSON format.")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error loading dictionary from '{filepath}': {e}")
-        sys.exit(1)
-
-DATA_FILE = 'Appendix_A_Parallel_Corpus_Tagalog_English.tsv'
+DATA_FILE = args.data
 
 try:
-    df = pd.read_csv(
-        DATA_FILE,
-        sep='\t',
-        header=None,
-        names=['tgl_id', 'Tagalog Phrase/Sentence', 'eng_id', 'English Translation']
-    )
+    if args.rows is not None:
+        line_index = LineIndex.open(DATA_FILE)
+        row_start, row_stop = args.rows
+        if row_stop is None:
+            row_stop = len(line_index)
+        df = line_index.read_frame(row_start, row_stop)
+        print(f"Read rows {row_start}:{row_stop} of {len(line_index)} from '{DATA_FILE}'.")
+        if df.empty:
+            print(f"Error: Rows {row_start}:{row_stop} of '{DATA_FILE}' are empty.")
+            sys.exit(1)
+    else:
+        df = pd.read_csv(
+            DATA_FILE,
+            sep='\t',
+            header=None,
+            names=['tgl_id', 'Tagalog Phrase/Sentence', 'eng_id', 'English Translation']
+        )
 except FileNotFoundError:
     print(f"Error: File not found at '{DATA_FILE}'. Please check the filename and path.")
     sys.exit(1)
 except pd.errors.EmptyDataError:
     print(f"Error: The file '{DATA_FILE}' is empty.")
     sys.exit(1)
+except IndexError as e:
+    print(f"Error: {e}")
+    sys.exit(1)
 except pd.errors.ParserError as e:
     print(f"Error parsing '{DATA_FILE}': {e}")
     print("Please ensure it's a valid TSV file (Tab-separated) and check for inconsistencies.")
@@ -91,68 +229,61 @@ if missing_cols:
     print("There might be an issue with the file format or the 'names' provided in pd.read_csv.")
     sys.exit(1)
 
-def tokenize_sentence(s):
-    if not isinstance(s, str): return []
-    s = s.lower()
-    return s.split()
-
-df['tokens'] = df['Tagalog Phrase/Sentence'].apply(tokenize_sentence)
-
-def simple_lexical_translate(tagalog_words, dictionary):
-    if not isinstance(tagalog_words, list):
-        return "[Error: Input not a list]"
-    english_words = []
-    for word in tagalog_words:
-        translated = dictionary.get(str(word).lower(), f"[{word}]")
-        if translated:
-            english_words.append(translated)
-    if not english_words:
-        return "[N/A]"
-    sentence = " ".join(english_words).replace(" ?", "?").replace(" .", ".").replace(" ,", ",").replace(" !", "!")
-    if sentence:
-        return sentence[0].upper() + sentence[1:]
-    return sentence
+corpus = TokenizedCorpus.from_texts(df['Tagalog Phrase/Sentence'].tolist())
+token_lists = corpus.token_lists()
+df['tokens'] = token_lists
 
 print("Loading linguistic resources...")
-grammar_rules_cfg = load_grammar('Appendix_Methodology_Resource_Grammar_Tagalog_CFG.cfg')
-lexicon_data = load_lexicon('Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+grammar_rules_cfg = load_grammar('Appendix_D_Resource_Grammar_Tagalog_CFG.cfg')
+lexicon_data = load_lexicon(args.lexicon)
 translation_dictionary = load_dictionary('Appendix_C_Resource_Dictionary_Tagalog_English.json')
+loaded_lexicon, loaded_dictionary = lexicon_data, translation_dictionary
+
+if args.morphology:
+    # Each distinct corpus word is analyzed once; the results become lexicon and dictionary entries.
+    analyzer = MorphAnalyzer(lexicon_data, translation_dictionary)
+    vocabulary_words = corpus.vocabulary_words()
+    derived_entries = analyzer.extend_lexicon(vocabulary_words)
+    lexicon_data = lexicon_data + derived_entries
+    extended_dictionary = analyzer.extend_dictionary(vocabulary_words)
+    print(f"Morphology: {len(set(word for pos, word in derived_entries))} corpus words missing from the lexicon "
+          f"and {len(extended_dictionary) - len(translation_dictionary)} missing from the dictionary "
+          f"were matched to known words by their root.")
+    translation_dictionary = extended_dictionary
+
+if args.fuzzy is not None:
+    # Only words --morphology left unresolved are matched by spelling, and only against the
+    # loaded lexicon and dictionary, so a word's match does not depend on the other corpus words.
+    resolver = FuzzyResolver(loaded_lexicon, loaded_dictionary, args.fuzzy)
+    vocabulary_words = corpus.vocabulary_words()
+    lexicon_words = set(word for pos, word in lexicon_data)
+    fuzzy_entries = resolver.extend_lexicon([word for word in vocabulary_words if word not in lexicon_words])
+    lexicon_data = lexicon_data + fuzzy_entries
+    untranslated = [word for word in vocabulary_words if word not in translation_dictionary]
+    fuzzy_translations = resolver.extend_dictionary(untranslated)
+    extended_dictionary = dict(translation_dictionary)
+    extended_dictionary.update((word, fuzzy_translations[word]) for word in untranslated if word in fuzzy_translations)
+    print(f"Fuzzy lookup: {len(set(word for pos, word in fuzzy_entries))} corpus words missing from the lexicon "
+          f"and {len(extended_dictionary) - len(translation_dictionary)} missing from the dictionary "
+          f"were matched to known words within {args.fuzzy} edits.")
+    translation_dictionary = extended_dictionary
 
 print("Preparing grammar productions from loaded resources...")
-structural_productions = grammar_rules_cfg.productions()
 start_symbol = grammar_rules_cfg.start()
 
-lexical_productions = []
-words_in_lexicon = set()
-processed_productions = set(structural_productions)
-
-for pos_str, word in lexicon_data:
-    lhs = Nonterminal(pos_str)
-    rhs = [word]
-    production = Production(lhs, rhs)
-    if production not in processed_productions:
-        lexical_productions.append(production)
-        processed_productions.add(production)
-        words_in_lexicon.add(word)
-
-all_productions = structural_productions + lexical_productions
-
 try:
     if 'tokens' in df.columns:
-        all_toks = sorted(list(set(t for toks in df['tokens'] for t in toks if t)))
-        added_as_default_N = 0
-        for tok in all_toks:
-            if tok not in words_in_lexicon:
-                lhs = Nonterminal('N'); rhs = [tok]
-                production = Production(lhs, rhs)
-                if production not in processed_productions:
-                    all_productions.append(production)
-                    processed_productions.add(production)
-                    added_as_default_N += 1
+        all_toks = corpus.vocabulary_words()
+        all_productions, added_as_default_N = build_productions(grammar_rules_cfg, lexicon_data, all_toks)
         print(f"Added {added_as_default_N} unique words automatically as Nouns.")
+        lexicon_coverage = corpus.coverage(set(word for pos, word in lexicon_data))
+        print(f"Lexicon coverage: {lexicon_coverage['token_coverage']:.1%} of {lexicon_coverage['tokens']} tokens; "
+              f"{lexicon_coverage['fully_covered_sentences']}/{lexicon_coverage['sentences']} sentences fully covered.")
     else:
+        all_productions, _ = build_productions(grammar_rules_cfg, lexicon_data)
         print("Warning: 'tokens' column not found in DataFrame. Cannot check for unknown tokens.")
 except NameError:
+    all_productions, _ = build_productions(grammar_rules_cfg, lexicon_data)
     print("Warning: 'df' (DataFrame) not available to check for unknown tokens.")
     print("Skipping automatic addition of unknown words as Nouns.")
 
@@ -162,19 +293,17 @@ print("Building CFG directly from productions...")
 start_time = time.time()
 try:
     grammar = CFG(start_symbol, all_productions)
-    parser = ChartParser(grammar)
 except Exception as e:
-    print(f"Error creating CFG or Parser: {e}")
+    print(f"Error creating CFG: {e}")
     sys.exit(1)
 end_time = time.time()
-print(f"CFG and Parser built in {end_time - start_time:.4f} seconds.")
+print(f"CFG built in {end_time - start_time:.4f} seconds.")
 
 print("Verifying grammar coverage...")
 try:
     all_terminals_in_grammar = set(prod.rhs()[0] for prod in grammar.productions() if prod.is_lexical())
     if 'tokens' in df.columns:
-        all_toks_from_df = sorted(list(set(t for toks in df['tokens'] for t in toks if t)))
-        missing_terminals = [tok for tok in all_toks_from_df if tok not in all_terminals_in_grammar]
+        missing_terminals = corpus.missing_words(all_terminals_in_grammar)
         if missing_terminals:
             print(f"\nWarning: Grammar coverage issue. Missing terminals from corpus: {missing_terminals}\n")
         else:
@@ -185,43 +314,284 @@ except Exception as e:
     print(f"Error during grammar coverage verification: {e}")
 
 print("Starting parsing for all sentences...")
-parse_results = []
-parse_times = []
 
 if 'all_terminals_in_grammar' not in locals():
     all_terminals_in_grammar = set(prod.rhs()[0] for prod in grammar.productions() if prod.is_lexical())
 
-for i, toks in enumerate(df['tokens']):
-    if not toks:
-        parse_results.append(None)
-        continue
+# Only sentences with unknown tokens need the per-token terminal check.
+has_unknown_tokens = bool(corpus.unknown_counts(all_terminals_in_grammar).any())
+
+if args.token_ids:
+    print("Using integer token IDs for parsing, rewriting and translation.")
+    vocabulary = corpus.vocabulary
+    id_productions = to_id_productions(grammar.productions(), vocabulary)
+    parse_grammar = CFG(start_symbol, id_productions)
+    parse_terminals = set(prod.rhs()[0] for prod in id_productions if prod.is_lexical())
+    parse_inputs = [ids.tolist() for ids in corpus.id_sequences()]
+    parse_vocabulary = None
+    id_translator = IdTranslator(translation_dictionary, vocabulary)
+
+    def words_of(leaves):
+        return decode_words(leaves, vocabulary)
+
+    leaf_text = vocabulary.word
+
+    def tree_out(tree):
+        return decode_tree(tree, vocabulary)
+
+    def chunks_out(chunks):
+        return decode_chunks(chunks, vocabulary)
+
+    def translate_leaves(leaves):
+        return id_translator.translate(leaves)
+
+    def tree_in(tree):
+        return encode_tree(tree, vocabulary)
+else:
+    parse_grammar = grammar
+    parse_terminals = all_terminals_in_grammar
+    parse_inputs = corpus.id_sequences()
+    parse_vocabulary = corpus.vocabulary
+
+    def words_of(leaves):
+        return leaves
+
+    leaf_text = str
+
+    def tree_out(tree):
+        return tree
 
-    current_tokens_str = [str(t) for t in toks if t is not None]
-    if not current_tokens_str:
-        parse_results.append(None)
-        continue
+    def chunks_out(chunks):
+        return chunks
 
-    unknown_toks = [t for t in current_tokens_str if t not in all_terminals_in_grammar]
-    if unknown_toks:
-        parse_results.append(None)
-        continue
+    def translate_leaves(leaves):
+        return simple_lexical_translate(leaves, translation_dictionary)
 
-    sent_start_time = time.time()
+    def tree_in(tree):
+        return tree
+
+rule_log_probs = None
+if args.pcfg:
+    pcfg_model = load_model(args.pcfg)
+    print(f"Using Viterbi best-parse mode with rule counts from '{args.pcfg}' "
+          f"({pcfg_model['parsed']} training parses).")
+    rule_log_probs = rule_log_probabilities(grammar.productions(), pcfg_model['counts'])
+    if args.token_ids:
+        rule_log_probs = {id_prod: rule_log_probs[prod]
+                          for prod, id_prod in zip(grammar.productions(), id_productions) if prod in rule_log_probs}
+
+# Sentences with the same POS-tag sequence share one parse (see skeleton_cache.py).
+# The rule profile needs the chart of every sentence, so it parses them all.
+skeleton_cache = None
+pruned_skeletons = None
+if (args.skeleton_cache or args.pretag) and not args.profile_rules:
+    try:
+        skeleton_cache = SkeletonCache(parse_grammar, rule_log_probs,
+                                       max_tags=args.pretag_tags if args.pretag else 0)
+    except ValueError as e:
+        print(f"Note: {e}; parsing every sentence on its own.")
+if args.pretag and skeleton_cache is None:
+    print("Note: --pretag prunes POS skeletons, which are not used in this run; parsing with all tags.")
+    args.pretag = None
+if skeleton_cache is not None:
+    parser_grammar, parser_log_probs = skeleton_cache.grammar, skeleton_cache.log_probs
+    skeletons = skeleton_cache.skeletons(corpus, id_terminals=args.token_ids)
+    skeleton_leaves = parse_inputs if args.token_ids else token_lists
+    if args.pretag:
+        print(f"Pre-tagging with '{args.pretag}', keeping {args.pretag_tags} tag(s) per token.")
+        pruned_skeletons = prune_skeletons(BigramTagger.load(args.pretag), skeleton_cache, skeletons,
+                                           token_lists, args.pretag_tags)
+else:
+    parser_grammar, parser_log_probs = parse_grammar, rule_log_probs
+
+make_parser = None
+if args.pcfg:
+    if args.chart_arena:
+        make_parser = arena_parser_factory(parser_log_probs, beam_width=args.beam_width,
+                                           max_length=int(corpus.lengths().max(initial=0)))
+    else:
+        make_parser = viterbi_parser_factory(parser_log_probs, beam_width=args.beam_width)
+
+rule_profile = RuleProfile() if args.profile_rules else None
+parse_fallback = args.chunk_fallback and need_chunks
+
+parser_engine = 'chart'
+if not args.pcfg and args.parser != 'chart':
+    parser_engine = args.parser
+    if parser_engine == 'auto':
+        # Benchmark the grammar and inputs this run parses.
+        if skeleton_cache is not None:
+            benchmark_inputs = [list(skeleton) for skeleton in dict.fromkeys(skeletons)]
+            benchmark_terminals = skeleton_cache.known_terminals
+        else:
+            benchmark_inputs = parse_inputs if args.token_ids else token_lists
+            benchmark_terminals = parse_terminals
+        parser_engine = select_engine(parser_grammar, benchmark_inputs, benchmark_terminals, DEFAULT_SELECTION_FILE,
+                                      time_budget=args.time_budget, edge_budget=args.edge_budget,
+                                      skeletons=skeleton_cache is not None)
+    if parser_engine == 'earley':
+        try:
+            earley_grammar = EarleyGrammar(parser_grammar)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print("Using the Earley parser backend.")
+        # The item loop specialized to this grammar is generated once per grammar fingerprint.
+        generated_parser = load_generated(earley_grammar) if args.codegen else None
+        # Without chunk fallback only full parses matter, so prediction can start from S.
+        make_parser = earley_parser_factory(top_down=not parse_fallback, compiled=earley_grammar,
+                                            generated=generated_parser)
+
+# Settings that change results for an unchanged grammar.
+run_config = fingerprint(
+    ('pcfg', file_fingerprint(args.pcfg), args.beam_width) if args.pcfg else parser_engine,
+    args.time_budget, args.edge_budget, parse_fallback)
+if args.pretag:
+    run_config = fingerprint(run_config, 'pretag', file_fingerprint(args.pretag), args.pretag_tags)
+if args.cyk_prefilter and (parse_fallback or rule_profile is not None):
+    print("Note: --cyk-prefilter is only used without chunk fallback or rule profiling; parsing every sentence.")
+    args.cyk_prefilter = False
+if args.cyk_prefilter:
+    # Rejected sentences are No Parse instead of running out of budget, so results differ.
+    run_config = fingerprint(run_config, 'cyk-prefilter')
+
+def outcome_out(outcome):
+    """String-leaved (status, tree, chunks) as kept by the result store and checkpoints."""
+    status, tree, elapsed, chunks = outcome
+    return status, tree_out(tree) if tree is not None else None, chunks_out(chunks) if chunks else chunks
+
+def outcome_in(stored, elapsed=0.0):
+    status, tree, chunks = stored
+    return (status, tree_in(tree) if tree is not None else None, elapsed,
+            [tree_in(chunk) for chunk in chunks] if chunks else chunks)
+
+parse_outcomes = [None] * len(parse_inputs)
+
+result_store = None
+sentences_to_parse = range(len(parse_inputs))
+if args.result_store:
+    # The lexicon and structural rules are compared production by production.
+    result_store = ResultStore.load(args.result_store)
+    sentences_to_parse, reused_outcomes = result_store.plan(
+        token_lists, grammar.productions(), start_symbol, run_config, rescore_lhs=bool(args.pcfg))
+    if rule_profile is not None and reused_outcomes:
+        print("Rule profiling needs every chart; ignoring stored results for this run.")
+        sentences_to_parse, reused_outcomes = range(len(parse_inputs)), {}
+    print(f"Result store '{args.result_store}': reusing {len(reused_outcomes)} stored results, "
+          f"parsing {len(sentences_to_parse)} of {len(parse_inputs)} sentences.")
+    for index, stored in reused_outcomes.items():
+        parse_outcomes[index] = outcome_in(stored)
+
+checkpoint = None
+if args.checkpoint:
+    # A row range is identified by its own bytes, so other rows are never read.
+    data_key = file_fingerprint(DATA_FILE) if args.rows is None else line_index.fingerprint(row_start, row_stop)
+    run_key = fingerprint(data_key, str(start_symbol),
+                          sorted(production_key(prod) for prod in grammar.productions()), run_config)
+    checkpoint = Checkpoint(args.checkpoint, run_key)
+    resumed = checkpoint.start(resume=args.resume)
+    if resumed:
+        if rule_profile is not None:
+            print("Note: the rule profile only covers sentences parsed in this session.")
+        for index, (status, tree, chunks, elapsed) in resumed.items():
+            if parse_outcomes[index] is None:
+                parse_outcomes[index] = outcome_in((status, tree, chunks), elapsed)
+        print(f"Resuming from '{args.checkpoint}': {len(resumed)} sentences already done.")
+
+def parse_batch(inputs, batch_grammar, known_terminals, vocabulary=None, fallback=parse_fallback):
+    return parse_corpus(
+        inputs,
+        batch_grammar,
+        vocabulary=vocabulary,
+        known_terminals=known_terminals if has_unknown_tokens else None,
+        workers=args.workers,
+        time_budget=args.time_budget,
+        edge_budget=args.edge_budget,
+        fallback=fallback,
+        make_parser=make_parser,
+        profile=rule_profile,
+    )
+
+def parse_skeletons(inputs):
+    return parse_batch(inputs, skeleton_cache.grammar, skeleton_cache.known_terminals)
+
+def parse_pruned_skeletons(inputs):
+    # Only full parses are kept from pruned skeletons; the retry with all tags does the chunking.
+    return parse_batch(inputs, skeleton_cache.grammar, skeleton_cache.known_terminals, fallback=False)
+
+if args.cyk_prefilter:
+    # Sentences the recognizer rejects cannot parse, so they skip the parser. Sentences
+    # with unknown tokens are left to it for their status.
+    start_time = time.time()
+    try:
+        binarized = BinarizedGrammar(parse_grammar)
+    except ValueError as e:
+        print(f"Note: {e}; parsing every sentence without the CYK prefilter.")
+    else:
+        accepted = recognize_corpus(binarized, corpus,
+                                    binarized.lexical_table(corpus.vocabulary, id_terminals=args.token_ids))
+        rejected = ~accepted & (corpus.unknown_counts(all_terminals_in_grammar) == 0) & (corpus.lengths() > 0)
+        skipped = 0
+        for index in sentences_to_parse:
+            if rejected[index] and parse_outcomes[index] is None:
+                parse_outcomes[index] = (STATUS_NO_PARSE, None, 0.0, None)
+                skipped += 1
+        print(f"CYK prefilter: {int(accepted.sum())}/{len(accepted)} sentences have a parse; "
+              f"{skipped} skip the parser ({time.time() - start_time:.2f}s).")
+
+pending = [index for index in sentences_to_parse if parse_outcomes[index] is None]
+try:
+    for batch in ranges(pending, args.checkpoint_every if checkpoint is not None else 0):
+        if pruned_skeletons is not None:
+            batch_outcomes = skeleton_cache.parse(
+                [pruned_skeletons[i] for i in batch], [skeleton_leaves[i] for i in batch], parse_skeletons,
+                [skeletons[i] for i in batch], parse_pruned_skeletons)
+        elif skeleton_cache is not None:
+            batch_outcomes = skeleton_cache.parse(
+                [skeletons[i] for i in batch], [skeleton_leaves[i] for i in batch], parse_skeletons)
+        else:
+            batch_outcomes = parse_batch([parse_inputs[i] for i in batch], parse_grammar, parse_terminals,
+                                         parse_vocabulary)
+        for index, outcome in zip(batch, batch_outcomes):
+            parse_outcomes[index] = outcome
+        if checkpoint is not None:
+            checkpoint.write_segment(batch, [outcome_out(outcome) + (outcome[2],) for outcome in batch_outcomes])
+            done = sum(outcome is not None for outcome in parse_outcomes)
+            print(f"Checkpoint: {done}/{len(parse_outcomes)} sentences done.")
+except KeyboardInterrupt:
+    if checkpoint is None:
+        raise
+    print(f"\nInterrupted. Finished ranges are saved in '{args.checkpoint}'; rerun with --resume to continue.")
+    sys.exit(130)
+
+if skeleton_cache is not None and skeleton_cache.sentences:
+    print(f"Skeleton cache: {skeleton_cache.sentences} sentences parsed as {len(skeleton_cache)} distinct "
+          f"POS sequences ({len(skeleton_cache) / skeleton_cache.sentences:.1%}).")
+    if skeleton_cache.pruned:
+        print(f"Pre-tagging: {skeleton_cache.pruned - skeleton_cache.retried} of {skeleton_cache.pruned} pruned "
+              f"sentences parsed with the kept tags; {skeleton_cache.retried} retried with all tags.")
+
+if result_store is not None:
+    result_store.update(token_lists, [outcome_out(outcome) for outcome in parse_outcomes],
+                        grammar.productions(), start_symbol, run_config)
     try:
-        parses = list(parser.parse(current_tokens_str))
-        parse_results.append(parses[0] if parses else None)
-    except ValueError as ve:
-        parse_results.append(None)
-    except Exception as e:
-        parse_results.append(None)
-    sent_end_time = time.time()
-    parse_times.append(sent_end_time - sent_start_time)
+        result_store.save(args.result_store)
+    except OSError as e:
+        print(f"Warning: could not save result store '{args.result_store}': {e}")
+
+parse_results = [tree for status, tree, elapsed, chunks in parse_outcomes]
+parse_statuses = [status for status, tree, elapsed, chunks in parse_outcomes]
+parse_times = [elapsed for status, tree, elapsed, chunks in parse_outcomes if elapsed > 0]
+fallback_chunks = [chunks for status, tree, elapsed, chunks in parse_outcomes]
 
 df['parse_tree'] = parse_results
 df['parsed'] = df['parse_tree'].notna()
+df['parse_status'] = parse_statuses
+df['fallback_chunks'] = fallback_chunks
 
 print("\n=== Parse coverage summary ===")
 print(df['parsed'].value_counts(dropna=False))
+print(df['parse_status'].value_counts(dropna=False))
 
 unparsed_sentences_df = df[df['parsed'] == False]
 if not unparsed_sentences_df.empty:
@@ -236,41 +606,30 @@ if parse_times:
 else:
     print("No sentences were attempted for parsing (likely all had unknown tokens).")
 
-def rewrite(tree):
-    if not isinstance(tree, Tree):
-        return tree
-    if tree.label() == "S" and len(tree) == 2:
-        child1, child2 = tree
-        if isinstance(child1, Tree) and child1.label() == "VP" and \
-           isinstance(child2, Tree) and child2.label() == "NP":
-            return Tree("S", [rewrite(child2), rewrite(child1)])
-
-    if tree.label() == "S" and len(tree) == 3:
-        child1, child2, child3 = tree
-        is_ay_terminal = (not isinstance(child2, Tree) and str(child2).lower() == 'ay')
-        is_ay_phrase = (isinstance(child2, Tree) and child2.label() == 'AY')
+if rule_profile is not None:
+    print(f"\n=== Rule usage profile ({rule_profile.parsed}/{rule_profile.sentences} sentences parsed) ===")
+    print("Most expensive rules per covered sentence:")
+    profile_rows = rule_profile.write_report(args.profile_rules, grammar.productions())
+    print_report(profile_rows)
+    print(f"Full report written to {args.profile_rules}")
 
-        if isinstance(child1, Tree) and child1.label() == "NP" and \
-           is_ay_phrase and \
-           isinstance(child3, Tree) and child3.label() == "VP":
-            return Tree("S", [rewrite(child1), rewrite(child3)])
-
-    return Tree(tree.label(), [rewrite(child) for child in tree])
-
-df['rewritten_tree'] = df['parse_tree'].apply(lambda t: rewrite(t) if t and isinstance(t, Tree) else None)
+if need_rewritten_trees:
+    rewritten_trees = [rewrite(t) if t and isinstance(t, Tree) else None for t in parse_results]
+else:
+    rewritten_trees = [None] * len(parse_results)
 
 print("\n=== Examples of Parsed Sentences (with Rewrites and Translations) ===")
-parsed_examples_display = df[df['parsed']].head(10)
+parsed_examples_display = np.flatnonzero(df['parsed'].to_numpy())[:max(args.examples, 0)]
 
-if parsed_examples_display.empty:
+if not df['parsed'].any():
     print("\nNo sentences were successfully parsed based on the current grammar.")
 else:
-    for index, row in parsed_examples_display.iterrows():
-        original_sentence = row['Tagalog Phrase/Sentence']
-        reference_english = row['English Translation']
-        tokens = row['tokens']
-        parsed_tree = row['parse_tree']
-        rewritten_tree = row['rewritten_tree']
+    for index in parsed_examples_display:
+        original_sentence = df['Tagalog Phrase/Sentence'].iat[index]
+        reference_english = df['English Translation'].iat[index]
+        tokens = token_lists[index]
+        parsed_tree = tree_out(parse_results[index])
+        rewritten_tree = tree_out(rewrite(parse_results[index]))
 
         print("-" * 40)
         print(f"Original Tagalog:   {original_sentence}")
@@ -291,7 +650,7 @@ else:
             rewritten_leaves = rewritten_tree.leaves()
             rewritten_tree.pretty_print(maxwidth=100)
             print(f"\nRewritten Tagalog Text: {' '.join(rewritten_leaves)}")
-            simple_translation = simple_lexical_translate(rewritten_leaves, translation_dictionary)
+            simple_translation = translate_leaves(rewrite_leaves(parse_results[index]))
             print(f"Simple Lexical Tx:    {simple_translation}")
         else:
             print("  (Rewrite Error or No Rewrite Applicable)")
@@ -299,73 +658,89 @@ else:
 print("-" * 40)
 
 print("\nPreparing data for CSV output...")
-csv_output_data = []
-
-for index, row in df.iterrows():
-    original_tagalog = row['Tagalog Phrase/Sentence']
-    tokens_list = row['tokens'] if isinstance(row['tokens'], list) else []
-    tokens_str = ' '.join(tokens_list)
-    reference_english = row['English Translation']
-    is_parsed = row['parsed']
-    parse_tree_obj = row['parse_tree']
-    rewritten_tree_obj = row['rewritten_tree']
-
-    entry = {
-        'Original Tagalog': original_tagalog,
-        'Tokens': tokens_str,
-        'Reference English': reference_english,
-        'Parsed': is_parsed,
-        'Parsed Tree (Compact)': "",
-        'Parsed Tree (Pretty Single Line)': "",
-        'Rewritten Tree (Compact)': "",
-        'Rewritten Tree (Pretty Single Line)': "",
-        'Rewritten Tagalog Text': "",
-        'Simple Lexical Translation': ""
-    }
+output_csv_filename = args.output
+fieldnames = args.columns
+column_indexes = [FIELDNAMES.index(column) for column in fieldnames]
+csv_output_rows = []
+
+def tree_columns(tree, compact_column, pretty_column):
+    want_compact = compact_column in output_columns
+    want_pretty = pretty_column in output_columns
+    if not (want_compact or want_pretty):
+        return "", ""
+    if args.tree_format == 'flat':
+        # Both columns hold the same single-line form; it is built once.
+        text = serialize_tree(tree, leaf_text)
+        return (text if want_compact else ""), (text if want_pretty else "")
+    tree = tree_out(tree)
+    compact = str(tree) if want_compact else ""
+    pretty = tree.pformat(nodesep='', parens='()', quotes=False).replace('\n', ' ').replace('  ', ' ') if want_pretty else ""
+    return compact, pretty
+
+want_tokens = 'Tokens' in output_columns
+want_rewritten_text = 'Rewritten Tagalog Text' in output_columns
+want_translation = 'Simple Lexical Translation' in output_columns
+want_chunk_text = 'Fallback Chunks' in output_columns
+
+for (original_tagalog, tokens_list, reference_english, is_parsed, parse_status, chunks,
+     parse_tree_obj, rewritten_tree_obj) in zip(
+        df['Tagalog Phrase/Sentence'].tolist(), token_lists, df['English Translation'].tolist(),
+        df['parsed'].tolist(), parse_statuses, fallback_chunks, parse_results, rewritten_trees):
+    tokens_str = ' '.join(tokens_list) if want_tokens else ""
+    rewritten_compact = rewritten_pretty = rewritten_text = chunk_text = translation = ""
 
     if is_parsed and parse_tree_obj:
-        entry['Parsed Tree (Compact)'] = str(parse_tree_obj)
-        entry['Parsed Tree (Pretty Single Line)'] = parse_tree_obj.pformat(nodesep='', parens='()', quotes=False).replace('\n', ' ').replace('  ', ' ')
-
+        parsed_compact, parsed_pretty = tree_columns(
+            parse_tree_obj, 'Parsed Tree (Compact)', 'Parsed Tree (Pretty Single Line)')
         if rewritten_tree_obj:
-            rewritten_leaves = rewritten_tree_obj.leaves()
-            entry['Rewritten Tree (Compact)'] = str(rewritten_tree_obj)
-            entry['Rewritten Tree (Pretty Single Line)'] = rewritten_tree_obj.pformat(nodesep='', parens='()', quotes=False).replace('\n', ' ').replace('  ', ' ')
-            entry['Rewritten Tagalog Text'] = ' '.join(rewritten_leaves)
-            entry['Simple Lexical Translation'] = simple_lexical_translate(rewritten_leaves, translation_dictionary)
-        else:
-            entry['Rewritten Tree (Compact)'] = "N/A (No rewrite)"
-            entry['Rewritten Tree (Pretty Single Line)'] = "N/A (No rewrite)"
-            entry['Rewritten Tagalog Text'] = "N/A (No rewrite)"
-            entry['Simple Lexical Translation'] = simple_lexical_translate(parse_tree_obj.leaves(), translation_dictionary)
+            rewritten_compact, rewritten_pretty = tree_columns(
+                rewritten_tree_obj, 'Rewritten Tree (Compact)', 'Rewritten Tree (Pretty Single Line)')
+        if need_rewritten_leaves:
+            rewritten_leaves = rewrite_leaves(parse_tree_obj)
+            if want_rewritten_text:
+                rewritten_text = ' '.join(words_of(rewritten_leaves))
+            if want_translation:
+                translation = translate_leaves(rewritten_leaves)
     else:
-        entry['Parsed Tree (Compact)'] = "Not Parsed"
-        entry['Parsed Tree (Pretty Single Line)'] = "Not Parsed"
-        entry['Rewritten Tree (Compact)'] = "Not Parsed"
-        entry['Rewritten Tree (Pretty Single Line)'] = "Not Parsed"
-        entry['Rewritten Tagalog Text'] = "Not Parsed"
-        if tokens_list:
-             entry['Simple Lexical Translation'] = simple_lexical_translate(tokens_list, translation_dictionary)
+        parsed_compact = "Not Parsed"
+        parsed_pretty = "Not Parsed"
+        rewritten_compact = "Not Parsed"
+        rewritten_pretty = "Not Parsed"
+        rewritten_text = "Not Parsed"
+        if chunks:
+            chunk_words = chunk_leaves(chunks)
+            if want_chunk_text:
+                chunk_text = format_chunks(chunks_out(chunks))
+            if want_rewritten_text:
+                rewritten_text = ' '.join(words_of(chunk_words))
+            if want_translation:
+                translation = translate_leaves(chunk_words)
+        elif not want_translation:
+            pass
+        elif tokens_list:
+            translation = simple_lexical_translate(tokens_list, translation_dictionary)
         else:
-            entry['Simple Lexical Translation'] = "[No tokens]"
+            translation = "[No tokens]"
 
-    csv_output_data.append(entry)
-
-output_csv_filename = 'translation_analysis_output.csv'
-fieldnames = [
-    'Original Tagalog', 'Tokens', 'Reference English', 'Parsed',
-    'Parsed Tree (Compact)', 'Parsed Tree (Pretty Single Line)',
-    'Rewritten Tree (Compact)', 'Rewritten Tree (Pretty Single Line)',
-    'Rewritten Tagalog Text', 'Simple Lexical Translation'
-]
+    full_row = (
+        original_tagalog, tokens_str, reference_english, is_parsed, parse_status,
+        parsed_compact, parsed_pretty, rewritten_compact, rewritten_pretty,
+        rewritten_text, chunk_text, translation,
+    )
+    csv_output_rows.append([full_row[i] for i in column_indexes])
 
 print(f"\nWriting detailed output to {output_csv_filename}...")
 try:
-    with open(output_csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(csv_output_data)
+    with AtomicWriter(output_csv_filename) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(fieldnames)
+        writer.writerows(csv_output_rows)
     print(f"Successfully wrote output to {output_csv_filename}")
+    if args.stats:
+        with AtomicWriter(args.stats) as stats_file:
+            json.dump(run_statistics(parse_statuses, parse_times, time.time() - run_start_time), stats_file, indent=2)
+    if checkpoint is not None:
+        checkpoint.clear()
 except IOError as e:
     print(f"Error writing CSV file '{output_csv_filename}': {e}")
 except Exception as e:
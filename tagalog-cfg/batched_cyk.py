@@ -0,0 +1,238 @@
+import sys
+import time
+
+import numpy as np
+
+# Batched CYK recognizer.
+# Coverage only needs to know whether a sentence has a parse, not its
+# trees. The grammar is binarized (A -> X1 X2 X3 becomes A -> @X1X2 X3,
+# with the prefix symbols shared between rules) and unary rules are folded
+# into a closure table. Sentences are then recognized many at a time, one
+# bit per sentence: chart level L is a (start, label, word) array of uint64
+# words holding the spans of length L of 64 sentences each. Each level is
+# one pass over the split points with whole-array AND/OR operations, so the
+# interpreter cost is paid per level and split, not per sentence and cell.
+# Shorter sentences of a batch are padded with tokens that have no labels,
+# which no span can cover, and read their verdict at their own level.
+
+DEFAULT_BATCH_BYTES = 1 << 24
+_WORD_BITS = 64
+
+
+class BinarizedGrammar:
+    """
+    Boolean tables of a CFG for batched CYK. Labels (nonterminals and the
+    prefix symbols added by binarization) are numbered columns. Grammars
+    with empty productions, or with words inside structural rules, are
+    rejected with ValueError.
+    """
+
+    def __init__(self, grammar):
+        columns = {}
+
+        def column(symbol):
+            if symbol not in columns:
+                columns[symbol] = len(columns)
+            return columns[symbol]
+
+        self.start = column(grammar.start())
+        binary = set()
+        unary = []
+        self._lexical = {}
+        for prod in grammar.productions():
+            rhs = prod.rhs()
+            if not rhs:
+                raise ValueError(f"the grammar has an empty production '{prod}'")
+            if prod.is_lexical():
+                if len(rhs) != 1:
+                    raise ValueError(f"rule '{prod}' mixes words and labels")
+                self._lexical.setdefault(rhs[0], set()).add(column(prod.lhs()))
+            elif len(rhs) == 1:
+                unary.append((column(prod.lhs()), column(rhs[0])))
+            else:
+                left = column(rhs[0])
+                for i in range(1, len(rhs) - 1):
+                    prefix = column(('@',) + tuple(rhs[:i + 1]))
+                    binary.add((prefix, left, column(rhs[i])))
+                    left = prefix
+                binary.add((column(prod.lhs()), left, column(rhs[-1])))
+        self.num_labels = len(columns)
+
+        # closure[child, parent]: parent =>* child through unary rules.
+        closure = np.eye(self.num_labels, dtype=bool)
+        for parent, child in unary:
+            closure[child, parent] = True
+        for k in range(self.num_labels):
+            closure |= closure[:, k:k + 1] & closure[k:k + 1, :]
+        self.closure = closure
+
+        rules = sorted(binary)
+        self.num_rules = len(rules)
+        self.rule_left = np.array([left for _, left, _ in rules], dtype=np.intp)
+        self.rule_right = np.array([right for _, _, right in rules], dtype=np.intp)
+        lhs = np.array([parent for parent, _, _ in rules], dtype=np.intp)
+        self.group_starts = np.flatnonzero(np.r_[True, lhs[1:] != lhs[:-1]]) if len(rules) else lhs
+        # A span found for a rule's lhs is also found for every unary
+        # ancestor: label `targets[t]` is the OR of the rule groups
+        # sources[starts[t]:starts[t + 1]].
+        reaches = closure[lhs[self.group_starts]]
+        self.targets = np.flatnonzero(reaches.any(axis=0))
+        sources = [np.flatnonzero(reaches[:, label]) for label in self.targets]
+        self.sources = np.concatenate(sources) if sources else np.zeros(0, dtype=np.intp)
+        self.source_starts = np.cumsum([0] + [len(group) for group in sources[:-1]]).astype(np.intp)
+
+    def lexical_table(self, vocabulary, id_terminals=False):
+        """
+        (len(vocabulary), labels) boolean array: the labels each vocabulary
+        ID can start, after unary rules. The grammar's terminals are words,
+        or vocabulary IDs with `id_terminals`. Unknown tokens get no labels.
+        """
+        table = np.zeros((len(vocabulary), self.num_labels), dtype=bool)
+        for word_id in range(len(vocabulary)):
+            tags = self._lexical.get(word_id if id_terminals else vocabulary.word(word_id))
+            if tags:
+                table[word_id] = self.closure[sorted(tags)].any(axis=0)
+        return table
+
+    def recognize(self, cells, lengths=None):
+        """
+        `cells` is a (batch, n, labels) boolean array of the labels of every
+        token; returns a (batch,) boolean array, True where the sentence
+        has a parse from the start symbol. `lengths` gives the length of
+        each sentence when some are shorter than n (their remaining tokens
+        must have no labels).
+        """
+        batch, n, num_labels = cells.shape
+        if lengths is None:
+            lengths = np.full(batch, n)
+        accepted = np.zeros(batch, dtype=bool)
+        padding = -batch % _WORD_BITS
+        if padding:
+            cells = np.concatenate([cells, np.zeros((padding, n, num_labels), dtype=bool)])
+        packed = np.packbits(cells, axis=0, bitorder='little')
+        level = np.ascontiguousarray(packed.transpose(1, 2, 0)).view(np.uint64)
+        words = level.shape[2]
+
+        def read_verdicts(length, level):
+            ending = np.flatnonzero(lengths == length)
+            if len(ending):
+                bits = np.unpackbits(level[0, self.start].view(np.uint8), bitorder='little')
+                accepted[ending] = bits[ending].astype(bool)
+
+        read_verdicts(1, level)
+        # Each level is only read through the rules' children, so the
+        # children's rows are gathered once per level, not once per split.
+        lefts = [None, level[:, self.rule_left]]
+        rights = [None, level[:, self.rule_right]]
+        for length in range(2, n + 1):
+            width = n - length + 1
+            level = np.zeros((width, num_labels, words), dtype=np.uint64)
+            if self.num_rules:
+                found = lefts[1][:width] & rights[length - 1][1:1 + width]
+                for split in range(2, length):
+                    found |= lefts[split][:width] & rights[length - split][split:split + width]
+                groups = np.bitwise_or.reduceat(found, self.group_starts, axis=1)
+                if len(self.targets):
+                    level[:, self.targets] = np.bitwise_or.reduceat(groups[:, self.sources], self.source_starts,
+                                                                    axis=1)
+            read_verdicts(length, level)
+            lefts.append(level[:, self.rule_left])
+            rights.append(level[:, self.rule_right])
+        return accepted
+
+
+def recognize_corpus(binarized, corpus, table, batch_bytes=DEFAULT_BATCH_BYTES):
+    """
+    Recognizes every sentence of a TokenizedCorpus, in batches of similar
+    length whose charts take at most about `batch_bytes`. `table` is
+    binarized.lexical_table(corpus.vocabulary). Returns a boolean array per
+    sentence; empty sentences are never accepted.
+    """
+    lengths = corpus.lengths()
+    accepted = np.zeros(len(corpus), dtype=bool)
+    # Padding positions point at an extra all-False row of the table.
+    padded_table = np.vstack([table, np.zeros((1, table.shape[1]), dtype=bool)])
+    token_ids = np.append(corpus.token_ids, len(table))
+    order = np.argsort(lengths, kind='stable')
+    order = order[lengths[order] > 0]
+    first = 0
+    while first < len(order):
+        # Sentences are taken shortest first while the batch fits the budget
+        # of its longest one. Bytes per word of 64 sentences: every level
+        # keeps its rows for both children.
+        last = first
+        while last < len(order):
+            n = int(lengths[order[last]])
+            per_word = n * (n + 1) // 2 * (2 * binarized.num_rules + binarized.num_labels) * 8
+            if last > first and last - first >= _WORD_BITS * max(1, batch_bytes // per_word):
+                break
+            last += 1
+        chosen = order[first:last]
+        n = int(lengths[chosen[-1]])
+        positions = corpus.offsets[chosen][:, None] + np.arange(n)
+        positions[np.arange(n) >= lengths[chosen][:, None]] = len(token_ids) - 1
+        accepted[chosen] = binarized.recognize(padded_table[token_ids[positions]], lengths[chosen])
+        first = last
+    return accepted
+
+
+def benchmark(corpus_file, grammar_file, lexicon_file, check=0, batch_bytes=DEFAULT_BATCH_BYTES):
+    """
+    Prints the coverage of the corpus and the recognizer's throughput, and
+    with `check`, compares the verdicts on that many sentences with the
+    chart parser's (through the Earley backend, which fills the same chart).
+    """
+    from nltk import CFG
+    from translator_core import load_grammar, load_lexicon, build_productions
+    from corpus_columns import TokenizedCorpus
+    from pcfg_model import read_corpus_tokens
+    from parse_budget import parse_corpus, STATUS_PARSED
+    from earley_parser import earley_parser_factory
+
+    corpus = TokenizedCorpus.from_texts([' '.join(tokens) for tokens in read_corpus_tokens([corpus_file])])
+    grammar_cfg = load_grammar(grammar_file)
+    productions, _ = build_productions(grammar_cfg, load_lexicon(lexicon_file), corpus.vocabulary_words())
+    grammar = CFG(grammar_cfg.start(), productions)
+
+    start_time = time.perf_counter()
+    binarized = BinarizedGrammar(grammar)
+    table = binarized.lexical_table(corpus.vocabulary)
+    accepted = recognize_corpus(binarized, corpus, table, batch_bytes)
+    seconds = time.perf_counter() - start_time
+    print(f"{binarized.num_labels} labels, {binarized.num_rules} binary rules after binarization.")
+    print(f"{int(accepted.sum())}/{len(corpus)} sentences have a parse; recognized in {seconds:.2f}s "
+          f"({len(corpus) / max(seconds, 1e-9):.0f} sentences/s).")
+
+    if check:
+        step = max(1, len(corpus) // check)
+        sample = list(range(0, len(corpus), step))[:check]
+        token_lists = corpus.token_lists()
+        start_time = time.perf_counter()
+        outcomes = parse_corpus([token_lists[i] for i in sample], grammar,
+                                make_parser=earley_parser_factory(top_down=True), time_budget=0, edge_budget=0)
+        parse_seconds = time.perf_counter() - start_time
+        disagree = [i for i, outcome in zip(sample, outcomes) if (outcome[0] == STATUS_PARSED) != accepted[i]]
+        print(f"Checked {len(sample)} sentences against the parser ({parse_seconds:.2f}s): "
+              f"{len(disagree)} disagree.")
+        for i in disagree[:5]:
+            print(f"  {' '.join(token_lists[i])}")
+        return len(disagree)
+    return 0
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Corpus coverage with the batched CYK recognizer.")
+    parser.add_argument('corpus', nargs='?', default='Sentence pairs in Tagalog-English (UNREDUCED).tsv')
+    parser.add_argument('--check', type=int, default=0, metavar='N',
+                        help="Compare the verdicts on N sentences with the parser.")
+    parser.add_argument('--batch-bytes', type=int, default=DEFAULT_BATCH_BYTES,
+                        help="Approximate chart memory per batch of sentences of the same length.")
+    parser.add_argument('--grammar', default='Appendix_D_Resource_Grammar_Tagalog_CFG.cfg')
+    parser.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+    args = parser.parse_args(argv)
+    return 1 if benchmark(args.corpus, args.grammar, args.lexicon, args.check, args.batch_bytes) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,508 @@
+import array
+import gc
+import math
+import sys
+import time
+import tracemalloc
+
+from nltk import Tree
+
+from parse_budget import (ParseBudgetExceeded, STATUS_TIME_EXCEEDED, STATUS_EDGES_EXCEEDED,
+                          DEFAULT_TIME_BUDGET, DEFAULT_EDGE_BUDGET)
+from pcfg_model import (ViterbiBeamParser, ViterbiEdge, DEFAULT_BEAM_WIDTH, DEFAULT_BEAM_THRESHOLD)
+from compiled_grammar import CompiledGrammar
+
+# Reusable chart storage for the Viterbi parser.
+# ViterbiBeamParser builds a dict per span and a tuple per constituent and
+# backpointer, all of which become garbage after every sentence. Here the
+# chart lives in flat typed arrays owned by the parser: one block of label
+# slots per span (score, backpointer kind, two backpointer ints), one block
+# of prefix-item slots per span and a dense scratch area for the span being
+# built. Arrays are sized by the grammar (labels, dotted prefixes) and the
+# longest sentence seen, and grow only when a longer one arrives. Every
+# entry carries the generation it was written in, so starting a new
+# sentence is a counter increment instead of a reset. Trees are only
+# materialized for the parses that are actually asked for.
+
+KIND_LEXICAL = 0
+KIND_UNARY = 1
+KIND_RULE = 2
+
+
+def span_index(start, end):
+    """Triangular numbering of the spans 0 <= start < end."""
+    return end * (end - 1) // 2 + start
+
+
+def _zeros(typecode, size):
+    return array.array(typecode, bytes(array.array(typecode).itemsize * size))
+
+
+class ChartArena:
+    """Preallocated chart arrays, reused by one parser for every sentence."""
+
+    def __init__(self, num_labels, num_prefixes, prefix_slots, max_length=0):
+        self.num_labels = num_labels
+        self.num_prefixes = num_prefixes
+        self.prefix_slots = prefix_slots
+        self.generation = 0
+        self.scratch_generation = 0
+        self.capacity = 0
+        # Prefix items of the span being built, before beam pruning.
+        self.scratch_stamp = _zeros('q', num_prefixes)
+        self.scratch_score = _zeros('d', num_prefixes)
+        self.scratch_mid = _zeros('i', num_prefixes)
+        self.reserve(max_length)
+
+    def reserve(self, length):
+        if length <= self.capacity:
+            return
+        spans = length * (length + 1) // 2
+        cells = spans * self.num_labels
+        slots = spans * self.prefix_slots
+        self.span_stamp = _zeros('q', spans)
+        self.label_stamp = _zeros('q', cells)
+        self.active_stamp = _zeros('q', cells)
+        self.label_score = _zeros('d', cells)
+        self.label_kind = _zeros('b', cells)
+        self.label_a = _zeros('i', cells)
+        self.label_b = _zeros('i', cells)
+        self.cell_labels = _zeros('i', cells)
+        self.cell_size = _zeros('i', spans)
+        self.prefix_id = _zeros('i', slots)
+        self.prefix_score = _zeros('d', slots)
+        self.prefix_mid = _zeros('i', slots)
+        self.prefix_size = _zeros('i', spans)
+        self.capacity = length
+
+    def begin(self, length):
+        """Starts a sentence; earlier charts of this arena become invalid."""
+        self.reserve(length)
+        self.generation += 1
+        return self.generation
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in vars(self).values() if isinstance(a, array.array))
+
+
+class ArenaChart:
+    """
+    Read-only view of one sentence in a ChartArena, with the same interface
+    as pcfg_model.ViterbiChart. It is valid until the parser's next
+    chart_parse call, which is how parse_budget and chunk_fallback use it.
+    """
+
+    def __init__(self, parser, tokens, generation):
+        self._parser = parser
+        self._compiled = parser.compiled
+        self._arena = parser.arena
+        self._tokens = tokens
+        self._generation = generation
+
+    def _check(self):
+        if self._arena.generation != self._generation:
+            raise RuntimeError("chart was overwritten by a later parse")
+
+    def leaves(self):
+        return list(self._tokens)
+
+    def num_leaves(self):
+        return len(self._tokens)
+
+    def _entry(self, start, end, label):
+        self._check()
+        arena = self._arena
+        if not 0 <= start < end <= len(self._tokens):
+            return None
+        span = span_index(start, end)
+        if arena.span_stamp[span] != self._generation:
+            return None
+        index = span * arena.num_labels + label
+        return index if arena.label_stamp[index] == self._generation else None
+
+    def score(self, start, end, lhs):
+        label = self._compiled.label_ids.get(lhs)
+        index = self._entry(start, end, label) if label is not None else None
+        return self._arena.label_score[index] if index is not None else None
+
+    def _prefix_mid(self, start, end, prefix):
+        arena = self._arena
+        span = span_index(start, end)
+        slot = span * arena.prefix_slots
+        for j in range(slot, slot + arena.prefix_size[span]):
+            if arena.prefix_id[j] == prefix:
+                return arena.prefix_mid[j]
+        raise RuntimeError("missing prefix backpointer")
+
+    def _prefix_children(self, start, end, prefix, tree_class):
+        compiled = self._compiled
+        rhs_start = compiled.rhs_start[compiled.prefix_rule[prefix]]
+        dot = compiled.prefix_dot[prefix]
+        if dot == 1:
+            return [self._build(start, end, compiled.rhs_symbols[rhs_start], tree_class)]
+        mid = self._prefix_mid(start, end, prefix)
+        return (self._prefix_children(start, mid, prefix - 1, tree_class)
+                + [self._build(mid, end, compiled.rhs_symbols[rhs_start + dot - 1], tree_class)])
+
+    def _build(self, start, end, label, tree_class):
+        arena = self._arena
+        compiled = self._compiled
+        index = span_index(start, end) * arena.num_labels + label
+        kind = arena.label_kind[index]
+        if kind == KIND_LEXICAL:
+            children = [self._tokens[start]]
+        elif kind == KIND_UNARY:
+            children = [self._build(start, end, arena.label_a[index], tree_class)]
+        else:
+            mid = arena.label_a[index]
+            rule = arena.label_b[index]
+            length = compiled.rule_len[rule]
+            last = compiled.rhs_symbols[compiled.rhs_start[rule] + length - 1]
+            children = (self._prefix_children(start, mid, compiled.rule_base[rule] + length - 2, tree_class)
+                        + [self._build(mid, end, last, tree_class)])
+        return tree_class(compiled.label_names[label], children)
+
+    def parses(self, root, tree_class=Tree):
+        label = self._compiled.label_ids.get(root)
+        if label is not None and self._entry(0, len(self._tokens), label) is not None:
+            yield self._build(0, len(self._tokens), label, tree_class)
+
+    def select(self, is_complete=True, lhs=None):
+        self._check()
+        arena = self._arena
+        labels = self._compiled.labels
+        wanted = self._compiled.label_ids.get(lhs) if lhs is not None else None
+        if lhs is not None and wanted is None:
+            return
+        n = len(self._tokens)
+        for length in range(1, n + 1):
+            for start in range(n - length + 1):
+                span = span_index(start, start + length)
+                if arena.span_stamp[span] != self._generation:
+                    continue
+                base = span * arena.num_labels
+                for k in range(arena.cell_size[span]):
+                    label = arena.cell_labels[base + k]
+                    if wanted is None or label == wanted:
+                        yield ViterbiEdge(start, start + length, labels[label])
+
+    def trees(self, edge, tree_class=Tree, complete=False):
+        self._check()
+        return iter([self._build(edge.start, edge.end, self._compiled.label_ids[edge.lhs], tree_class)])
+
+
+class ArenaViterbiParser:
+    """
+    The ViterbiBeamParser algorithm over a CompiledGrammar, with the chart
+    in a ChartArena. It visits items in the same order and applies the same
+    beam, so it returns the same trees; only the storage differs. The arena
+    is allocated on the first parse, so a parser built before forking
+    workers costs the parent nothing but the compiled tables.
+    """
+
+    def __init__(self, grammar, log_probs=None, beam_width=DEFAULT_BEAM_WIDTH,
+                 beam_threshold=DEFAULT_BEAM_THRESHOLD,
+                 time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET, max_length=0, compiled=None):
+        if compiled is None:
+            compiled = CompiledGrammar.build(grammar.start(), log_probs)
+        self._grammar = grammar
+        self.compiled = compiled
+        self.beam_width = beam_width
+        self.beam_log_threshold = math.log(beam_threshold) if beam_threshold else -math.inf
+        self.time_budget = time_budget
+        self.edge_budget = edge_budget
+        self.max_length = max_length
+        self._arena = None
+
+    @property
+    def arena(self):
+        if self._arena is None:
+            self._arena = ChartArena(self.compiled.num_labels, self.compiled.num_prefixes,
+                                     max(self.beam_width * 4, 1), self.max_length)
+        return self._arena
+
+    def grammar(self):
+        return self._grammar
+
+    def parse(self, tokens):
+        return self.chart_parse(tokens).parses(self._grammar.start())
+
+    def chart_parse(self, tokens):
+        tokens = list(tokens)
+        n = len(tokens)
+        arena = self.arena
+        gen = arena.begin(n)
+        deadline = time.perf_counter() + self.time_budget if self.time_budget else None
+        num_labels = arena.num_labels
+        slots = arena.prefix_slots
+        width = self.beam_width
+        threshold = self.beam_log_threshold
+
+        label_stamp = arena.label_stamp
+        label_score = arena.label_score
+        label_kind = arena.label_kind
+        label_a = arena.label_a
+        label_b = arena.label_b
+        active_stamp = arena.active_stamp
+        cell_labels = arena.cell_labels
+        cell_size = arena.cell_size
+        span_stamp = arena.span_stamp
+        prefix_id = arena.prefix_id
+        prefix_score = arena.prefix_score
+        prefix_mid = arena.prefix_mid
+        prefix_size = arena.prefix_size
+        scratch_stamp = arena.scratch_stamp
+        scratch_score = arena.scratch_score
+        scratch_mid = arena.scratch_mid
+
+        compiled = self.compiled
+        terminal_id = compiled.terminal_id
+        lexical_start = compiled.lexical_start
+        lexical_label = compiled.lexical_label
+        lexical_log_prob = compiled.lexical_log_prob
+        unary_start = compiled.unary_start
+        unary_lhs = compiled.unary_lhs
+        unary_log_prob = compiled.unary_log_prob
+        first_start = compiled.first_start
+        first_rules = compiled.first_rules
+        rule_lhs = compiled.rule_lhs
+        rule_len = compiled.rule_len
+        rule_log_prob = compiled.rule_log_prob
+        rule_base = compiled.rule_base
+        prefix_rule = compiled.prefix_rule
+        prefix_dot = compiled.prefix_dot
+        prefix_next = compiled.prefix_next
+
+        def add_label(span, base, label, score, kind, a, b):
+            index = base + label
+            if label_stamp[index] != gen:
+                label_stamp[index] = gen
+                cell_labels[base + cell_size[span]] = label
+                cell_size[span] += 1
+            elif score <= label_score[index]:
+                return False
+            label_score[index] = score
+            label_kind[index] = kind
+            label_a[index] = a
+            label_b[index] = b
+            return True
+
+        items = 0
+        for length in range(1, n + 1):
+            if deadline and time.perf_counter() > deadline:
+                raise ParseBudgetExceeded(STATUS_TIME_EXCEEDED, items, ArenaChart(self, tokens, gen))
+            for start in range(n - length + 1):
+                end = start + length
+                span = span_index(start, end)
+                base = span * num_labels
+                cell_size[span] = 0
+                arena.scratch_generation += 1
+                mark = arena.scratch_generation
+                pending = []
+
+                if length == 1:
+                    row = terminal_id(tokens[start])
+                    if row is not None:
+                        for k in range(lexical_start[row], lexical_start[row + 1]):
+                            add_label(span, base, lexical_label[k], lexical_log_prob[k], KIND_LEXICAL, 0, 0)
+
+                for mid in range(start + 1, end):
+                    left = span_index(start, mid)
+                    count = prefix_size[left]
+                    if not count:
+                        continue
+                    right_base = span_index(mid, end) * num_labels
+                    slot = left * slots
+                    for j in range(slot, slot + count):
+                        prefix = prefix_id[j]
+                        right = right_base + prefix_next[prefix]
+                        if active_stamp[right] != gen:
+                            continue
+                        score = prefix_score[j] + label_score[right]
+                        rule = prefix_rule[prefix]
+                        if prefix_dot[prefix] + 1 == rule_len[rule]:
+                            add_label(span, base, rule_lhs[rule], score, KIND_RULE, mid, rule)
+                        else:
+                            following = prefix + 1
+                            if scratch_stamp[following] != mark:
+                                scratch_stamp[following] = mark
+                                pending.append(following)
+                            elif score <= scratch_score[following]:
+                                continue
+                            scratch_score[following] = score
+                            scratch_mid[following] = mid
+
+                agenda = list(cell_labels[base:base + cell_size[span]])
+                while agenda:
+                    child = agenda.pop()
+                    child_score = label_score[base + child]
+                    for k in range(unary_start[child], unary_start[child + 1]):
+                        lhs = unary_lhs[k]
+                        if add_label(span, base, lhs, child_score + unary_log_prob[k], KIND_UNARY, child, 0):
+                            agenda.append(lhs)
+                span_stamp[span] = gen
+
+                size = cell_size[span]
+                active = list(cell_labels[base:base + size])
+                if active:
+                    floor = max(label_score[base + label] for label in active) + threshold
+                    active = [label for label in active if label_score[base + label] >= floor]
+                    if len(active) > width:
+                        active.sort(key=lambda label: label_score[base + label], reverse=True)
+                        del active[width:]
+                for label in active:
+                    active_stamp[base + label] = gen
+                    score = label_score[base + label]
+                    for k in range(first_start[label], first_start[label + 1]):
+                        rule = first_rules[k]
+                        prefix = rule_base[rule]
+                        item_score = score + rule_log_prob[rule]
+                        if scratch_stamp[prefix] != mark:
+                            scratch_stamp[prefix] = mark
+                            pending.append(prefix)
+                        elif item_score <= scratch_score[prefix]:
+                            continue
+                        scratch_score[prefix] = item_score
+                        scratch_mid[prefix] = -1
+
+                if pending:
+                    floor = max(scratch_score[prefix] for prefix in pending) + threshold
+                    pending = [prefix for prefix in pending if scratch_score[prefix] >= floor]
+                    if len(pending) > slots:
+                        pending.sort(key=lambda prefix: scratch_score[prefix], reverse=True)
+                        del pending[slots:]
+                    # Grouped by the symbol they wait for, in order of first appearance.
+                    rank = {}
+                    for prefix in pending:
+                        rank.setdefault(prefix_next[prefix], len(rank))
+                    pending.sort(key=lambda prefix: rank[prefix_next[prefix]])
+                slot = span * slots
+                for j, prefix in enumerate(pending, slot):
+                    prefix_id[j] = prefix
+                    prefix_score[j] = scratch_score[prefix]
+                    prefix_mid[j] = scratch_mid[prefix]
+                prefix_size[span] = len(pending)
+
+                items += size + len(pending)
+                if self.edge_budget and items > self.edge_budget:
+                    raise ParseBudgetExceeded(STATUS_EDGES_EXCEEDED, items, ArenaChart(self, tokens, gen))
+        return ArenaChart(self, tokens, gen)
+
+
+def arena_parser_factory(log_probs, beam_width=DEFAULT_BEAM_WIDTH, beam_threshold=DEFAULT_BEAM_THRESHOLD,
+                         max_length=0):
+    """
+    Parser factory for parse_budget.parse_corpus, with the arena sized for
+    `max_length` tokens. The grammar is compiled on the first call and
+    shared by every parser the factory builds.
+    """
+    compiled = []
+
+    def make_parser(grammar, time_budget, edge_budget):
+        if not compiled:
+            compiled.append(CompiledGrammar.build(grammar.start(), log_probs))
+        return ArenaViterbiParser(grammar, log_probs, beam_width=beam_width, beam_threshold=beam_threshold,
+                                  time_budget=time_budget, edge_budget=edge_budget, max_length=max_length,
+                                  compiled=compiled[0])
+    return make_parser
+
+
+class GcTimer:
+    """Counts garbage collections and their total pause time through gc.callbacks."""
+
+    def __init__(self):
+        self.collections = 0
+        self.seconds = 0.0
+        self._started = None
+
+    def _callback(self, phase, info):
+        if phase == 'start':
+            self._started = time.perf_counter()
+        elif self._started is not None:
+            self.seconds += time.perf_counter() - self._started
+            self.collections += 1
+            self._started = None
+
+    def __enter__(self):
+        gc.callbacks.append(self._callback)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        gc.callbacks.remove(self._callback)
+        return False
+
+
+def _run(parser, token_lists, known_terminals, trace=False):
+    from parse_budget import parse_with_budget
+    peaks = []
+    for tokens in token_lists:
+        if trace:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        parse_with_budget(parser, tokens, known_terminals, fallback=True)
+        if trace:
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    return peaks
+
+
+def benchmark(corpus_file, grammar_file, lexicon_file, model_file, limit=None,
+              beam_width=DEFAULT_BEAM_WIDTH, time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET):
+    """
+    Parses the corpus with the dict-based and the arena-based Viterbi
+    parser and prints throughput, GC pauses and per-sentence peak
+    allocation (tracemalloc, measured in a separate pass).
+    """
+    from nltk import CFG
+    from translator_core import load_grammar, load_lexicon, build_productions
+    from pcfg_model import load_model, read_corpus_tokens, rule_log_probabilities
+
+    token_lists = read_corpus_tokens([corpus_file])[:limit]
+    corpus_tokens = sorted(set(t for toks in token_lists for t in toks if t))
+    grammar_cfg = load_grammar(grammar_file)
+    productions, _ = build_productions(grammar_cfg, load_lexicon(lexicon_file), corpus_tokens)
+    grammar = CFG(grammar_cfg.start(), productions)
+    terminals = set(prod.rhs()[0] for prod in productions if prod.is_lexical())
+    log_probs = rule_log_probabilities(productions, load_model(model_file)['counts'])
+    max_length = max((len(tokens) for tokens in token_lists), default=0)
+
+    print(f"{len(token_lists)} sentences, longest {max_length} tokens.")
+    print(f"{'Parser':<8} {'Seconds':>8} {'Sent/s':>8} {'GCs':>6} {'GC ms':>8} {'Peak KiB/sent':>14}")
+    for name, make in [
+        ('dict', lambda: ViterbiBeamParser(grammar, log_probs, beam_width=beam_width,
+                                           time_budget=time_budget, edge_budget=edge_budget)),
+        ('arena', lambda: ArenaViterbiParser(grammar, log_probs, beam_width=beam_width, time_budget=time_budget,
+                                             edge_budget=edge_budget, max_length=max_length)),
+    ]:
+        parser = make()
+        gc.collect()
+        with GcTimer() as gc_timer:
+            start_time = time.perf_counter()
+            _run(parser, token_lists, terminals)
+            seconds = time.perf_counter() - start_time
+        tracemalloc.start()
+        peaks = _run(parser, token_lists, terminals, trace=True)
+        tracemalloc.stop()
+        mean_peak = sum(peaks) / len(peaks) / 1024 if peaks else 0.0
+        print(f"{name:<8} {seconds:>8.2f} {len(token_lists) / seconds if seconds else 0:>8.0f} "
+              f"{gc_timer.collections:>6} {gc_timer.seconds * 1000:>8.1f} {mean_peak:>14.1f}")
+        if name == 'arena':
+            print(f"Arena size: {parser.arena.nbytes() / 1024 / 1024:.1f} MiB")
+
+
+def main(argv=None):
+    import argparse
+    from pcfg_model import DEFAULT_MODEL_FILE
+    parser = argparse.ArgumentParser(description="Compare the dict-based and arena-based Viterbi charts.")
+    parser.add_argument('corpus', nargs='?', default='Sentence pairs in Tagalog-English (UNREDUCED).tsv')
+    parser.add_argument('--model', default=DEFAULT_MODEL_FILE)
+    parser.add_argument('--grammar', default='Appendix_D_Resource_Grammar_Tagalog_CFG.cfg')
+    parser.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+    parser.add_argument('--limit', type=int, default=None, help="Only use the first N sentences.")
+    parser.add_argument('--beam-width', type=int, default=DEFAULT_BEAM_WIDTH)
+    args = parser.parse_args(argv)
+    benchmark(args.corpus, args.grammar, args.lexicon, args.model, limit=args.limit, beam_width=args.beam_width)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import json
+import os
+import pickle
+import shutil
+
+from corpus_ingest import AtomicWriter
+
+# Checkpointing of long corpus runs.
+# Sentences are parsed in ranges; the outcomes of every finished range are
+# written to their own segment file, which only appears under its final
+# name once it is complete. Segments are never rewritten, so an error or
+# Ctrl-C loses at most the range in progress. A resumed run loads the
+# segments of the same run (same corpus, grammar and settings, recorded in
+# run.json), parses only the sentences they do not cover, and the CSV is
+# then built from the merged outcomes.
+
+DEFAULT_CHECKPOINT_DIR = 'translation_checkpoint'
+DEFAULT_CHECKPOINT_EVERY = 500
+RUN_FILE = 'run.json'
+SEGMENT_PREFIX = 'segment_'
+SEGMENT_SUFFIX = '.pkl'
+
+
+class Checkpoint:
+    def __init__(self, directory, run_key):
+        self.directory = directory
+        self.run_key = run_key
+        self._next_segment = 0
+
+    def _segment_paths(self):
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def start(self, resume=False):
+        """
+        Prepares the directory and returns {sentence index: outcome} from
+        earlier segments of the same run (empty unless `resume`). Segments
+        of a different run are discarded.
+        """
+        run_path = os.path.join(self.directory, RUN_FILE)
+        finished = {}
+        if resume and os.path.exists(run_path):
+            try:
+                with open(run_path, 'r', encoding='utf-8') as f:
+                    same_run = json.load(f).get('run_key') == self.run_key
+            except (OSError, ValueError):
+                same_run = False
+            if same_run:
+                paths = self._segment_paths()
+                for path in paths:
+                    try:
+                        with open(path, 'rb') as f:
+                            indexes, outcomes = pickle.load(f)
+                    except (OSError, pickle.UnpicklingError, EOFError) as e:
+                        print(f"Warning: skipping unreadable checkpoint segment '{path}': {e}")
+                        continue
+                    finished.update(zip(indexes, outcomes))
+                self._next_segment = len(paths)
+                return finished
+            print(f"Checkpoint in '{self.directory}' belongs to a different corpus, grammar or settings; starting over.")
+        elif resume:
+            print(f"No checkpoint found in '{self.directory}'; starting from the beginning.")
+        self.clear()
+        os.makedirs(self.directory, exist_ok=True)
+        with AtomicWriter(run_path) as f:
+            json.dump({'run_key': self.run_key}, f)
+        return finished
+
+    def write_segment(self, indexes, outcomes):
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._next_segment:06d}{SEGMENT_SUFFIX}")
+        with AtomicWriter(path, binary=True) as f:
+            pickle.dump((list(indexes), list(outcomes)), f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._next_segment += 1
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
+def ranges(indexes, size):
+    """Consecutive slices of `indexes` holding at most `size` entries each."""
+    indexes = list(indexes)
+    if size <= 0:
+        size = max(len(indexes), 1)
+    return [indexes[i:i + size] for i in range(0, len(indexes), size)]
@@ -0,0 +1,98 @@
+from nltk import Nonterminal, Tree
+
+from translator_core import rewrite_leaves, simple_lexical_translate
+
+# Chunk fallback for sentences without a full parse.
+# The chart built by the failed parse already holds every complete
+# constituent the grammar could find, so instead of translating the bare
+# token list we cover the sentence with as few large constituents as
+# possible and rewrite/translate each of them. No second parse is needed.
+
+CHUNK_LABELS = ('S', 'VP', 'NP', 'PP')
+
+# A constituent chunk costs 1 regardless of its length, an uncovered token
+# costs 2, so the cover prefers few, large constituents over loose words.
+CHUNK_COST = 1
+BARE_TOKEN_COST = 2
+
+
+def complete_spans(chart, labels=CHUNK_LABELS):
+    """Maps (start, end) to the first complete edge found for that span, by label priority."""
+    spans = {}
+    for label in labels:
+        for edge in chart.select(is_complete=True, lhs=Nonterminal(label)):
+            spans.setdefault(edge.span(), edge)
+    return spans
+
+
+def min_cost_cover(num_tokens, spans):
+    """
+    Dynamic program over token positions: returns a minimum-cost cover as a
+    list of (start, end, is_chunk); uncovered tokens are 1-token spans with
+    is_chunk False.
+    """
+    ending_at = {}
+    for start, end in spans:
+        ending_at.setdefault(end, []).append(start)
+
+    best = [0] + [None] * num_tokens
+    back = [None] * (num_tokens + 1)
+    for end in range(1, num_tokens + 1):
+        best[end] = best[end - 1] + BARE_TOKEN_COST
+        back[end] = (end - 1, False)
+        for start in ending_at.get(end, ()):
+            cost = best[start] + CHUNK_COST
+            if cost < best[end]:
+                best[end] = cost
+                back[end] = (start, True)
+
+    cover = []
+    end = num_tokens
+    while end > 0:
+        start, is_chunk = back[end]
+        cover.append((start, end, is_chunk))
+        end = start
+    cover.reverse()
+    return cover
+
+
+def chunk_chart(chart, labels=CHUNK_LABELS):
+    """
+    Splits the leaves of a filled chart into chunks: a Tree for each
+    covering constituent and a plain token for each uncovered word.
+    """
+    tokens = chart.leaves()
+    spans = complete_spans(chart, labels)
+    chunks = []
+    for start, end, is_chunk in min_cost_cover(len(tokens), spans):
+        tree = None
+        if is_chunk:
+            try:
+                tree = next(iter(chart.trees(spans[(start, end)], complete=True)), None)
+            except ValueError:
+                pass
+        if tree is None:
+            chunks.extend(tokens[start:end])
+        else:
+            chunks.append(tree)
+    return chunks
+
+
+def chunk_leaves(chunks):
+    """Rewritten token sequence of a chunk list, rewriting each chunk on its own."""
+    words = []
+    for chunk in chunks:
+        if isinstance(chunk, Tree):
+            rewrite_leaves(chunk, words)
+        else:
+            words.append(chunk)
+    return words
+
+
+def format_chunks(chunks):
+    return ' '.join(f"[{chunk.label()} {' '.join(chunk.leaves())}]" if isinstance(chunk, Tree) else chunk
+                    for chunk in chunks)
+
+
+def translate_chunks(chunks, dictionary):
+    return simple_lexical_translate(chunk_leaves(chunks), dictionary)
@@ -0,0 +1,277 @@
+import array
+import gc
+import multiprocessing
+import sys
+import time
+
+from nltk import Nonterminal
+
+# Compiled weighted grammar for the arena Viterbi parser.
+# Every table the parser reads while parsing (rules, dotted prefixes,
+# unary and left-corner indexes, lexical entries) is a flat typed array
+# inside one bytes object, read through memoryviews. Parser workers are
+# forked and inherit it: reading a memoryview never writes to the pages
+# that hold the tables, whereas every access to a list of Python ints or
+# tuples updates a reference count and makes the kernel copy that page into
+# the worker. Only small objects (label names, the start symbol and, for
+# string terminals, the word -> row dict) stay Python objects.
+
+_TABLES = [
+    ('rule_log_prob', 'd'), ('unary_log_prob', 'd'), ('lexical_log_prob', 'd'),
+    ('rule_lhs', 'i'), ('rule_len', 'i'), ('rule_base', 'i'), ('rhs_start', 'i'), ('rhs_symbols', 'i'),
+    ('prefix_rule', 'i'), ('prefix_dot', 'i'), ('prefix_next', 'i'),
+    ('unary_start', 'i'), ('unary_lhs', 'i'),
+    ('first_start', 'i'), ('first_rules', 'i'),
+    ('lexical_start', 'i'), ('lexical_label', 'i'),
+]
+
+_ALIGN = 8
+
+
+def _csr(lists):
+    """Offsets and concatenated items of a list of lists (compressed rows)."""
+    starts = [0]
+    items = []
+    for row in lists:
+        items.extend(row)
+        starts.append(len(items))
+    return starts, items
+
+
+class CompiledGrammar:
+    """
+    Tables of a weighted grammar (production -> log probability), in the
+    order ViterbiBeamParser visits them. Terminals are either all ints
+    (vocabulary IDs, used directly as rows of the lexical tables) or
+    strings, numbered in first-seen order.
+    """
+
+    def __init__(self, start, label_names, buffer, layout, terminal_ids=None):
+        self._start = start
+        self.label_names = label_names
+        self.labels = [Nonterminal(name) for name in label_names]
+        self.label_ids = {label: i for i, label in enumerate(self.labels)}
+        self._terminal_ids = terminal_ids
+        self._buffer = buffer
+        view = memoryview(buffer)
+        for name, (typecode, offset, length) in layout.items():
+            size = array.array(typecode).itemsize * length
+            setattr(self, name, view[offset:offset + size].cast(typecode))
+        self.num_labels = len(label_names)
+        self.num_prefixes = len(self.prefix_rule)
+
+    @classmethod
+    def build(cls, start, log_probs):
+        label_ids = {}
+        label_names = []
+
+        def label_id(symbol):
+            if symbol not in label_ids:
+                label_ids[symbol] = len(label_names)
+                label_names.append(symbol.symbol())
+            return label_ids[symbol]
+
+        lexical = {}
+        unary = []
+        rules = []
+        for prod, log_prob in log_probs.items():
+            rhs = prod.rhs()
+            if prod.is_lexical():
+                if len(rhs) == 1:
+                    lexical.setdefault(rhs[0], []).append((label_id(prod.lhs()), log_prob))
+            elif len(rhs) == 1:
+                unary.append((label_id(rhs[0]), label_id(prod.lhs()), log_prob))
+            elif len(rhs) > 1:
+                rules.append((label_id(prod.lhs()), [label_id(symbol) for symbol in rhs], log_prob))
+
+        if all(isinstance(token, int) for token in lexical):
+            terminal_ids = None
+            lexical_rows = [[] for _ in range(max(lexical, default=-1) + 1)]
+            for token, entries in lexical.items():
+                lexical_rows[token] = entries
+        else:
+            terminal_ids = {word: i for i, word in enumerate(lexical)}
+            lexical_rows = list(lexical.values())
+
+        num_labels = len(label_names)
+        unary_rows = [[] for _ in range(num_labels)]
+        for child, lhs, log_prob in unary:
+            unary_rows[child].append((lhs, log_prob))
+        first_rows = [[] for _ in range(num_labels)]
+        tables = {name: [] for name, _ in _TABLES}
+        for rule_id, (lhs, rhs, log_prob) in enumerate(rules):
+            first_rows[rhs[0]].append(rule_id)
+            tables['rule_lhs'].append(lhs)
+            tables['rule_len'].append(len(rhs))
+            tables['rule_log_prob'].append(log_prob)
+            tables['rule_base'].append(len(tables['prefix_rule']))
+            tables['rhs_start'].append(len(tables['rhs_symbols']))
+            tables['rhs_symbols'].extend(rhs)
+            # Prefix (rule, dot) has seen rhs[:dot] and waits for rhs[dot].
+            for dot in range(1, len(rhs)):
+                tables['prefix_rule'].append(rule_id)
+                tables['prefix_dot'].append(dot)
+                tables['prefix_next'].append(rhs[dot])
+        tables['unary_start'], unary_items = _csr(unary_rows)
+        tables['unary_lhs'] = [lhs for lhs, _ in unary_items]
+        tables['unary_log_prob'] = [log_prob for _, log_prob in unary_items]
+        tables['first_start'], tables['first_rules'] = _csr(first_rows)
+        tables['lexical_start'], lexical_items = _csr(lexical_rows)
+        tables['lexical_label'] = [label for label, _ in lexical_items]
+        tables['lexical_log_prob'] = [log_prob for _, log_prob in lexical_items]
+
+        buffer = bytearray()
+        layout = {}
+        for name, typecode in _TABLES:
+            buffer.extend(bytes(-len(buffer) % _ALIGN))
+            data = array.array(typecode, tables[name])
+            layout[name] = (typecode, len(buffer), len(data))
+            buffer.extend(data.tobytes())
+        return cls(start, label_names, bytes(buffer), layout, terminal_ids)
+
+    def start(self):
+        """Start symbol, so the compiled grammar can stand in for the nltk grammar."""
+        return self._start
+
+    def terminal_id(self, token):
+        """Row of `token` in the lexical tables, or None for a token without entries."""
+        if self._terminal_ids is not None:
+            return self._terminal_ids.get(token)
+        return token if isinstance(token, int) and 0 <= token < len(self.lexical_start) - 1 else None
+
+    def nbytes(self):
+        return len(self._buffer)
+
+
+# --- Worker start-up benchmark ------------------------------------------
+
+_bench_parser = None
+_bench_barrier = None
+_bench_sample = None
+
+
+def _memory_kib():
+    """Rss, Pss and private (unshared) memory of this process in KiB, from /proc."""
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    fields['Rss'] = int(line.split()[1])
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return fields.get('Rss', 0), fields.get('Pss', 0), private
+
+
+def _init_building(make_parser, grammar, time_budget, edge_budget):
+    # What every worker did before: build its own parser from the grammar.
+    global _bench_parser
+    _bench_parser = make_parser(grammar, time_budget, edge_budget)
+
+
+def _init_inheriting(parser):
+    global _bench_parser
+    _bench_parser = parser
+
+
+def _ready(_):
+    # The barrier holds every worker until all of them have started, so
+    # each one runs exactly one of these tasks.
+    _bench_barrier.wait()
+    return time.perf_counter()
+
+
+def _measure(_):
+    from parse_budget import parse_with_budget
+    token_lists, known_terminals = _bench_sample
+    for tokens in token_lists:
+        parse_with_budget(_bench_parser, tokens, known_terminals)
+    _bench_barrier.wait()
+    arena = getattr(_bench_parser, 'arena', None)
+    return _memory_kib() + (arena.nbytes() // 1024 if arena is not None else 0,)
+
+
+def _spin_up(workers, initializer, make_initargs, token_lists, known_terminals, freeze):
+    global _bench_barrier, _bench_sample
+    ctx = multiprocessing.get_context('fork')
+    _bench_barrier = ctx.Barrier(workers)
+    _bench_sample = (token_lists, known_terminals)
+    # Timed from before the parent builds anything, like parse_corpus.
+    start_time = time.perf_counter()
+    initargs = make_initargs()
+    if freeze:
+        gc.freeze()
+    try:
+        with ctx.Pool(workers, initializer=initializer, initargs=initargs) as pool:
+            ready = max(pool.map(_ready, range(workers), chunksize=1))
+            memory = pool.map(_measure, range(workers), chunksize=1)
+    finally:
+        if freeze:
+            gc.unfreeze()
+    return ready - start_time, memory
+
+
+def benchmark(corpus_file, grammar_file, lexicon_file, model_file=None, workers=4, sample=200):
+    """
+    Starts `workers` parser processes twice: once building the parser in
+    every worker (the old behaviour) and once inheriting the parser built in
+    the parent. Prints the time until every worker is ready, and each
+    worker's memory after parsing `sample` sentences; private memory is what
+    the worker does not share with the parent, including its own chart arena.
+    """
+    from nltk import CFG
+    from translator_core import load_grammar, load_lexicon, build_productions
+    from parse_budget import BudgetedChartParser, DEFAULT_TIME_BUDGET, DEFAULT_EDGE_BUDGET
+    from pcfg_model import load_model, read_corpus_tokens, rule_log_probabilities
+    from chart_arena import arena_parser_factory
+
+    token_lists = read_corpus_tokens([corpus_file])
+    corpus_tokens = sorted(set(t for toks in token_lists for t in toks if t))
+    grammar_cfg = load_grammar(grammar_file)
+    productions, _ = build_productions(grammar_cfg, load_lexicon(lexicon_file), corpus_tokens)
+    grammar = CFG(grammar_cfg.start(), productions)
+    terminals = set(prod.rhs()[0] for prod in productions if prod.is_lexical())
+    if model_file:
+        log_probs = rule_log_probabilities(productions, load_model(model_file)['counts'])
+        make_parser = arena_parser_factory(log_probs, max_length=max((len(t) for t in token_lists), default=0))
+        mode = 'pcfg'
+    else:
+        make_parser = BudgetedChartParser
+        mode = 'chart'
+    budgets = (DEFAULT_TIME_BUDGET, DEFAULT_EDGE_BUDGET)
+    token_lists = token_lists[:sample]
+
+    print(f"{mode} parser, {len(productions)} productions, {workers} workers, {len(token_lists)} sentences each.")
+    print(f"{'Workers':<10} {'Ready s':>8} {'RSS MiB':>9} {'PSS MiB':>9} {'Private MiB':>12} {'Arena MiB':>10}")
+    for name, initializer, make_initargs, freeze in [
+        ('build', _init_building, lambda: (make_parser, grammar) + budgets, False),
+        ('inherit', _init_inheriting, lambda: (make_parser(grammar, *budgets),), True),
+    ]:
+        seconds, memory = _spin_up(workers, initializer, make_initargs, token_lists, terminals, freeze)
+        rss, pss, private, arena = (sum(values) / len(values) / 1024 for values in zip(*memory))
+        print(f"{name:<10} {seconds:>8.2f} {rss:>9.1f} {pss:>9.1f} {private:>12.1f} {arena:>10.1f}")
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Compare worker start-up time and memory with per-worker and inherited parsers.")
+    parser.add_argument('corpus', nargs='?', default='Sentence pairs in Tagalog-English (UNREDUCED).tsv')
+    parser.add_argument('--pcfg', nargs='?', const='pcfg_rule_counts.json', default=None, metavar='MODEL',
+                        help="Benchmark the arena Viterbi parser with rule probabilities from MODEL.")
+    parser.add_argument('--grammar', default='Appendix_D_Resource_Grammar_Tagalog_CFG.cfg')
+    parser.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--sample', type=int, default=200, help="Sentences parsed by each worker.")
+    args = parser.parse_args(argv)
+    benchmark(args.corpus, args.grammar, args.lexicon, args.pcfg, workers=args.workers, sample=args.sample)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
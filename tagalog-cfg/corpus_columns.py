@@ -0,0 +1,127 @@
+import numpy as np
+
+from translator_core import tokenize_sentence
+
+# Columnar corpus preparation.
+# Every sentence is tokenized exactly once into one flat array of token IDs
+# plus an offsets array (sentence i is token_ids[offsets[i]:offsets[i+1]]).
+# Vocabulary, unknown-token masks and coverage are then computed with array
+# operations over the distinct IDs instead of re-flattening string lists.
+
+
+class Vocabulary:
+    """
+    Interns token strings to dense integer IDs in first-seen order.
+
+    ID 0 is reserved for the empty string and never produced by a token:
+    nltk's chart treats a falsy leaf as missing, so real tokens start at 1.
+    """
+
+    RESERVED = ''
+
+    def __init__(self, words=()):
+        self._ids = {self.RESERVED: 0}
+        self._words = [self.RESERVED]
+        for word in words:
+            self.intern(word)
+
+    def intern(self, word):
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word_id = self._ids[word] = len(self._words)
+            self._words.append(word)
+        return word_id
+
+    def id_of(self, word, default=None):
+        return self._ids.get(word, default)
+
+    def word(self, word_id):
+        return self._words[word_id]
+
+    def words(self):
+        return list(self._words)
+
+    def __len__(self):
+        return len(self._words)
+
+    def __contains__(self, word):
+        return word in self._ids
+
+    def membership_mask(self, words):
+        """Boolean array over vocabulary IDs: True where the word is in `words`."""
+        return np.fromiter((word in words for word in self._words), dtype=bool, count=len(self._words))
+
+
+class TokenizedCorpus:
+    def __init__(self, vocabulary, token_ids, offsets):
+        self.vocabulary = vocabulary
+        self.token_ids = token_ids
+        self.offsets = offsets
+
+    @classmethod
+    def from_texts(cls, texts, vocabulary=None):
+        vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        intern = vocabulary.intern
+        ids = []
+        offsets = [0]
+        for text in texts:
+            ids.extend(intern(tok) for tok in tokenize_sentence(text) if tok)
+            offsets.append(len(ids))
+        return cls(vocabulary, np.asarray(ids, dtype=np.int32), np.asarray(offsets, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def sentence_ids(self, i):
+        return self.token_ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def id_sequences(self):
+        """Per-sentence ID arrays (views into the flat array, no copies)."""
+        if not len(self):
+            return []
+        return np.split(self.token_ids, self.offsets[1:-1])
+
+    def token_lists(self):
+        """Materializes per-sentence string lists in a single pass."""
+        if not len(self):
+            return []
+        words = np.asarray(self.vocabulary.words(), dtype=object)
+        return [list(chunk) for chunk in np.split(words[self.token_ids], self.offsets[1:-1])]
+
+    def used_ids(self):
+        return np.unique(self.token_ids)
+
+    def vocabulary_words(self):
+        """Sorted distinct tokens occurring in the corpus."""
+        return sorted(self.vocabulary.word(i) for i in self.used_ids())
+
+    def unknown_token_mask(self, known_words):
+        """Boolean array per token position: True where the token is not in `known_words`."""
+        return ~self.vocabulary.membership_mask(known_words)[self.token_ids]
+
+    def unknown_counts(self, known_words):
+        """Number of unknown tokens per sentence."""
+        mask = self.unknown_token_mask(known_words).astype(np.int64)
+        cumulative = np.concatenate(([0], np.cumsum(mask)))
+        return cumulative[self.offsets[1:]] - cumulative[self.offsets[:-1]]
+
+    def missing_words(self, known_words):
+        """Sorted corpus tokens that are not in `known_words`."""
+        used = self.used_ids()
+        missing = used[~self.vocabulary.membership_mask(known_words)[used]]
+        return sorted(self.vocabulary.word(i) for i in missing)
+
+    def coverage(self, known_words):
+        """Token- and sentence-level coverage of the corpus by `known_words`."""
+        unknown = self.unknown_counts(known_words)
+        num_tokens = len(self.token_ids)
+        return {
+            'sentences': len(self),
+            'fully_covered_sentences': int(np.count_nonzero(unknown == 0)),
+            'tokens': num_tokens,
+            'unknown_tokens': int(unknown.sum()),
+            'token_coverage': 1.0 - unknown.sum() / num_tokens if num_tokens else 1.0,
+        }
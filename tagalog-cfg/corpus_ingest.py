@@ -0,0 +1,271 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import stat
+import sys
+import tempfile
+import unicodedata
+
+# Streaming ingestion for the parallel corpus files.
+# Unlike 'python deduplicate_file.py', nothing here holds the whole file in
+# memory and the input file is never overwritten: results are written to a
+# temporary file next to the output and moved into place once complete.
+
+DEFAULT_CORPUS = 'Sentence pairs in Tagalog-English (UNREDUCED).tsv'
+DEFAULT_MEMORY_KEYS = 1_000_000
+
+BOM = '\ufeff'
+_whitespace_re = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Strips stray BOMs, applies NFC and collapses runs of whitespace."""
+    text = unicodedata.normalize('NFC', text.replace(BOM, ''))
+    return _whitespace_re.sub(' ', text).strip()
+
+
+def normalized_key(tagalog_text):
+    """Dedup key for a Tagalog sentence: case-folded normalized text, hashed."""
+    return hashlib.blake2b(normalize_text(tagalog_text).casefold().encode('utf-8'), digest_size=16).digest()
+
+
+class DigestIndex:
+    """
+    Set of fixed-size digests with a bounded in-memory part.
+
+    Up to `memory_keys` digests are kept in a Python set. When the set fills
+    up it is flushed into an on-disk SQLite index, so memory use stays flat
+    no matter how large the corpus is.
+    """
+
+    def __init__(self, memory_keys=DEFAULT_MEMORY_KEYS, index_path=None):
+        self.memory_keys = memory_keys
+        self.index_path = index_path
+        self._recent = set()
+        self._db = None
+        self._owns_index_file = False
+
+    def _open_db(self):
+        if self.index_path is None:
+            fd, self.index_path = tempfile.mkstemp(suffix='.sqlite', prefix='ingest_index_')
+            os.close(fd)
+            self._owns_index_file = True
+        self._db = sqlite3.connect(self.index_path)
+        self._db.execute('PRAGMA journal_mode=OFF')
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._db.execute('CREATE TABLE IF NOT EXISTS seen (digest BLOB PRIMARY KEY) WITHOUT ROWID')
+
+    def _flush(self):
+        if self._db is None:
+            self._open_db()
+        self._db.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((d,) for d in self._recent))
+        self._db.commit()
+        self._recent.clear()
+
+    def add(self, digest):
+        """Adds `digest`; returns True if it was not seen before."""
+        if digest in self._recent:
+            return False
+        if self._db is not None and self._db.execute('SELECT 1 FROM seen WHERE digest = ?', (digest,)).fetchone():
+            return False
+        self._recent.add(digest)
+        if len(self._recent) >= self.memory_keys:
+            self._flush()
+        return True
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            if self._owns_index_file:
+                os.remove(self.index_path)
+
+
+def _file_mode(path):
+    """Permission bits of the existing `path`, or those open() gives a new file under the umask."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+class AtomicWriter:
+    """File that only replaces `path` once it was completely written (text unless `binary`)."""
+
+    def __init__(self, path, newline='', binary=False):
+        self.path = path
+        self.newline = newline
+        self.binary = binary
+        self._tmp_path = None
+        self._file = None
+
+    def __enter__(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path) + '.', suffix='.tmp')
+        # mkstemp creates the file 0600; give it the mode open() would (or the replaced file's).
+        os.chmod(self._tmp_path, _file_mode(self.path))
+        if self.binary:
+            self._file = os.fdopen(fd, 'wb')
+        else:
+            self._file = os.fdopen(fd, 'w', encoding='utf-8', newline=self.newline)
+        return self._file
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._file.close()
+            if exc_type is None:
+                os.replace(self._tmp_path, self.path)
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+        return False
+
+
+def iter_tsv_rows(filepath):
+    """Yields (line_number, fields) for each line, with the BOM removed."""
+    with open(filepath, 'r', encoding='utf-8-sig', newline=None) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            yield line_number, line.split('\t')
+
+
+def ingest_tsv(input_path, output_path, duplicates_path=None, tagalog_column=1,
+               memory_keys=DEFAULT_MEMORY_KEYS, index_path=None):
+    """
+    Streams a parallel corpus TSV, normalizes every field and keeps only the
+    first row for each normalized Tagalog sentence.
+
+    Returns a dict of counters (rows read, written, duplicates, malformed).
+    """
+    stats = {'rows': 0, 'written': 0, 'duplicates': 0, 'malformed': 0}
+    index = DigestIndex(memory_keys=memory_keys, index_path=index_path)
+    try:
+        with contextlib.ExitStack() as stack:
+            out = stack.enter_context(AtomicWriter(output_path))
+            dup_out = stack.enter_context(AtomicWriter(duplicates_path)) if duplicates_path else None
+            for line_number, fields in iter_tsv_rows(input_path):
+                stats['rows'] += 1
+                if len(fields) <= tagalog_column:
+                    stats['malformed'] += 1
+                    print(f"Warning: Skipping malformed line {line_number}: {fields}")
+                    continue
+                fields = [normalize_text(field) for field in fields]
+                if not fields[tagalog_column]:
+                    stats['malformed'] += 1
+                    continue
+                row = '\t'.join(fields) + '\n'
+                if index.add(normalized_key(fields[tagalog_column])):
+                    out.write(row)
+                    stats['written'] += 1
+                else:
+                    stats['duplicates'] += 1
+                    if dup_out is not None:
+                        dup_out.write(row)
+    finally:
+        index.close()
+    return stats
+
+
+def find_duplicate_json_keys(filepath):
+    """
+    Loads a JSON dictionary while recording duplicate keys.
+
+    `json.load` silently keeps the last value of a repeated key, so the
+    duplicates are collected in an `object_pairs_hook` before they collapse.
+    Returns (data, duplicates) where `data` keeps the first occurrence of each
+    key and `duplicates` is a list of (key, kept_value, dropped_value).
+    """
+    duplicates = []
+
+    def first_wins(pairs):
+        obj = {}
+        for key, value in pairs:
+            if key in obj:
+                duplicates.append((key, obj[key], value))
+            else:
+                obj[key] = value
+        return obj
+
+    with open(filepath, 'r', encoding='utf-8-sig') as f:
+        data = json.load(f, object_pairs_hook=first_wins)
+    return data, duplicates
+
+
+def clean_json(input_path, output_path):
+    data, duplicates = find_duplicate_json_keys(input_path)
+    for key, kept, dropped in duplicates:
+        print(f"Duplicate key '{key}': keeping {kept!r}, dropping {dropped!r}")
+    if output_path:
+        with AtomicWriter(output_path, newline=None) as out:
+            json.dump(data, out, ensure_ascii=False, indent=4)
+            out.write('\n')
+    return len(data), len(duplicates)
+
+
+def default_output_path(input_path, suffix):
+    stem, ext = os.path.splitext(input_path)
+    return f"{stem}{suffix}{ext}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streaming normalization and deduplication of corpus resources.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    tsv = sub.add_parser('tsv', help="Deduplicate a parallel corpus TSV on its normalized Tagalog side.")
+    tsv.add_argument('input', nargs='?', default=DEFAULT_CORPUS)
+    tsv.add_argument('-o', '--output', help="Output TSV (default: '<input> (deduplicated).tsv').")
+    tsv.add_argument('--duplicates', help="Optional TSV receiving the dropped duplicate rows.")
+    tsv.add_argument('--tagalog-column', type=int, default=1)
+    tsv.add_argument('--memory-keys', type=int, default=DEFAULT_MEMORY_KEYS,
+                     help="Digests kept in memory before spilling to the on-disk index.")
+    tsv.add_argument('--index', help="Path for the on-disk digest index (default: temporary file).")
+
+    js = sub.add_parser('json', help="Report duplicate keys in a JSON dictionary and write a cleaned copy.")
+    js.add_argument('input')
+    js.add_argument('-o', '--output', help="Cleaned JSON output (omit to only report).")
+
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        print(f"Error: File not found at '{args.input}'")
+        return 1
+
+    try:
+        if args.command == 'tsv':
+            output = args.output or default_output_path(args.input, ' (deduplicated)')
+            if os.path.abspath(output) == os.path.abspath(args.input):
+                print("Error: Output path must differ from the input path.")
+                return 1
+            stats = ingest_tsv(args.input, output, duplicates_path=args.duplicates,
+                               tagalog_column=args.tagalog_column,
+                               memory_keys=args.memory_keys, index_path=args.index)
+            print(f"Read {stats['rows']} rows: wrote {stats['written']}, "
+                  f"dropped {stats['duplicates']} duplicates and {stats['malformed']} malformed rows.")
+            print(f"Output written to '{output}'.")
+        else:
+            kept, dropped = clean_json(args.input, args.output)
+            print(f"{kept} unique keys, {dropped} duplicate keys found in '{args.input}'.")
+            if args.output:
+                print(f"Cleaned dictionary written to '{args.output}'.")
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON from '{args.input}': {e}")
+        return 1
+    except (IOError, sqlite3.Error) as e:
+        print(f"Error during ingestion: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,626 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+from nltk import CFG, Nonterminal, Tree
+from nltk.parse.chart import Chart, LeafEdge, TreeEdge
+
+from translator_core import load_grammar, load_lexicon, build_productions
+from parse_budget import (BudgetedChartParser, ParseBudgetExceeded, parse_with_budget, fill_chart,
+                          STATUS_TIME_EXCEEDED, STATUS_EDGES_EXCEEDED,
+                          DEFAULT_TIME_BUDGET, DEFAULT_EDGE_BUDGET, CLOCK_CHECK_INTERVAL)
+from parse_forest import ParseForest
+from pcfg_model import read_corpus_tokens
+from result_store import fingerprint, production_key
+from corpus_ingest import AtomicWriter
+from skeleton_cache import SkeletonCache
+
+# Earley parser backend for the all-parses (non-PCFG) mode.
+# The structural grammar has many long, flat rules (S -> V NP Adv PP NP),
+# which an Earley parser handles as they are: one dotted item per rule
+# position, with no binarization. nltk's ChartParser does the same work
+# with an edge object, an index entry and a tuple of child edges per
+# child-pointer list; here an item is an int (dotted rule * (n + 1) +
+# origin) and its only record is the list of split points it was reached
+# from. Prediction uses precomputed tables: the rules each label can start
+# (left corners), and, with `top_down`, the labels each label can begin
+# with, so only rules that can continue an item to their left are
+# predicted. nltk objects are only created for the trees that are asked
+# for, or when a consumer needs a real nltk Chart (chunk fallback, rule
+# profile, parse forest).
+#
+# Items are created in the order nltk's bottom-up left-corner agenda
+# creates the same edges: position by position, and depth-first within a
+# position. That order decides which tree comes first for an ambiguous
+# sentence and which constituents the chunk fallback prefers, so both
+# engines give the same output. Without `top_down` every constituent nltk
+# finds is found, which the chunk fallback needs; with it, only those that
+# can be part of a full parse.
+#
+# Which engine is faster depends on the grammar, so `select_engine` parses
+# a corpus sample with both, checks that they agree, and records the choice
+# per structural grammar in parser_selection.json. Skeleton-cache runs parse
+# POS skeletons against the skeleton grammar, a different workload, so
+# their choice is recorded separately.
+
+ENGINES = ('chart', 'earley')
+DEFAULT_SELECTION_FILE = 'parser_selection.json'
+DEFAULT_SAMPLE_SIZE = 300
+
+_LEXICAL = -1
+
+
+class EarleyGrammar:
+    """
+    Integer-coded tables of an nltk CFG. Labels and terminals are numbered;
+    a rule symbol is a label id (>= 0) or ~terminal id (< 0). Dotted rule
+    `rule_base[r] + dot` is rule r with `dot` symbols seen. Grammars with
+    empty productions are rejected.
+    """
+
+    def __init__(self, grammar):
+        self.start = grammar.start()
+        self.labels = []
+        self.label_ids = {}
+        terminal_ids = {}
+        leaf_entries = {}
+        rules = []
+        seen = set()
+        for prod in grammar.productions():
+            if prod in seen:
+                continue
+            seen.add(prod)
+            rhs = prod.rhs()
+            if len(rhs) == 1 and not isinstance(rhs[0], Nonterminal):
+                leaf_entries.setdefault(rhs[0], []).append(~self._label(prod.lhs()))
+                continue
+            codes = tuple(self._label(sym) if isinstance(sym, Nonterminal)
+                          else ~terminal_ids.setdefault(sym, len(terminal_ids)) for sym in rhs)
+            if codes and codes[0] < 0:
+                # Rules that start with a word are predicted from that word's leaf, in grammar order.
+                leaf_entries.setdefault(rhs[0], []).append(len(rules))
+            rules.append((self._label(prod.lhs()), codes, prod))
+        self.terminal_ids = terminal_ids
+        # Per word: ~label for each lexical entry and the ids of rules starting with the word.
+        self.leaf_entries = leaf_entries
+
+        nullable = self._nullable(rules)
+        if nullable:
+            names = ', '.join(sorted(self.labels[label].symbol() for label in nullable))
+            raise ValueError(f"Earley backend does not support empty productions (nullable: {names})")
+
+        self.productions = [prod for lhs, rhs, prod in rules]
+        self.rule_lhs = [lhs for lhs, rhs, prod in rules]
+        self.rule_rhs = [rhs for lhs, rhs, prod in rules]
+        self.rule_base = []
+        self.dotted_lhs = []
+        self.dotted_next = []
+        self.dotted_rule = []
+        for rule, (lhs, rhs, prod) in enumerate(rules):
+            self.rule_base.append(len(self.dotted_next))
+            for dot in range(len(rhs) + 1):
+                self.dotted_lhs.append(lhs)
+                self.dotted_next.append(rhs[dot] if dot < len(rhs) else None)
+                self.dotted_rule.append(rule)
+
+        # first_rules[label]: rules whose first symbol is `label`, in grammar order.
+        num_labels = len(self.labels)
+        self.first_rules = [[] for _ in range(num_labels)]
+        for rule, (lhs, rhs, prod) in enumerate(rules):
+            if rhs[0] >= 0:
+                self.first_rules[rhs[0]].append(rule)
+        # left_corners[label]: labels a `label` constituent can begin with, itself included.
+        starts_with = [set() for _ in range(num_labels)]
+        for lhs, rhs, prod in rules:
+            if rhs[0] >= 0:
+                starts_with[lhs].add(rhs[0])
+        self.left_corners = []
+        for label in range(num_labels):
+            corners = {label}
+            stack = [label]
+            while stack:
+                for first in starts_with[stack.pop()]:
+                    if first not in corners:
+                        corners.add(first)
+                        stack.append(first)
+            self.left_corners.append(frozenset(corners))
+
+    def _label(self, symbol):
+        label = self.label_ids.get(symbol)
+        if label is None:
+            label = self.label_ids[symbol] = len(self.labels)
+            self.labels.append(symbol)
+        return label
+
+    @staticmethod
+    def _nullable(rules):
+        nullable = set()
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs, prod in rules:
+                if lhs not in nullable and all(sym in nullable for sym in rhs):
+                    nullable.add(lhs)
+                    changed = True
+        return nullable
+
+
+class EarleyChart:
+    """
+    Result of EarleyChartParser.chart_parse. `parses()` reads trees straight
+    from the integer chart; the nltk Chart methods used elsewhere (select,
+    edges, trees, child_pointer_lists) are served by an nltk Chart of the
+    complete constituents, built on first use.
+
+    `complete[end]` maps label * (n + 1) + start to the rules that completed
+    that constituent, in creation order; `expanded[end]` holds the rule
+    whose item was taken from the agenda first, which is the one every item
+    built on the constituent was first reached with.
+    """
+
+    def __init__(self, compiled, tokens, items, complete, expanded):
+        self._compiled = compiled
+        self._tokens = tokens
+        self._items = items
+        self._complete = complete
+        self._expanded = expanded
+        self._stride = len(tokens) + 1
+        self._chart = None
+
+    def leaves(self):
+        return list(self._tokens)
+
+    def num_leaves(self):
+        return len(self._tokens)
+
+    def num_items(self):
+        return sum(len(items) for items in self._items)
+
+    def _rules(self, label, start, end, as_child):
+        key = label * self._stride + start
+        rules = self._complete[end].get(key, ())
+        first = self._expanded[end].get(key) if as_child else None
+        if first is None or rules[0] == first:
+            return rules
+        return [first] + [rule for rule in rules if rule != first]
+
+    def parses(self, root, tree_class=Tree):
+        """Every parse of the whole sentence, lazily, first parse first as nltk's Chart.parses() lists it."""
+        label = self._compiled.label_ids.get(root)
+        if label is None:
+            return iter(())
+        return self._trees(label, 0, len(self._tokens), set(), tree_class, as_child=False)
+
+    def _trees(self, label, start, end, on_stack, tree_class, as_child=True):
+        name = self._compiled.labels[label].symbol()
+        for rule in self._rules(label, start, end, as_child):
+            if rule == _LEXICAL:
+                yield tree_class(name, [self._tokens[start]])
+                continue
+            # A rule over a span that is already being expanded above is a unary cycle.
+            key = (rule, start, end)
+            if key in on_stack:
+                continue
+            on_stack.add(key)
+            dotted = self._compiled.rule_base[rule] + len(self._compiled.rule_rhs[rule])
+            for children in self._children(dotted, start, end, on_stack, tree_class):
+                yield tree_class(name, children)
+            on_stack.discard(key)
+
+    def _children(self, dotted, origin, end, on_stack, tree_class):
+        compiled = self._compiled
+        if dotted == compiled.rule_base[compiled.dotted_rule[dotted]]:
+            if end == origin:
+                yield []
+            return
+        symbol = compiled.dotted_next[dotted - 1]
+        for mid in self._items[end].get(dotted * self._stride + origin, ()):
+            if symbol < 0:
+                last_choices = [self._tokens[mid]]
+            else:
+                last_choices = self._trees(symbol, mid, end, on_stack, tree_class)
+            for last in last_choices:
+                for prefix in self._children(dotted - 1, origin, mid, on_stack, tree_class):
+                    yield prefix + [last]
+
+    # --- nltk Chart view -----------------------------------------------
+
+    def _span_paths(self, dotted, origin, end):
+        """Every sequence of child spans (symbol, start, end) that completes `dotted` over (origin, end)."""
+        compiled = self._compiled
+        if dotted == compiled.rule_base[compiled.dotted_rule[dotted]]:
+            if end == origin:
+                yield ()
+            return
+        symbol = compiled.dotted_next[dotted - 1]
+        for mid in self._items[end].get(dotted * self._stride + origin, ()):
+            for prefix in self._span_paths(dotted - 1, origin, mid):
+                yield prefix + ((symbol, mid, end),)
+
+    def nltk_chart(self):
+        """The complete constituents as an nltk Chart, with every child pointer list."""
+        if self._chart is not None:
+            return self._chart
+        compiled = self._compiled
+        chart = Chart(self._tokens)
+        leaves = [LeafEdge(token, i) for i, token in enumerate(self._tokens)]
+        for leaf in leaves:
+            chart.insert(leaf, ())
+        edges = {}
+        pending = []
+        for end, complete in enumerate(self._complete):
+            for key, rules in complete.items():
+                label, start = divmod(key, self._stride)
+                lhs = compiled.labels[label]
+                by_rule = {}
+                for rule in rules:
+                    if rule == _LEXICAL:
+                        edge = TreeEdge((start, end), lhs, (self._tokens[start],), 1)
+                        chart.insert(edge, (leaves[start],))
+                    else:
+                        rhs = compiled.productions[rule].rhs()
+                        edge = TreeEdge((start, end), lhs, rhs, len(rhs))
+                        pending.append((edge, compiled.rule_base[rule] + len(rhs), start, end))
+                    by_rule[rule] = edge
+                edges[(label, start, end)] = [by_rule[rule] for rule in self._rules(label, start, end, True)]
+        for edge, dotted, start, end in pending:
+            pointer_lists = []
+            for path in self._span_paths(dotted, start, end):
+                choices = [(leaves[mid],) if symbol < 0 else edges.get((symbol, mid, child_end), ())
+                           for symbol, mid, child_end in path]
+                pointer_lists.extend(itertools.product(*choices))
+            chart.insert(edge, *pointer_lists)
+        self._chart = chart
+        return chart
+
+    def select(self, **restrictions):
+        return self.nltk_chart().select(**restrictions)
+
+    def edges(self):
+        return self.nltk_chart().edges()
+
+    def num_edges(self):
+        return self.nltk_chart().num_edges()
+
+    def child_pointer_lists(self, edge):
+        return self.nltk_chart().child_pointer_lists(edge)
+
+    def trees(self, edge, tree_class=Tree, complete=False):
+        return self.nltk_chart().trees(edge, tree_class=tree_class, complete=complete)
+
+
+class EarleyChartParser:
+    """
+    Earley parser with the interface and budgets of BudgetedChartParser;
+    the edge budget counts items. Gives the same parses, in the same order,
+    as nltk's ChartParser with its default strategy. `generated` is a module
+    from parser_codegen.py specialized to this grammar, whose fill() replaces
+    the table-driven item loop.
+    """
+
+    def __init__(self, grammar, time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET,
+                 top_down=False, compiled=None, generated=None):
+        self._grammar = grammar
+        self.compiled = compiled if compiled is not None else EarleyGrammar(grammar)
+        self.time_budget = time_budget
+        self.edge_budget = edge_budget
+        self.top_down = top_down
+        self.generated = generated
+
+    def grammar(self):
+        return self._grammar
+
+    def parse(self, tokens):
+        return self.chart_parse(tokens).parses(self._grammar.start())
+
+    def chart_parse(self, tokens):
+        tokens = list(tokens)
+        # Same error as nltk's ChartParser for words the grammar lacks.
+        self._grammar.check_coverage(tokens)
+        compiled = self.compiled
+        n = len(tokens)
+        stride = n + 1
+        items = [{} for _ in range(stride)]
+        waiting = [{} for _ in range(stride)]
+        complete = [{} for _ in range(stride)]
+        expanded = [{} for _ in range(stride)]
+        chart = EarleyChart(compiled, tokens, items, complete, expanded)
+
+        leaf_entries = compiled.leaf_entries
+        terminal_ids = compiled.terminal_ids
+        rule_base = compiled.rule_base
+        rule_lhs = compiled.rule_lhs
+        first_rules = compiled.first_rules
+        dotted_next = compiled.dotted_next
+        dotted_lhs = compiled.dotted_lhs
+        dotted_rule = compiled.dotted_rule
+        left_corners = compiled.left_corners
+        max_items = self.edge_budget
+        deadline = time.perf_counter() + self.time_budget if self.time_budget else None
+        num_items = 0
+
+        # predicted[i]: labels an item ending at i can be continued with (top-down mode only).
+        predicted = None
+        if self.top_down:
+            start_label = compiled.label_ids.get(compiled.start)
+            predicted = [left_corners[start_label] if start_label is not None else frozenset()]
+
+        if self.generated is not None:
+            self.generated.fill(compiled, tokens, items, waiting, complete, expanded, predicted, chart,
+                                max_items, deadline)
+            return chart
+
+        for j in range(1, stride):
+            items_j = items[j]
+            waiting_j = waiting[j]
+            complete_j = complete[j]
+            expanded_j = expanded[j]
+            # nltk's agenda is a stack: the newest edge is processed next, and
+            # an edge that gains a child pointer list is pushed again.
+            stack = []
+            popped = set()
+
+            def add(code, mid, new_split):
+                nonlocal num_items
+                stack.append(code)
+                mids = items_j.get(code)
+                if mids is not None:
+                    if new_split:
+                        mids.append(mid)
+                    return
+                items_j[code] = [mid]
+                dotted, origin = divmod(code, stride)
+                symbol = dotted_next[dotted]
+                if symbol is None:
+                    complete_j.setdefault(dotted_lhs[dotted] * stride + origin, []).append(dotted_rule[dotted])
+                else:
+                    waiting_j.setdefault(symbol, []).append(code)
+                num_items += 1
+                if max_items and num_items > max_items:
+                    raise ParseBudgetExceeded(STATUS_EDGES_EXCEEDED, num_items, chart)
+                if deadline and num_items % CLOCK_CHECK_INTERVAL == 0 and time.perf_counter() > deadline:
+                    raise ParseBudgetExceeded(STATUS_TIME_EXCEEDED, num_items, chart)
+
+            # The word's leaf: lexical constituents and rules starting with the word, then
+            # items waiting for the word.
+            token = tokens[j - 1]
+            for entry in leaf_entries.get(token, ()):
+                if entry < 0:
+                    # Lexical constituents have no item; they go on the stack as ~key.
+                    key = ~entry * stride + j - 1
+                    complete_j.setdefault(key, []).append(_LEXICAL)
+                    stack.append(~key)
+                else:
+                    add((rule_base[entry] + 1) * stride + j - 1, j - 1, True)
+            if token in terminal_ids:
+                for code in waiting[j - 1].get(~terminal_ids[token], ()):
+                    add(code + stride, j - 1, True)
+
+            while stack:
+                code = stack.pop()
+                if code in popped:
+                    continue
+                popped.add(code)
+                if code < 0:
+                    label, origin = divmod(~code, stride)
+                    rule = _LEXICAL
+                else:
+                    dotted, origin = divmod(code, stride)
+                    if dotted_next[dotted] is not None:
+                        continue
+                    label = dotted_lhs[dotted]
+                    rule = dotted_rule[dotted]
+                # A second rule over the same span adds no split points, but the
+                # items built on the span are pushed again, as nltk does.
+                key = label * stride + origin
+                new_split = key not in expanded_j
+                if new_split:
+                    expanded_j[key] = rule
+                allowed = predicted[origin] if predicted is not None else None
+                for new_rule in first_rules[label]:
+                    if allowed is None or rule_lhs[new_rule] in allowed:
+                        add((rule_base[new_rule] + 1) * stride + origin, origin, new_split)
+                for code in waiting[origin].get(label, ()):
+                    add(code + stride, origin, new_split)
+
+            if predicted is not None:
+                labels = set()
+                for symbol in waiting_j:
+                    if symbol >= 0:
+                        labels |= left_corners[symbol]
+                predicted.append(labels)
+        return chart
+
+
+def earley_parser_factory(top_down=False, compiled=None, generated=None):
+    """
+    Parser factory for parse_budget.parse_corpus. The grammar is compiled
+    once (or `compiled`, an EarleyGrammar of the same grammar, is used) and
+    shared by every parser the factory builds, as is the `generated` module.
+    """
+    shared = [compiled] if compiled is not None else []
+
+    def make_parser(grammar, time_budget, edge_budget):
+        if not shared:
+            shared.append(EarleyGrammar(grammar))
+        return EarleyChartParser(grammar, time_budget=time_budget, edge_budget=edge_budget,
+                                 top_down=top_down, compiled=shared[0], generated=generated)
+    return make_parser
+
+
+# --- Engine selection ----------------------------------------------------
+
+def grammar_key(productions, start, skeletons=False):
+    """
+    Fingerprint of the structural rules; lexical entries do not change which
+    engine is faster. `skeletons` keys the choice for skeleton-cache runs.
+    """
+    return fingerprint(str(start), sorted(production_key(prod) for prod in productions
+                                          if not (len(prod.rhs()) == 1 and not isinstance(prod.rhs()[0], Nonterminal))),
+                       'skeletons' if skeletons else 'words')
+
+
+def _chunk_spans(chunks):
+    return tuple((chunk.label(), tuple(chunk.leaves())) if isinstance(chunk, Tree) else chunk for chunk in chunks)
+
+
+def _outcome(parser, tokens, known_terminals):
+    """(status, number of parses, chunk labels and spans, first tree) of one sentence."""
+    status, tree, elapsed, chunks = parse_with_budget(parser, tokens, known_terminals, fallback=True)
+    count = None
+    if tree is not None:
+        chart, _ = fill_chart(parser, tokens)
+        forest = ParseForest.from_chart(chart, parser.grammar().start())
+        count = forest.count() if forest is not None else 0
+    return status, count, _chunk_spans(chunks) if chunks else None, tree
+
+
+def compare_engines(grammar, token_lists, known_terminals=None, time_budget=DEFAULT_TIME_BUDGET,
+                    edge_budget=DEFAULT_EDGE_BUDGET):
+    """
+    Parses `token_lists` with both engines and returns a report dict:
+    seconds per engine (parse_with_budget with chunk fallback, as a corpus
+    run does), and parity: every sentence that finished within budget on
+    both engines must get the same status, the same number of parses
+    (counted on the packed forest) and the same fallback chunks.
+    """
+    parsers = {
+        'chart': BudgetedChartParser(grammar, time_budget=time_budget, edge_budget=edge_budget),
+        'earley': EarleyChartParser(grammar, time_budget=time_budget, edge_budget=edge_budget),
+    }
+    seconds = {}
+    for engine, parser in parsers.items():
+        start_time = time.perf_counter()
+        for tokens in token_lists:
+            parse_with_budget(parser, tokens, known_terminals, fallback=True)
+        seconds[engine] = time.perf_counter() - start_time
+
+    compared = mismatches = same_tree = budget_limited = 0
+    examples = []
+    for tokens in token_lists:
+        chart_outcome = _outcome(parsers['chart'], tokens, known_terminals)
+        earley_outcome = _outcome(parsers['earley'], tokens, known_terminals)
+        if chart_outcome[0].startswith('Budget') or earley_outcome[0].startswith('Budget'):
+            budget_limited += 1
+            continue
+        compared += 1
+        if chart_outcome[:3] != earley_outcome[:3]:
+            mismatches += 1
+            if len(examples) < 5:
+                examples.append(' '.join(map(str, tokens)))
+        elif chart_outcome[3] == earley_outcome[3]:
+            same_tree += 1
+    return {
+        'sentences': len(token_lists),
+        'seconds': {engine: round(value, 3) for engine, value in seconds.items()},
+        'compared': compared,
+        'budget_limited': budget_limited,
+        'mismatches': mismatches,
+        'same_first_tree': same_tree,
+        'mismatch_examples': examples,
+        'parity': mismatches == 0,
+    }
+
+
+def load_selection(filepath):
+    if not os.path.exists(filepath):
+        return {}
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable parser selection '{filepath}': {e}")
+        return {}
+
+
+def select_engine(grammar, token_lists, known_terminals=None, selection_file=DEFAULT_SELECTION_FILE,
+                  sample_size=DEFAULT_SAMPLE_SIZE, time_budget=DEFAULT_TIME_BUDGET,
+                  edge_budget=DEFAULT_EDGE_BUDGET, force=False, skeletons=False):
+    """
+    Engine ('chart' or 'earley') for this structural grammar. A choice
+    recorded in `selection_file` is reused; otherwise up to `sample_size`
+    of `token_lists` are parsed with both engines and the faster one is
+    recorded. Earley is only chosen if it agrees with the chart parser on
+    the sample. Pass the grammar and inputs the run will parse: with
+    `skeletons`, the skeleton grammar and the distinct POS skeletons.
+    """
+    key = grammar_key(grammar.productions(), grammar.start(), skeletons)
+    selections = load_selection(selection_file)
+    if key in selections and not force:
+        return selections[key]['engine']
+    try:
+        EarleyGrammar(grammar)
+    except ValueError as e:
+        print(f"Note: {e}; using the chart parser.")
+        return 'chart'
+
+    sample = spread_sample(token_lists, sample_size)
+    print(f"Benchmarking parser engines on {len(sample)} {'POS skeletons' if skeletons else 'sentences'} "
+          f"for this grammar...")
+    report = compare_engines(grammar, sample, known_terminals, time_budget, edge_budget)
+    seconds = report['seconds']
+    engine = 'earley' if report['parity'] and seconds['earley'] < seconds['chart'] else 'chart'
+    print(f"  chart {seconds['chart']:.2f}s, earley {seconds['earley']:.2f}s; "
+          f"{report['mismatches']} of {report['compared']} sentences differ. Using '{engine}'.")
+    report['engine'] = engine
+    selections[key] = report
+    try:
+        with AtomicWriter(selection_file) as f:
+            json.dump(selections, f, indent=2)
+    except OSError as e:
+        print(f"Warning: could not save parser selection '{selection_file}': {e}")
+    return engine
+
+
+def spread_sample(token_lists, size):
+    """Up to `size` non-empty token lists spread evenly over the corpus."""
+    token_lists = [tokens for tokens in token_lists if tokens]
+    if size <= 0 or len(token_lists) <= size:
+        return token_lists
+    step = len(token_lists) / size
+    return [token_lists[int(i * step)] for i in range(size)]
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark the Earley backend against nltk's ChartParser and record the faster engine.")
+    arg_parser.add_argument('corpus', nargs='?', default='Appendix_A_Parallel_Corpus_Tagalog_English.tsv')
+    arg_parser.add_argument('--sample', type=int, default=DEFAULT_SAMPLE_SIZE,
+                            help="Sentences to parse, spread over the corpus (0 = all).")
+    arg_parser.add_argument('--selection', default=DEFAULT_SELECTION_FILE)
+    arg_parser.add_argument('--grammar', default='Appendix_D_Resource_Grammar_Tagalog_CFG.cfg')
+    arg_parser.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+    arg_parser.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET)
+    arg_parser.add_argument('--edge-budget', type=int, default=DEFAULT_EDGE_BUDGET)
+    arg_parser.add_argument('--skeletons', action='store_true',
+                            help="Benchmark the distinct POS skeletons against the skeleton grammar, as "
+                                 "skeleton-cache and --stream runs parse them.")
+    args = arg_parser.parse_args(argv)
+
+    token_lists = read_corpus_tokens([args.corpus])
+    grammar_cfg = load_grammar(args.grammar)
+    corpus_tokens = sorted(set(t for tokens in token_lists for t in tokens if t))
+    productions, _ = build_productions(grammar_cfg, load_lexicon(args.lexicon), corpus_tokens)
+    grammar = CFG(grammar_cfg.start(), productions)
+    terminals = set(prod.rhs()[0] for prod in productions if prod.is_lexical())
+    if args.skeletons:
+        cache = SkeletonCache(grammar)
+        grammar, terminals = cache.grammar, cache.known_terminals
+        token_lists = [list(skeleton) for skeleton in
+                       dict.fromkeys(tuple(cache.signature(token) for token in tokens) for tokens in token_lists)]
+    engine = select_engine(grammar, token_lists, terminals, args.selection, args.sample,
+                           args.time_budget, args.edge_budget, force=True, skeletons=args.skeletons)
+    report = load_selection(args.selection)[grammar_key(grammar.productions(), grammar.start(), args.skeletons)]
+    print(f"{report['compared']} sentences compared ({report['budget_limited']} skipped for budgets), "
+          f"{report['same_first_tree']} with the same first tree.")
+    for example in report['mismatch_examples']:
+        print(f"  differs: {example}")
+    print(f"Selected '{engine}'; recorded in {args.selection}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
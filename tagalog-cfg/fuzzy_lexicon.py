@@ -0,0 +1,222 @@
+import argparse
+import string
+import sys
+import time
+
+from translator_core import load_lexicon, load_dictionary, tokenize_sentence, simple_lexical_translate
+
+# Fuzzy resolution of unknown tokens (SymSpell deletion index).
+# Misspellings and spelling variants (kumakin, salamt, nagaaral for
+# nag-aaral) are unknown tokens that become a default N and are translated
+# as [word]. Every lexicon and dictionary word is indexed under each string
+# obtained by deleting up to `max_distance` of its letters; an unknown
+# token's own deletions then find every known word within that edit
+# distance through dictionary lookups alone, and only those candidates get
+# a full (Damerau-)Levenshtein check. Case and the punctuation left on a
+# token by the whitespace tokenizer (bukas., ako,) are ignored. Short
+# tokens allow fewer edits, as a single edit turns most short words into
+# another word. Lookups are cached per token.
+
+DEFAULT_MAX_DISTANCE = 2
+# Letters per allowed edit beyond the first four: 5-8 letter tokens allow
+# one edit, 9 or more two, shorter ones none.
+LETTERS_PER_EDIT = 4
+_PUNCTUATION = string.punctuation + '“”‘’'
+
+
+def _deletes(word, distance):
+    """`word` and every string obtained by deleting up to `distance` letters from it."""
+    found = {word}
+    frontier = [word]
+    for _ in range(distance):
+        next_frontier = []
+        for form in frontier:
+            for i in range(len(form)):
+                shorter = form[:i] + form[i + 1:]
+                if shorter not in found:
+                    found.add(shorter)
+                    next_frontier.append(shorter)
+        frontier = next_frontier
+    return found
+
+
+def edit_distance(a, b, limit):
+    """
+    Optimal string alignment distance (insertions, deletions, substitutions
+    and adjacent transpositions) between `a` and `b`, or limit + 1 if it
+    is larger than `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2]
+                    and a[i - 2] == b[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+class FuzzyIndex:
+    """
+    Deletion index over known words (lexicon words, then dictionary keys).
+    lookup() returns the nearest known word within the allowed distance,
+    ties going to the word listed first.
+    """
+
+    def __init__(self, words, max_distance=DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._words = list(dict.fromkeys(words))
+        self._order = {word: i for i, word in enumerate(self._words)}
+        # Lowercased spelling -> first known word with it; the lexicon has some capitalized entries.
+        self._folded = {}
+        for word in self._words:
+            self._folded.setdefault(word.lower(), word)
+        self._deleted = {}
+        for folded in self._folded:
+            for form in _deletes(folded, max_distance):
+                self._deleted.setdefault(form, []).append(folded)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._words)
+
+    def is_known(self, word):
+        return word in self._order
+
+    def allowed_distance(self, word):
+        return min(self.max_distance, (len(word) - 1) // LETTERS_PER_EDIT)
+
+    def lookup(self, word):
+        """
+        (nearest known word, distance), (word, 0) for a known word, or None.
+        Case and surrounding punctuation do not count as edits. Cached per word.
+        """
+        try:
+            return self._cache[word]
+        except KeyError:
+            pass
+        core = word.strip(_PUNCTUATION).lower()
+        if word in self._order:
+            result = (word, 0)
+        elif core in self._folded:
+            result = (self._folded[core], 0)
+        else:
+            result = None
+            limit = self.allowed_distance(core)
+            if limit:
+                candidates = set()
+                for form in _deletes(core, limit):
+                    candidates.update(self._deleted.get(form, ()))
+                best = None
+                for candidate in candidates:
+                    distance = edit_distance(core, candidate, limit)
+                    if distance <= limit:
+                        key = (distance, self._order[self._folded[candidate]])
+                        if best is None or key < best:
+                            best = key
+                if best is not None:
+                    result = (self._words[best[1]], best[0])
+        self._cache[word] = result
+        return result
+
+
+class FuzzyResolver:
+    """
+    Resolves tokens missing from a lexicon ([(pos, word)]) and dictionary
+    ({word: english}) to the tags and translation of their nearest known
+    word. For the batch pipeline, extend_lexicon() and extend_dictionary()
+    add entries for a whole vocabulary; for a single sentence, translate()
+    resolves its tokens on the fly.
+    """
+
+    def __init__(self, lexicon_data, dictionary, max_distance=DEFAULT_MAX_DISTANCE):
+        self._tags = {}
+        for pos, word in lexicon_data:
+            tags = self._tags.setdefault(word, [])
+            if pos not in tags:
+                tags.append(pos)
+        self._dictionary = dictionary
+        self.index = FuzzyIndex(list(self._tags) + list(dictionary), max_distance)
+
+    def resolve(self, token):
+        """The known word `token` stands for (itself if known), or None."""
+        match = self.index.lookup(token)
+        return match[0] if match is not None else None
+
+    def extend_lexicon(self, words):
+        """Lexicon entries (pos, word) for unknown words of `words` whose nearest known word has tags."""
+        entries = []
+        for word in words:
+            if word not in self._tags:
+                nearest = self.resolve(word)
+                entries.extend((pos, word) for pos in self._tags.get(nearest, ()))
+        return entries
+
+    def extend_dictionary(self, words):
+        """Copy of the dictionary with an entry for every word of `words` whose nearest known word has one."""
+        extended = dict(self._dictionary)
+        for word in words:
+            if word not in extended:
+                nearest = self.resolve(word)
+                if nearest in self._dictionary:
+                    extended[word] = self._dictionary[nearest]
+        return extended
+
+    def translate(self, sentence):
+        """Word-by-word translation of one sentence, unknown tokens read as their nearest known word."""
+        tokens = tokenize_sentence(sentence)
+        return simple_lexical_translate([self.resolve(token) or token for token in tokens], self._dictionary)
+
+
+def main(argv=None):
+    from pcfg_model import read_corpus_tokens
+    arg_parser = argparse.ArgumentParser(description="Resolve unknown tokens to their nearest lexicon words.")
+    arg_parser.add_argument('command', choices=['coverage', 'translate'])
+    arg_parser.add_argument('sentence', nargs='*', help="Sentence to translate ('translate').")
+    arg_parser.add_argument('--corpus', default='Sentence pairs in Tagalog-English (UNREDUCED).tsv')
+    arg_parser.add_argument('--max-distance', type=int, default=DEFAULT_MAX_DISTANCE)
+    arg_parser.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+    arg_parser.add_argument('--dictionary', default='Appendix_C_Resource_Dictionary_Tagalog_English.json')
+    args = arg_parser.parse_args(argv)
+
+    lexicon_data = load_lexicon(args.lexicon)
+    dictionary = load_dictionary(args.dictionary)
+    start_time = time.perf_counter()
+    resolver = FuzzyResolver(lexicon_data, dictionary, args.max_distance)
+    print(f"Indexed {len(resolver.index)} known words in {time.perf_counter() - start_time:.2f}s.")
+    if args.command == 'translate':
+        sentence = ' '.join(args.sentence)
+        for token in tokenize_sentence(sentence):
+            nearest = resolver.resolve(token)
+            if nearest is not None and nearest != token:
+                print(f"  {token} -> {nearest}")
+        print(resolver.translate(sentence))
+        return 0
+
+    tokens = [token for tokens in read_corpus_tokens([args.corpus]) for token in tokens]
+    unknown = sorted(set(token for token in tokens if not resolver.index.is_known(token)))
+    start_time = time.perf_counter()
+    resolved = {token: resolver.resolve(token) for token in unknown}
+    seconds = time.perf_counter() - start_time
+    occurrences = [token for token in tokens if token in resolved]
+    hits = [token for token in occurrences if resolved[token] is not None]
+    print(f"{len(unknown)} distinct unknown tokens looked up in {seconds:.2f}s "
+          f"({seconds / max(len(unknown), 1) * 1000:.3f} ms each); "
+          f"{sum(nearest is not None for nearest in resolved.values())} resolved, "
+          f"covering {len(hits)} of {len(occurrences)} unknown token occurrences.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+from nltk import Production, Tree
+
+from translator_core import finish_translation
+
+# Integer-ID token pipeline.
+# Words are mapped to IDs once, through the corpus Vocabulary, and the
+# lexical productions are rewritten to use those IDs as terminals. The
+# parser, rewrite() and the dictionary lookup then only see ints, and
+# strings are materialized from the vocabulary at output time.
+
+
+def to_id_productions(productions, vocabulary):
+    """
+    Copies of `productions` whose single-terminal lexical rules use
+    vocabulary IDs as terminals. The result is aligned with the input, so
+    per-production data (e.g. PCFG probabilities) can be carried over.
+    """
+    id_productions = []
+    for prod in productions:
+        rhs = prod.rhs()
+        if prod.is_lexical() and len(rhs) == 1:
+            prod = Production(prod.lhs(), [vocabulary.intern(rhs[0])])
+        id_productions.append(prod)
+    return id_productions
+
+
+class IdTranslator:
+    """
+    simple_lexical_translate over token IDs. The rendered English of every
+    vocabulary ID ('' for words the dictionary maps to nothing, '[word]' for
+    words it lacks) is computed once, so translating a sentence is a list
+    lookup per token.
+    """
+
+    def __init__(self, dictionary, vocabulary):
+        self._dictionary = dictionary
+        self._vocabulary = vocabulary
+        self._rendered = []
+        self._extend()
+
+    def _extend(self):
+        for word_id in range(len(self._rendered), len(self._vocabulary)):
+            word = self._vocabulary.word(word_id)
+            self._rendered.append(self._dictionary.get(str(word).lower(), f"[{word}]"))
+
+    def rendered(self, word_id):
+        if word_id >= len(self._rendered):
+            self._extend()
+        return self._rendered[word_id]
+
+    def translate(self, token_ids):
+        rendered = self._rendered
+        if any(word_id >= len(rendered) for word_id in token_ids):
+            self._extend()
+        return finish_translation([rendered[word_id] for word_id in token_ids if rendered[word_id]])
+
+
+def decode_words(token_ids, vocabulary):
+    word = vocabulary.word
+    return [word(word_id) for word_id in token_ids]
+
+
+def decode_tree(tree, vocabulary):
+    """Copy of an ID-leaved tree with the words put back in."""
+    if not isinstance(tree, Tree):
+        return vocabulary.word(tree)
+    return Tree(tree.label(), [decode_tree(child, vocabulary) for child in tree])
+
+
+def encode_tree(tree, vocabulary):
+    """Copy of a word-leaved tree with vocabulary IDs as leaves."""
+    if not isinstance(tree, Tree):
+        return vocabulary.intern(tree)
+    return Tree(tree.label(), [encode_tree(child, vocabulary) for child in tree])
+
+
+def decode_chunks(chunks, vocabulary):
+    return [decode_tree(chunk, vocabulary) for chunk in chunks]
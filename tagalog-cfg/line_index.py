@@ -0,0 +1,196 @@
+import argparse
+import hashlib
+import io
+import mmap
+import os
+import sys
+import time
+
+import numpy as np
+
+# Line-offset index for the corpus TSV files.
+# Taking rows 30000-31000 of a corpus with pd.read_csv still reads and
+# parses every row before them. The index is the byte offset of every
+# (non-blank) row, found once with a memory-mapped scan for newlines and
+# stored beside the corpus as '<corpus>.idx'. It is loaded memory-mapped
+# as well, so opening it costs nothing per row; a row range is then one
+# seek and one read of exactly its bytes, and the file can be cut into
+# byte-balanced shards on row boundaries for workers. The index records
+# the corpus size and modification time and is rebuilt when they change.
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = 0x5844494C474154  # 'TAGLIDX'
+INDEX_VERSION = 1
+_HEADER = 4
+CORPUS_COLUMNS = ['tgl_id', 'Tagalog Phrase/Sentence', 'eng_id', 'English Translation']
+
+
+def scan_offsets(path):
+    """
+    Start offsets of the non-blank lines of `path`, followed by the file
+    size, as a uint64 array. Blank lines are skipped as pd.read_csv skips
+    them, so row i of the file is row i of its DataFrame.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return np.zeros(1, dtype=np.uint64)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = np.frombuffer(mapped, dtype=np.uint8)
+            ends = np.flatnonzero(data == ord('\n')) + 1
+            if ends.size == 0 or ends[-1] != size:
+                ends = np.append(ends, size)
+            starts = np.r_[0, ends[:-1]]
+            # Only lines of at most two bytes ('\n', '\r\n') can be blank.
+            short = np.flatnonzero(ends - starts <= 2)
+            blank = [i for i in short if not data[starts[i]:ends[i]].tobytes().strip(b'\r\n')]
+            del data
+    if blank:
+        starts = np.delete(starts, blank)
+    return np.append(starts, size).astype(np.uint64)
+
+
+def default_index_path(path):
+    return path + INDEX_SUFFIX
+
+
+class LineIndex:
+    """Row offsets of a corpus file: O(1) access to any row range and byte-balanced shards."""
+
+    def __init__(self, path, offsets):
+        self.path = path
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, path, index_path=None):
+        """Scans `path` and writes its index (to `<path>.idx` by default)."""
+        from corpus_ingest import AtomicWriter
+        stat = os.stat(path)
+        offsets = scan_offsets(path)
+        header = np.array([INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.uint64)
+        try:
+            with AtomicWriter(index_path or default_index_path(path), binary=True) as f:
+                np.save(f, np.concatenate([header, offsets]))
+        except OSError as e:
+            print(f"Warning: could not write the line index for '{path}' ({e}); keeping it in memory.")
+        return cls(path, offsets)
+
+    @classmethod
+    def open(cls, path, index_path=None):
+        """The stored index of `path`, built first if it is missing or out of date."""
+        index_path = index_path or default_index_path(path)
+        stat = os.stat(path)
+        try:
+            stored = np.load(index_path, mmap_mode='r')
+        except (OSError, ValueError):
+            stored = None
+        if (stored is not None and stored.ndim == 1 and len(stored) > _HEADER
+                and tuple(int(value) for value in stored[:_HEADER])
+                == (INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns)):
+            return cls(path, stored[_HEADER:])
+        return cls.build(path, index_path)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _check_range(self, start, stop):
+        if not 0 <= start <= stop <= len(self):
+            raise IndexError(f"row range {start}:{stop} is outside 0:{len(self)} of '{self.path}'")
+
+    def byte_range(self, start, stop):
+        """(first byte, end byte) of rows start..stop-1."""
+        self._check_range(start, stop)
+        return int(self.offsets[start]), int(self.offsets[stop])
+
+    def read_bytes(self, start, stop):
+        """The raw bytes of rows start..stop-1."""
+        first, end = self.byte_range(start, stop)
+        with open(self.path, 'rb') as f:
+            f.seek(first)
+            return f.read(end - first)
+
+    def read_lines(self, start, stop):
+        """Rows start..stop-1 as lists of tab-separated fields, without pandas."""
+        text = self.read_bytes(start, stop).decode('utf-8-sig' if start == 0 else 'utf-8')
+        return [line.split('\t') for line in text.splitlines() if line]
+
+    def read_frame(self, start, stop, names=CORPUS_COLUMNS):
+        """Rows start..stop-1 as the DataFrame pd.read_csv gives for them in the whole file."""
+        import pandas as pd
+        data = self.read_bytes(start, stop)
+        if not data:
+            return pd.DataFrame(columns=names)
+        return pd.read_csv(io.BytesIO(data), sep='\t', header=None, names=names)
+
+    def fingerprint(self, start, stop):
+        """Digest of the bytes of rows start..stop-1 and of the range itself."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{start}:{stop}:".encode('ascii'))
+        digest.update(self.read_bytes(start, stop))
+        return digest.hexdigest()
+
+    def shards(self, count):
+        """
+        `count` consecutive (start row, stop row) ranges with about the same
+        number of bytes each; ranges can be empty for tiny files.
+        """
+        if count < 1:
+            raise ValueError("the shard count must be at least 1")
+        size = int(self.offsets[-1])
+        targets = np.array([size * k // count for k in range(1, count)], dtype=np.uint64)
+        cuts = [0] + np.searchsorted(self.offsets, targets).tolist() + [len(self)]
+        cuts = [min(cut, len(self)) for cut in cuts]
+        return [(cuts[k], max(cuts[k], cuts[k + 1])) for k in range(count)]
+
+
+def parse_row_range(text):
+    """'START:STOP' (either part may be left out) as a (start, stop) pair; stop None means the end."""
+    start_text, separator, stop_text = text.partition(':')
+    if not separator:
+        raise argparse.ArgumentTypeError(f"expected START:STOP, got '{text}'")
+    try:
+        start = int(start_text) if start_text else 0
+        stop = int(stop_text) if stop_text else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected START:STOP with row numbers, got '{text}'")
+    if start < 0 or (stop is not None and stop < start):
+        raise argparse.ArgumentTypeError(f"invalid row range '{text}'")
+    return start, stop
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Line-offset index and shards of a corpus TSV file.")
+    arg_parser.add_argument('command', choices=['build', 'shards', 'rows'])
+    arg_parser.add_argument('corpus', nargs='?', default='Sentence pairs in Tagalog-English (UNREDUCED).tsv')
+    arg_parser.add_argument('--count', type=int, default=4, help="Number of shards ('shards').")
+    arg_parser.add_argument('--rows', type=parse_row_range, default=(0, 10), metavar='START:STOP',
+                            help="Rows to print ('rows').")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        if args.command == 'build':
+            start_time = time.perf_counter()
+            index = LineIndex.build(args.corpus)
+            print(f"Indexed {len(index)} rows of '{args.corpus}' in {time.perf_counter() - start_time:.3f}s; "
+                  f"written to '{default_index_path(args.corpus)}'.")
+            return 0
+        index = LineIndex.open(args.corpus)
+        if args.command == 'shards':
+            for number, (start, stop) in enumerate(index.shards(args.count)):
+                first, end = index.byte_range(start, stop)
+                print(f"shard {number}: rows {start}:{stop}, bytes {first}-{end} ({end - first} bytes)")
+        else:
+            start, stop = args.rows
+            for fields in index.read_lines(start, len(index) if stop is None else min(stop, len(index))):
+                print('\t'.join(fields))
+    except FileNotFoundError:
+        print(f"Error: File not found at '{args.corpus}'.")
+        return 1
+    except IndexError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
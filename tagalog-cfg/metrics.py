@@ -0,0 +1,183 @@
+import bisect
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics for the long-running translator (--stream --metrics-port).
+# Counters and fixed-bucket histograms are recorded into shards, one per
+# writing thread, so recording is a dict lookup and an in-place add with
+# no lock. A shard's cells are only ever written by its own thread; a
+# scrape copies every shard's dict and sums the series, so all the
+# aggregation and text formatting is paid for by the scrape, never by the
+# translation loop. Gauges are functions evaluated at scrape time. The
+# registry is served in the Prometheus text format on localhost.
+
+DEFAULT_METRICS_HOST = '127.0.0.1'
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(pairs, extra=()):
+    pairs = tuple(pairs) + tuple(extra)
+    if not pairs:
+        return ''
+    escaped = (f'{key}="' + str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') + '"'
+               for key, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def series(name, **labels):
+    """Key of one labeled series of a metric; callers on a hot path build it once."""
+    return (name,) + tuple(sorted(labels.items()))
+
+
+class MetricsShard:
+    """Metric cells written by one thread only; `key`s come from series()."""
+
+    def __init__(self, registry):
+        self._registry = registry
+        self.cells = {}
+
+    def inc(self, key, amount=1):
+        cells = self.cells
+        cells[key] = cells.get(key, 0) + amount
+
+    def observe(self, key, value):
+        bounds = self._registry.buckets(key[0])
+        cells = self.cells.get(key)
+        if cells is None:
+            # Bucket counts (not cumulative), the +Inf bucket, then the sum.
+            cells = self.cells[key] = [0] * (len(bounds) + 2)
+        cells[bisect.bisect_left(bounds, value)] += 1
+        cells[-1] += value
+
+
+class MetricsRegistry:
+    """Declared metrics, their shards and the Prometheus text exposition."""
+
+    def __init__(self):
+        self._declared = {}
+        self._gauges = {}
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def counter(self, name, help_text):
+        self._declared[name] = ('counter', help_text, ())
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._declared[name] = ('histogram', help_text, tuple(sorted(buckets)))
+
+    def gauge(self, name, help_text, function):
+        """A gauge whose value is function() at scrape time."""
+        self._declared[name] = ('gauge', help_text, ())
+        self._gauges[name] = function
+
+    def buckets(self, name):
+        return self._declared[name][2]
+
+    def shard(self):
+        """A new shard for the calling thread to record into."""
+        shard = MetricsShard(self)
+        with self._shards_lock:
+            self._shards.append(shard)
+        return shard
+
+    def collect(self):
+        """{series key: summed value or cells} over all shards."""
+        with self._shards_lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            # dict.copy() runs without yielding the GIL, so a writer can add series meanwhile.
+            for key, value in shard.cells.copy().items():
+                if isinstance(value, list):
+                    value = list(value)
+                    total = totals.get(key)
+                    totals[key] = value if total is None else [a + b for a, b in zip(total, value)]
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def exposition(self):
+        """All metrics in the Prometheus text format."""
+        totals = self.collect()
+        by_name = {}
+        for key, value in totals.items():
+            by_name.setdefault(key[0], []).append((key[1:], value))
+        lines = []
+        for name, (kind, help_text, buckets) in self._declared.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'gauge':
+                lines.append(f'{name} {_format_value(self._gauges[name]())}')
+                continue
+            for labels, value in sorted(by_name.get(name, ()), key=lambda item: item[0]):
+                if kind == 'counter':
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), value[:-1]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels, (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-1])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(registry, port, host=DEFAULT_METRICS_HOST):
+    """
+    Serves `registry` at http://host:port/metrics from a daemon thread and
+    returns the server (port 0 picks a free port: server.server_address).
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    import argparse
+    import urllib.request
+    arg_parser = argparse.ArgumentParser(description="Print the metrics of a translator running with --metrics-port.")
+    arg_parser.add_argument('port', type=int)
+    arg_parser.add_argument('--host', default=DEFAULT_METRICS_HOST)
+    args = arg_parser.parse_args(argv)
+    try:
+        with urllib.request.urlopen(f'http://{args.host}:{args.port}/metrics', timeout=5) as response:
+            print(response.read().decode('utf-8'), end='')
+    except OSError as e:
+        print(f"Error: could not read metrics from {args.host}:{args.port}: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
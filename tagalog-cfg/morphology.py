@@ -0,0 +1,281 @@
+import argparse
+import sys
+
+from translator_core import load_lexicon, load_dictionary
+
+# Affix-stripping morphological analyzer.
+# The lexicon and dictionary list inflected forms (kumain, nagluto,
+# magdadala) and linker forms (kong, siyang, magandang) one by one, and any
+# other form of the same root is an unknown token that becomes a default
+# N. Every known word and every unknown token is reduced to its candidate
+# roots by stripping, a few times over, the common verbal prefixes, the
+# -um-/-in- infixes, the -in/-an suffixes, first-syllable reduplication,
+# the -ng linker and the 'y contraction of ay. An unknown token then
+# inherits the tags and translation of the known words that share its
+# nearest root (fewest affixes stripped). The tables are built once from
+# the lexicon, and analyses are memoized, so a corpus pays for each
+# distinct word once and nothing per token.
+
+VOWELS = frozenset('aeiou')
+MIN_ROOT = 3
+MAX_STEPS = 3
+DEFAULT_COMPACT_FILE = 'lexicon_compact.tsv'
+
+# Longest first, so mag- is not read as ma- + g.
+_PREFIXES = (
+    'nakikipag', 'makikipag', 'pinaka', 'nakaka', 'makaka', 'ipinag', 'ipina', 'nagpa', 'magpa',
+    'nagka', 'magka', 'pinag', 'naka', 'maka', 'mang', 'nang', 'pang', 'mag', 'nag', 'ipa', 'paki',
+    'um', 'in', 'pa', 'ma', 'na', 'ka', 'i',
+)
+_SUFFIXES = (('hin', 'in'), ('nin', 'in'), ('in', 'in'), ('han', 'an'), ('nan', 'an'), ('an', 'an'))
+_INFIXES = ('um', 'in')
+
+
+def _strip_once(word):
+    """(stem, feature) for every single affix that can be removed from `word`."""
+    stems = []
+    if word.endswith("'y"):
+        stems.append((word[:-2], 'ay'))
+    if '-' in word:
+        stems.append((word.replace('-', ''), 'hyphen'))
+    if len(word) > MIN_ROOT + 1 and word.endswith('ng'):
+        if word[-3] in VOWELS:
+            stems.append((word[:-2], 'linker'))
+        elif word[-3] == 'n':
+            stems.append((word[:-1], 'linker'))
+    for prefix in _PREFIXES:
+        if word.startswith(prefix):
+            stems.append((word[len(prefix):], prefix))
+    if word[:1] not in VOWELS and word[1:3] in _INFIXES:
+        stems.append((word[0] + word[3:], word[1:3]))
+    for suffix, feature in _SUFFIXES:
+        if word.endswith(suffix):
+            stem = word[:-len(suffix)]
+            stems.append((stem, feature))
+            # A root's last o is written u before a suffix: inumin <- inom.
+            if stem[-2:-1] == 'u':
+                stems.append((stem[:-2] + 'o' + stem[-1], feature))
+    if word[:1] in VOWELS and word[1:2] == word[:1]:
+        stems.append((word[1:], 'redup'))
+    elif word[:1] not in VOWELS and word[1:2] in VOWELS and word[2:4] == word[:2]:
+        stems.append((word[2:], 'redup'))
+    # Roots have at least two syllables; shorter stems match unrelated words (nating -> ting).
+    return [(stem, feature) for stem, feature in stems
+            if len(stem) >= MIN_ROOT and sum(letter in VOWELS for letter in stem) >= 2]
+
+
+def candidate_roots(word):
+    """
+    {root: features stripped} for `word` and every stem reachable in up to
+    MAX_STEPS affix removals, nearest first; `word` itself maps to ().
+    """
+    roots = {word: ()}
+    frontier = [word]
+    for _ in range(MAX_STEPS):
+        next_frontier = []
+        for form in frontier:
+            for stem, feature in _strip_once(form):
+                if stem not in roots:
+                    roots[stem] = roots[form] + (feature,)
+                    next_frontier.append(stem)
+        frontier = next_frontier
+    return roots
+
+
+class MorphAnalyzer:
+    """
+    Maps words missing from a lexicon ([(pos, word)]) and dictionary
+    ({word: english}) to the known words that share their nearest root.
+    """
+
+    def __init__(self, lexicon_data, dictionary=None):
+        self._tags = {}
+        for pos, word in lexicon_data:
+            tags = self._tags.setdefault(word, [])
+            if pos not in tags:
+                tags.append(pos)
+        self._dictionary = dictionary if dictionary is not None else {}
+        # root -> known words with that candidate root, in lexicon then dictionary order.
+        self._roots = {}
+        known = list(self._tags) + [word for word in self._dictionary if word not in self._tags]
+        for word in known:
+            for root in candidate_roots(word.lower()):
+                self._roots.setdefault(root, []).append(word)
+        self._cache = {}
+
+    def is_known(self, word):
+        return word in self._tags or word in self._dictionary
+
+    def analyze(self, word):
+        """
+        (root, features, known words) for an unknown word, or None if it
+        has no root in common with a known word. Memoized.
+        """
+        try:
+            return self._cache[word]
+        except KeyError:
+            pass
+        analysis = None
+        for root, features in candidate_roots(word.lower()).items():
+            sources = self._roots.get(root)
+            if features and sources:
+                analysis = (root, features, tuple(sources))
+                break
+        self._cache[word] = analysis
+        return analysis
+
+    def _inherited_tags(self, sources):
+        tags = []
+        for source in sources:
+            for pos in self._tags.get(source, ()):
+                if pos not in tags:
+                    tags.append(pos)
+        return tags
+
+    def tags(self, word):
+        """Lexicon tags of `word`, or those inherited through its root; [] if there are none."""
+        if word in self._tags:
+            return list(self._tags[word])
+        analysis = self.analyze(word)
+        return self._inherited_tags(analysis[2]) if analysis is not None else []
+
+    def inherited_tag_sets(self):
+        """Every distinct non-empty tag list tags() can give a word through its root."""
+        tag_sets = {}
+        for sources in self._roots.values():
+            tags = tuple(self._inherited_tags(sources))
+            if tags:
+                tag_sets[tags] = None
+        return list(tag_sets)
+
+    def translation(self, word):
+        """Dictionary translation of `word`, or of the first known word sharing its root; None if neither."""
+        if word in self._dictionary:
+            return self._dictionary[word]
+        analysis = self.analyze(word)
+        if analysis is not None:
+            for source in analysis[2]:
+                if source in self._dictionary:
+                    return self._dictionary[source]
+        return None
+
+    def extend_lexicon(self, words):
+        """Lexicon entries (pos, word) for the words of `words` that are not in the lexicon but have a root in it."""
+        return [(pos, word) for word in words if word not in self._tags for pos in self.tags(word)]
+
+    def extend_dictionary(self, words):
+        """Copy of the dictionary with an entry for every word of `words` that gets a translation through its root."""
+        extended = dict(self._dictionary)
+        for word in words:
+            if word not in extended:
+                translation = self.translation(word)
+                if translation is not None:
+                    extended[word] = translation
+        return extended
+
+
+def compact_lexicon(lexicon_data, dictionary=None, corpus_words=()):
+    """
+    Entries of `lexicon_data` to keep so that MorphAnalyzer(kept entries,
+    dictionary) gives every dropped word exactly its tags, and every word of
+    `corpus_words` the tags and translation it gets with the full lexicon.
+    Shorter words are kept first, as they are the closest to their roots.
+    """
+    words = list(dict.fromkeys(word for pos, word in lexicon_data))
+    original = MorphAnalyzer(lexicon_data, dictionary)
+    order = sorted(range(len(words)), key=lambda i: (len(words[i]), i))
+    kept = set()
+    kept_entries = []
+    analyzer = MorphAnalyzer([], dictionary)
+    for i in order:
+        word = words[i]
+        if analyzer.tags(word) != original.tags(word):
+            kept.add(word)
+            kept_entries = [(pos, w) for pos, w in lexicon_data if w in kept]
+            analyzer = MorphAnalyzer(kept_entries, dictionary)
+    # Words kept later can shadow the root an earlier dropped word was matched on,
+    # and a corpus word needs every lexicon word it was matched to, in the same order.
+    lexicon_words = set(words)
+    corpus_words = [word for word in dict.fromkeys(corpus_words) if word not in lexicon_words]
+    while True:
+        lost = set(word for word in words if word not in kept and analyzer.tags(word) != original.tags(word))
+        for word in corpus_words:
+            analysis = original.analyze(word)
+            if analysis is not None and (analyzer.tags(word), analyzer.translation(word)) != \
+                    (original.tags(word), original.translation(word)):
+                lost.update(source for source in analysis[2] if source in lexicon_words)
+        lost -= kept
+        if not lost:
+            return kept_entries
+        kept.update(lost)
+        kept_entries = [(pos, w) for pos, w in lexicon_data if w in kept]
+        analyzer = MorphAnalyzer(kept_entries, dictionary)
+
+
+def coverage_report(lexicon_data, dictionary, token_lists):
+    """Unknown-token rates of a corpus without and with the analyzer."""
+    analyzer = MorphAnalyzer(lexicon_data, dictionary)
+    words = set(word for pos, word in lexicon_data)
+    tokens = [token for tokens in token_lists for token in tokens]
+    unknown = [token for token in tokens if token not in words]
+    analyzed = [token for token in unknown if analyzer.tags(token)]
+    untranslated = [token for token in tokens if token not in dictionary]
+    translated = [token for token in untranslated if analyzer.translation(token) is not None]
+    return {
+        'tokens': len(tokens),
+        'unknown': len(unknown),
+        'analyzed': len(analyzed),
+        'untranslated': len(untranslated),
+        'translated': len(translated),
+        'distinct_analyzed': len(set(analyzed)),
+    }
+
+
+def main(argv=None):
+    from pcfg_model import read_corpus_tokens
+    arg_parser = argparse.ArgumentParser(description="Tagalog affix-stripping analyzer for the lexicon.")
+    arg_parser.add_argument('command', choices=['coverage', 'compact', 'analyze'])
+    arg_parser.add_argument('words', nargs='*', help="Words to analyze ('analyze').")
+    arg_parser.add_argument('--corpus', nargs='+', default=['Sentence pairs in Tagalog-English (UNREDUCED).tsv',
+                                                            'Appendix_A_Parallel_Corpus_Tagalog_English.tsv'],
+                            help="Corpora whose words 'coverage' counts and 'compact' keeps resolving as before.")
+    arg_parser.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+    arg_parser.add_argument('--dictionary', default='Appendix_C_Resource_Dictionary_Tagalog_English.json')
+    arg_parser.add_argument('--output', default=DEFAULT_COMPACT_FILE,
+                            help="Where 'compact' writes the lexicon without derivable entries.")
+    args = arg_parser.parse_args(argv)
+
+    lexicon_data = load_lexicon(args.lexicon)
+    dictionary = load_dictionary(args.dictionary)
+    if args.command == 'analyze':
+        analyzer = MorphAnalyzer(lexicon_data, dictionary)
+        for word in args.words:
+            analysis = analyzer.analyze(word) if not analyzer.is_known(word) else (word, (), (word,))
+            if analysis is None:
+                print(f"{word}: no known root")
+                continue
+            root, features, sources = analysis
+            print(f"{word}: root '{root}' {'+'.join(features) or '(known)'} -> tags {analyzer.tags(word)}, "
+                  f"'{analyzer.translation(word)}' (from {', '.join(sources[:5])})")
+    elif args.command == 'coverage':
+        report = coverage_report(lexicon_data, dictionary, read_corpus_tokens(args.corpus))
+        print(f"{report['tokens']} tokens; {report['unknown']} not in the lexicon, of which "
+              f"{report['analyzed']} ({report['analyzed'] / max(report['unknown'], 1):.1%}, "
+              f"{report['distinct_analyzed']} distinct words) get tags through their root.")
+        print(f"{report['untranslated']} not in the dictionary, of which {report['translated']} "
+              f"({report['translated'] / max(report['untranslated'], 1):.1%}) get a translation through their root.")
+    else:
+        # --morphology analyzes with the dictionary too, whose words can be nearer roots.
+        kept = compact_lexicon(lexicon_data, dictionary,
+                               (token for tokens in read_corpus_tokens(args.corpus) for token in tokens))
+        import csv
+        from corpus_ingest import AtomicWriter
+        with AtomicWriter(args.output) as f:
+            csv.writer(f, delimiter='\t', lineterminator='\n').writerows(kept)
+        print(f"Kept {len(kept)} of {len(lexicon_data)} lexicon entries; the others get the same tags "
+              f"from the analyzer. Written to {args.output}; load it with --lexicon and --morphology.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+import gc
+import multiprocessing
+import time
+
+from nltk import ChartParser, Tree
+from nltk.parse.chart import Chart, LeafEdge
+
+from chunk_fallback import chunk_chart
+from rule_profiler import RuleProfile
+
+# Per-sentence parse budgets and corpus scheduling.
+# Chart parsing grows super-linearly with sentence length, so a single long
+# sentence from the UNREDUCED corpus can stall a whole run. Every sentence gets
+# a wall-time and a chart-edge budget; when either runs out the sentence is
+# recorded as "Budget Exceeded" instead of blocking the batch.
+
+STATUS_PARSED = 'Parsed'
+STATUS_NO_PARSE = 'No Parse'
+STATUS_NO_TOKENS = 'No Tokens'
+STATUS_UNKNOWN_TOKENS = 'Unknown Tokens'
+STATUS_TIME_EXCEEDED = 'Budget Exceeded (time)'
+STATUS_EDGES_EXCEEDED = 'Budget Exceeded (edges)'
+
+DEFAULT_TIME_BUDGET = 10.0
+DEFAULT_EDGE_BUDGET = 200_000
+
+# The clock is only read every few edges; time.perf_counter() is cheap but
+# not free, and edges are inserted in tight loops.
+CLOCK_CHECK_INTERVAL = 64
+
+
+class ParseBudgetExceeded(Exception):
+    def __init__(self, status, edges, chart=None):
+        super().__init__(status)
+        self.status = status
+        self.edges = edges
+        self.chart = chart
+
+
+class BudgetedChart(Chart):
+    """A Chart that raises ParseBudgetExceeded once it grows past its budget."""
+
+    def __init__(self, tokens, max_edges=None, deadline=None):
+        self._max_edges = max_edges
+        self._deadline = deadline
+        super().__init__(tokens)
+
+    def _append_edge(self, edge):
+        super()._append_edge(edge)
+        num_edges = len(self._edges)
+        if self._max_edges and num_edges > self._max_edges:
+            raise ParseBudgetExceeded(STATUS_EDGES_EXCEEDED, num_edges, self)
+        if self._deadline and num_edges % CLOCK_CHECK_INTERVAL == 0 and time.perf_counter() > self._deadline:
+            raise ParseBudgetExceeded(STATUS_TIME_EXCEEDED, num_edges, self)
+
+
+class BudgetedChartParser(ChartParser):
+    """
+    ChartParser with a wall-time budget (seconds) and a chart-edge budget.
+    A budget of None or 0 disables that limit.
+    """
+
+    def __init__(self, grammar, time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET, **kwargs):
+        self.time_budget = time_budget
+        self.edge_budget = edge_budget
+        super().__init__(grammar, chart_class=self._new_chart, **kwargs)
+
+    def _new_chart(self, tokens):
+        deadline = time.perf_counter() + self.time_budget if self.time_budget else None
+        return BudgetedChart(tokens, max_edges=self.edge_budget, deadline=deadline)
+
+
+def fill_chart(parser, tokens):
+    """Returns (chart, status); a chart that ran out of budget is returned partially filled."""
+    try:
+        return parser.chart_parse(tokens), None
+    except ParseBudgetExceeded as e:
+        return e.chart, e.status
+    except ValueError:
+        return None, STATUS_NO_PARSE
+
+
+def first_tree(chart, root):
+    """
+    The first tree chart.parses(root) lists, or None. Chart.parses builds
+    every tree of a root edge before returning any, and refuses (ValueError)
+    when there are too many (nltk.parse.chart.MAX_PARSE_TREES); here each
+    edge takes the trees of its first child-pointer list that has one.
+    """
+    for edge in chart.select(start=0, end=chart.num_leaves(), lhs=root):
+        tree = _first_tree(chart, edge, {})
+        if tree is not None:
+            return tree
+    return None
+
+
+def _first_tree(chart, edge, memo):
+    if edge in memo:
+        return memo[edge]
+    if edge.is_incomplete():
+        return None
+    if isinstance(edge, LeafEdge):
+        memo[edge] = chart.leaf(edge.start())
+        return memo[edge]
+    # As in Chart._trees, an edge reached again through a unary cycle has no tree yet.
+    memo[edge] = None
+    for child_pointers in chart.child_pointer_lists(edge):
+        children = []
+        for child in child_pointers:
+            subtree = _first_tree(chart, child, memo)
+            if subtree is None:
+                break
+            children.append(subtree)
+        else:
+            memo[edge] = Tree(edge.lhs().symbol(), children)
+            break
+    return memo[edge]
+
+
+def _known_runs(tokens, known_terminals):
+    """Yields (is_known, run) for maximal runs of known and unknown tokens."""
+    run, run_known = [], None
+    for token in tokens:
+        is_known = token in known_terminals
+        if run and is_known != run_known:
+            yield run_known, run
+            run = []
+        run.append(token)
+        run_known = is_known
+    if run:
+        yield run_known, run
+
+
+def parse_with_budget(parser, tokens, known_terminals=None, fallback=False, profile=None):
+    """
+    Parses one token list and returns (status, tree, elapsed_seconds, chunks).
+
+    The tree is the first one chart.parses() lists. nltk builds all the
+    trees of the first root edge to get it; when it refuses to for a highly
+    ambiguous sentence, the first tree is built alone (first_tree). With
+    `fallback`, a sentence without a full parse is split into chunks taken
+    from the chart that was already filled (see chunk_fallback.py);
+    otherwise `chunks` is None. Sentences with unknown tokens only have
+    their runs of known tokens charted, as the grammar cannot cover the
+    rest. With a RuleProfile as `profile`, the chart and tree are recorded
+    in it.
+    """
+    if not tokens:
+        return STATUS_NO_TOKENS, None, 0.0, None
+
+    start_time = time.perf_counter()
+    if known_terminals is not None and any(t not in known_terminals for t in tokens):
+        chunks = None
+        if fallback:
+            chunks = []
+            for is_known, run in _known_runs(tokens, known_terminals):
+                chart = fill_chart(parser, run)[0] if is_known else None
+                chunks.extend(chunk_chart(chart) if chart is not None else run)
+        elapsed = time.perf_counter() - start_time if fallback else 0.0
+        if profile is not None:
+            profile.record(None, None, elapsed)
+        return STATUS_UNKNOWN_TOKENS, None, elapsed, chunks
+
+    tree, chunks = None, None
+    chart, status = fill_chart(parser, tokens)
+    if chart is not None and status is None:
+        try:
+            tree = next(iter(chart.parses(parser.grammar().start())), None)
+        except ValueError:
+            tree = first_tree(chart, parser.grammar().start())
+        status = STATUS_PARSED if tree is not None else STATUS_NO_PARSE
+    elapsed = time.perf_counter() - start_time
+    if profile is not None:
+        profile.record(chart, tree, elapsed)
+    if tree is None and fallback:
+        chunks = chunk_chart(chart) if chart is not None else list(tokens)
+    return status, tree, elapsed, chunks
+
+
+# --- Corpus scheduling ---------------------------------------------------
+
+_worker_parser = None
+_worker_terminals = None
+_worker_fallback = False
+_worker_profile = None
+_worker_barrier = None
+_worker_words = None
+
+
+def _decode(token_ids, words):
+    return [words[i] for i in token_ids]
+
+
+def _init_worker(parser, known_terminals, fallback, barrier, words):
+    global _worker_parser, _worker_terminals, _worker_fallback, _worker_profile, _worker_barrier, _worker_words
+    _worker_parser = parser
+    _worker_terminals = known_terminals
+    _worker_fallback = fallback
+    _worker_profile = RuleProfile() if barrier is not None else None
+    _worker_barrier = barrier
+    _worker_words = words
+
+
+def _parse_task(task):
+    index, tokens = task
+    if _worker_words is not None:
+        tokens = _decode(tokens, _worker_words)
+    return (index,) + parse_with_budget(_worker_parser, tokens, _worker_terminals, _worker_fallback,
+                                        _worker_profile)
+
+
+def _collect_profile(_):
+    # Every worker blocks here until all of them hold one collection task,
+    # so each worker hands back its own counters exactly once.
+    _worker_barrier.wait()
+    return _worker_profile
+
+
+def longest_first(token_lists):
+    """Task order for a batch: longest sentences first, ties in corpus order."""
+    return sorted(range(len(token_lists)), key=lambda i: -len(token_lists[i]))
+
+
+def parse_corpus(token_lists, grammar, known_terminals=None, workers=1,
+                 time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET, fallback=False,
+                 make_parser=None, profile=None, vocabulary=None):
+    """
+    Parses every token list under the per-sentence budgets.
+
+    `make_parser(grammar, time_budget, edge_budget)` builds the parser; it
+    defaults to BudgetedChartParser. Any parser with the
+    `chart_parse`/`grammar` interface of nltk's ChartParser can be used.
+    The parser is built once, here, and forked workers inherit it instead
+    of each building their own copy.
+    When a RuleProfile is given, each worker profiles into its own counters,
+    which are merged into `profile` once at the end of the run.
+    With a corpus_columns.Vocabulary, `token_lists` are integer-ID sequences
+    that are only decoded to strings by the worker that parses them.
+
+    With several workers, sentences are handed out one at a time, longest
+    first, from a shared queue: the expensive sentences start early and idle
+    workers keep pulling the remaining short ones, so a straggler cannot
+    dominate the tail of the run. Returns a list of (status, tree, elapsed, chunks)
+    in corpus order.
+    """
+    results = [None] * len(token_lists)
+    words = vocabulary.words() if vocabulary is not None else None
+    if make_parser is None:
+        make_parser = BudgetedChartParser
+
+    if workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        print("Warning: Parallel parsing needs the 'fork' start method; parsing sequentially.")
+        workers = 1
+
+    parser = make_parser(grammar, time_budget, edge_budget)
+    if workers <= 1:
+        for i, tokens in enumerate(token_lists):
+            if words is not None:
+                tokens = _decode(tokens, words)
+            results[i] = parse_with_budget(parser, tokens, known_terminals, fallback, profile)
+        return results
+
+    tasks = [(i, token_lists[i]) for i in longest_first(token_lists)]
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(workers) if profile is not None else None
+    # Everything allocated so far (grammar, parser, corpus) moves to the
+    # permanent generation, so the workers' collections never visit those
+    # objects and never write to their headers: the pages stay shared with
+    # the parent instead of being copied into every worker.
+    gc.freeze()
+    try:
+        with ctx.Pool(workers, initializer=_init_worker,
+                      initargs=(parser, known_terminals, fallback, barrier, words)) as pool:
+            for index, *result in pool.imap_unordered(_parse_task, tasks, chunksize=1):
+                results[index] = tuple(result)
+            if profile is not None:
+                for worker_profile in pool.map(_collect_profile, range(workers), chunksize=1):
+                    profile.merge(worker_profile)
+    finally:
+        gc.unfreeze()
+    return results
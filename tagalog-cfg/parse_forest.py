@@ -0,0 +1,302 @@
+import argparse
+import csv
+import heapq
+import sys
+
+from nltk import CFG, Production, Tree
+from nltk.parse.chart import LeafEdge
+
+from translator_core import load_grammar, load_lexicon, build_productions, tokenize_sentence, rewrite_leaves
+from parse_budget import (BudgetedChartParser, fill_chart, STATUS_PARSED, STATUS_NO_PARSE, STATUS_NO_TOKENS,
+                          STATUS_UNKNOWN_TOKENS, DEFAULT_TIME_BUDGET, DEFAULT_EDGE_BUDGET)
+from pcfg_model import load_model, read_corpus_tokens, rule_log_probabilities
+from tree_serializer import serialize_tree
+
+# Packed shared parse forest.
+# The chart already holds every parse of a sentence in polynomial space:
+# one node per complete edge (rule and span) and, per node, the distinct
+# ways its children can be split. The forest keeps exactly that, so the
+# number of parses is counted by dynamic programming and the k best
+# derivations are extracted lazily (Huang & Chiang's "lazy k-best"),
+# without ever enumerating the trees. Unary cycles are cut the way nltk's
+# own tree enumeration cuts them, so the trees are the ones Chart.parses()
+# would list.
+
+DEFAULT_REPORT_FILE = 'ambiguity_report.csv'
+
+
+def _leaf(position):
+    return -1 - position
+
+
+class ParseForest:
+    """
+    Nodes are numbered; node i has `labels[i]`, `spans[i]` and
+    `alternatives[i]`, a list of (production, children) where each child is
+    a node number, or -1 - position for a leaf. The root is node 0, and
+    `order` lists the nodes children-first.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = list(tokens)
+        self.labels = []
+        self.spans = []
+        self.alternatives = []
+        self.order = []
+        self._counts = None
+        self._derivations = None
+        self._candidates = None
+        self._weights = None
+        self._weights_source = None
+
+    @classmethod
+    def from_chart(cls, chart, root):
+        """Forest of all complete `root` parses in an nltk chart, or None if there are none."""
+        n = chart.num_leaves()
+        root_edges = [edge for edge in chart.select(start=0, end=n, lhs=root, is_complete=True)]
+        if not root_edges:
+            return None
+
+        forest = cls(chart.leaves())
+        forest._add_node(root, 0, n)
+        for root_edge in root_edges:
+            # Like Chart.trees(), each root edge is expanded with its own
+            # memo, so the forest holds the same set of trees nltk would list.
+            forest.alternatives[0].extend(forest._expand(chart, root_edge, {}, {root_edge}))
+        forest.order.append(0)
+        forest._prune()
+        return forest
+
+    def _add_node(self, label, start, end):
+        self.labels.append(label)
+        self.spans.append((start, end))
+        self.alternatives.append([])
+        return len(self.labels) - 1
+
+    def _expand(self, chart, edge, node_ids, on_stack):
+        """Alternatives of `edge`; child edges become nodes (one per edge, shared through `node_ids`)."""
+        production = Production(edge.lhs(), edge.rhs())
+        alternatives = []
+        for pointers in chart.child_pointer_lists(edge):
+            children = []
+            for child in pointers:
+                if isinstance(child, LeafEdge):
+                    children.append(_leaf(child.start()))
+                    continue
+                if child in on_stack:
+                    # A unary cycle back to an edge being expanded.
+                    break
+                if child not in node_ids:
+                    node = node_ids[child] = self._add_node(child.lhs(), child.start(), child.end())
+                    on_stack.add(child)
+                    self.alternatives[node] = self._expand(chart, child, node_ids, on_stack)
+                    on_stack.discard(child)
+                    self.order.append(node)
+                children.append(node_ids[child])
+            else:
+                alternatives.append((production, tuple(children)))
+        return alternatives
+
+    def _prune(self):
+        # A child whose every alternative was cut at a cycle has no
+        # derivation; drop the alternatives that need it, to a fixed point.
+        changed = True
+        while changed:
+            changed = False
+            for node, alternatives in enumerate(self.alternatives):
+                kept = [alt for alt in alternatives
+                        if all(child < 0 or self.alternatives[child] for child in alt[1])]
+                if len(kept) != len(alternatives):
+                    self.alternatives[node] = kept
+                    changed = True
+
+    def __len__(self):
+        return len(self.labels)
+
+    def num_alternatives(self):
+        return sum(len(alternatives) for alternatives in self.alternatives)
+
+    def count(self):
+        """Number of distinct parse trees, computed without enumerating them."""
+        if self._counts is None:
+            counts = [None] * len(self)
+            for node in self.order:
+                total = 0
+                for production, children in self.alternatives[node]:
+                    product = 1
+                    for child in children:
+                        if child >= 0:
+                            product *= counts[child]
+                    total += product
+                counts[node] = total
+            self._counts = counts
+        return self._counts[0] if self._counts else 0
+
+    # --- Lazy k-best ---------------------------------------------------
+
+    def _score(self, node, alt_index, ranks):
+        production, children = self.alternatives[node][alt_index]
+        score = self._weights(production)
+        rank_iter = iter(ranks)
+        for child in children:
+            if child >= 0:
+                derivation = self._kth(child, next(rank_iter))
+                if derivation is None:
+                    return None
+                score += derivation[0]
+        return score
+
+    def _push(self, node, alt_index, ranks):
+        key = (alt_index, ranks)
+        candidates, seen = self._candidates[node]
+        if key in seen:
+            return
+        seen.add(key)
+        score = self._score(node, alt_index, ranks)
+        if score is not None:
+            heapq.heappush(candidates, (-score, alt_index, ranks))
+
+    def _kth(self, node, k):
+        """k-th best (score, alt_index, ranks) of `node`, or None."""
+        derivations = self._derivations[node]
+        if derivations is None:
+            derivations = self._derivations[node] = []
+            self._candidates[node] = ([], set())
+            for alt_index, (production, children) in enumerate(self.alternatives[node]):
+                self._push(node, alt_index, tuple(0 for child in children if child >= 0))
+        candidates = self._candidates[node][0]
+        while len(derivations) <= k and candidates:
+            neg_score, alt_index, ranks = heapq.heappop(candidates)
+            derivations.append((-neg_score, alt_index, ranks))
+            for i in range(len(ranks)):
+                self._push(node, alt_index, ranks[:i] + (ranks[i] + 1,) + ranks[i + 1:])
+        return derivations[k] if k < len(derivations) else None
+
+    def kbest(self, k, log_probs=None):
+        """
+        Yields up to `k` (score, tree) pairs, best first. With `log_probs`
+        (production -> log probability, e.g. from pcfg_model) the score is
+        the derivation's log probability; without it every derivation
+        scores 0 and they come out in chart order. Only the yielded trees
+        are built.
+        """
+        if log_probs is not None:
+            weights = lambda production: log_probs.get(production, 0.0)
+        else:
+            weights = lambda production: 0.0
+        if self._weights is None or self._weights_source is not log_probs:
+            self._weights = weights
+            self._weights_source = log_probs
+            self._derivations = [None] * len(self)
+            self._candidates = [None] * len(self)
+        for rank in range(k):
+            derivation = self._kth(0, rank)
+            if derivation is None:
+                return
+            yield derivation[0], self._tree(0, rank)
+
+    def best(self, log_probs=None):
+        """The best tree, ready for translator_core.rewrite(); None for an empty forest."""
+        return next((tree for score, tree in self.kbest(1, log_probs)), None)
+
+    def _tree(self, node, rank):
+        score, alt_index, ranks = self._kth(node, rank)
+        production, children = self.alternatives[node][alt_index]
+        rank_iter = iter(ranks)
+        return Tree(self.labels[node].symbol(), [
+            self._tree(child, next(rank_iter)) if child >= 0 else self.tokens[-1 - child]
+            for child in children
+        ])
+
+
+def parse_forest(parser, tokens, known_terminals=None):
+    """
+    Fills the chart for `tokens` and returns (status, forest), with the
+    same budgets and statuses as parse_budget.parse_with_budget; `forest`
+    is None unless the sentence parsed. `parser` must be an nltk chart
+    parser (e.g. BudgetedChartParser).
+    """
+    if not tokens:
+        return STATUS_NO_TOKENS, None
+    if known_terminals is not None and any(t not in known_terminals for t in tokens):
+        return STATUS_UNKNOWN_TOKENS, None
+    chart, status = fill_chart(parser, tokens)
+    if chart is None or status is not None:
+        return status, None
+    forest = ParseForest.from_chart(chart, parser.grammar().start())
+    return (STATUS_PARSED, forest) if forest is not None else (STATUS_NO_PARSE, None)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Report parse ambiguity from packed parse forests, without enumerating the trees.")
+    arg_parser.add_argument('sentences', nargs='*', help="Sentences to analyze (default: read --corpus).")
+    arg_parser.add_argument('--corpus', default='Appendix_A_Parallel_Corpus_Tagalog_English.tsv')
+    arg_parser.add_argument('--limit', type=int, default=None, help="Only analyze the first N corpus sentences.")
+    arg_parser.add_argument('--min-length', type=int, default=0, help="Skip sentences with fewer tokens.")
+    arg_parser.add_argument('-k', '--kbest', type=int, default=3, help="Derivations to print per sentence.")
+    arg_parser.add_argument('--pcfg', nargs='?', const='pcfg_rule_counts.json', default=None, metavar='MODEL',
+                            help="Rank derivations by rule log probabilities from MODEL.")
+    arg_parser.add_argument('--report', default=DEFAULT_REPORT_FILE)
+    arg_parser.add_argument('--grammar', default='Appendix_D_Resource_Grammar_Tagalog_CFG.cfg')
+    arg_parser.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+    arg_parser.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET)
+    arg_parser.add_argument('--edge-budget', type=int, default=DEFAULT_EDGE_BUDGET)
+    args = arg_parser.parse_args(argv)
+
+    if args.sentences:
+        token_lists = [tokenize_sentence(sentence) for sentence in args.sentences]
+    else:
+        token_lists = read_corpus_tokens([args.corpus])[:args.limit]
+    token_lists = [tokens for tokens in token_lists if len(tokens) >= args.min_length]
+
+    grammar_cfg = load_grammar(args.grammar)
+    corpus_tokens = sorted(set(t for tokens in token_lists for t in tokens if t))
+    productions, _ = build_productions(grammar_cfg, load_lexicon(args.lexicon), corpus_tokens)
+    grammar = CFG(grammar_cfg.start(), productions)
+    terminals = set(prod.rhs()[0] for prod in productions if prod.is_lexical())
+    log_probs = None
+    if args.pcfg:
+        log_probs = rule_log_probabilities(productions, load_model(args.pcfg)['counts'])
+    parser = BudgetedChartParser(grammar, time_budget=args.time_budget, edge_budget=args.edge_budget)
+
+    rows = []
+    for tokens in token_lists:
+        status, forest = parse_forest(parser, tokens, terminals)
+        row = {
+            'Sentence': ' '.join(tokens),
+            'Tokens': len(tokens),
+            'Status': status,
+            'Ambiguity': forest.count() if forest else 0,
+            'Forest Nodes': len(forest) if forest else 0,
+            'Packed Alternatives': forest.num_alternatives() if forest else 0,
+            'Best Tree': '',
+            'Best Rewritten Text': '',
+        }
+        print("-" * 40)
+        print(f"{row['Sentence']}")
+        print(f"Status: {status}")
+        if forest:
+            print(f"Parses: {row['Ambiguity']} ({row['Forest Nodes']} nodes, "
+                  f"{row['Packed Alternatives']} packed alternatives)")
+            for rank, (score, tree) in enumerate(forest.kbest(args.kbest, log_probs), start=1):
+                text = ' '.join(rewrite_leaves(tree))
+                print(f"  #{rank} score {score:.3f}: {serialize_tree(tree)}")
+                print(f"      rewritten: {text}")
+                if rank == 1:
+                    row['Best Tree'] = serialize_tree(tree)
+                    row['Best Rewritten Text'] = text
+        rows.append(row)
+
+    if rows:
+        with open(args.report, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        ambiguous = sum(1 for row in rows if row['Ambiguity'] > 1)
+        print(f"\n{ambiguous} of {len(rows)} sentences are ambiguous. Report written to {args.report}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,370 @@
+import argparse
+import importlib.util
+import os
+import sys
+import time
+import types
+
+from nltk import CFG
+
+from translator_core import load_grammar, load_lexicon, build_productions
+from parse_budget import BudgetedChartParser, parse_with_budget, \
+    DEFAULT_TIME_BUDGET, DEFAULT_EDGE_BUDGET, CLOCK_CHECK_INTERVAL
+from earley_parser import EarleyGrammar, EarleyChartParser, spread_sample
+from pcfg_model import read_corpus_tokens
+from result_store import fingerprint
+from corpus_ingest import AtomicWriter
+
+# Grammar-specialized Earley item loop.
+# The structural grammar changes far less often than it is used, so the
+# item loop of EarleyChartParser is written out as Python source for one
+# grammar: completing a constituent dispatches on its label with a balanced
+# tree of integer comparisons, and the rules the label can start are
+# unrolled, each with its dotted rule, lhs and next symbol as constants, so
+# no rule table is read and no branch on the next symbol is taken at parse
+# time. Taking an incomplete item from the agenda does nothing, so only
+# complete items are pushed; most items are rules just predicted from their
+# first child and still incomplete. Those are only created the first time
+# their first child's span is completed, so they need no lookup, and a
+# later rule over the same span only pushes the complete ones again.
+# Bottom-up and top-down parsing get separate loops, so the first has no
+# prediction checks, and waiting items carry their next dotted rule and
+# origin instead of being decoded from the item code. The module is
+# written to generated_parsers/ under the fingerprint of the rule tables it
+# was generated from and loaded in place of the table-driven loop; a
+# grammar with another fingerprint gets a new module, and only the most
+# recently used modules are kept. Items are created in exactly the same
+# order, so the parses are the same.
+
+GENERATOR_VERSION = 4
+DEFAULT_GENERATED_DIR = 'generated_parsers'
+MAX_GENERATED_MODULES = 8
+
+_HEADER = """\
+# Generated by parser_codegen.py for grammar {fingerprint}. Do not edit;
+# it is regenerated when the grammar changes.
+import time
+
+from parse_budget import ParseBudgetExceeded, STATUS_EDGES_EXCEEDED, STATUS_TIME_EXCEEDED
+
+FINGERPRINT = {fingerprint!r}
+NUM_LABELS = {num_labels}
+RULE_BASE = {rule_base!r}
+DOTTED_NEXT = {dotted_next!r}
+DOTTED_LHS = {dotted_lhs!r}
+DOTTED_RULE = {dotted_rule!r}
+LEFT_CORNERS = {left_corners}
+
+
+def fill(compiled, tokens, items, waiting, complete, expanded, predicted, chart, max_items, deadline):
+    if predicted is None:
+        _fill_bottom_up(compiled, tokens, items, waiting, complete, expanded, chart, max_items, deadline)
+    else:
+        _fill_top_down(compiled, tokens, items, waiting, complete, expanded, predicted, chart, max_items,
+                       deadline)
+"""
+
+_FILL_LOOP = """
+
+def {name}(compiled, tokens, items, waiting, complete, expanded, {predicted}chart, max_items, deadline):
+    leaf_entries = compiled.leaf_entries
+    terminal_ids = compiled.terminal_ids
+    stride = len(tokens) + 1
+    item_limit = max_items if max_items else float('inf')
+    clock = time.perf_counter
+    num_items = 0
+    for j in range(1, stride):
+        items_j = items[j]
+        waiting_j = waiting[j]
+        complete_j = complete[j]
+        expanded_j = expanded[j]
+        stack = []
+        stack_append = stack.append
+        stack_pop = stack.pop
+        popped = set()
+        popped_add = popped.add
+        mid = j - 1
+        token = tokens[mid]
+        for entry in leaf_entries.get(token, ()):
+            if entry < 0:
+                key = ~entry * stride + mid
+                complete_j.setdefault(key, []).append(-1)
+                stack_append(~key)
+            else:
+                dotted = RULE_BASE[entry]
+                item_origin = mid
+                code = (dotted + 1) * stride + mid
+                new_split = True
+{leaf_add}
+        if token in terminal_ids:
+            new_split = True
+            for code, dotted, item_origin in waiting[mid].get(~terminal_ids[token], ()):
+                code += stride
+{terminal_add}
+        while stack:
+            code = stack_pop()
+            if code in popped:
+                continue
+            popped_add(code)
+            if code < 0:
+                label, origin = divmod(~code, stride)
+                rule = -1
+            else:
+                dotted, origin = divmod(code, stride)
+                label = DOTTED_LHS[dotted]
+                rule = DOTTED_RULE[dotted]
+            key = label * stride + origin
+            new_split = key not in expanded_j
+            if new_split:
+                expanded_j[key] = rule
+{allowed}            mid = origin
+{dispatch}
+            for code, dotted, item_origin in waiting[origin].get(label, ()):
+                code += stride
+{waiting_add}
+{next_predicted}"""
+
+_NEXT_PREDICTED = """\
+        labels = set()
+        for symbol in waiting_j:
+            if symbol >= 0:
+                labels |= LEFT_CORNERS[symbol]
+        predicted.append(labels)
+"""
+
+# Adds item `code` ending at j, reached from split point `mid`, for dotted
+# rule `dotted` + 1 and origin `item_origin`, only known at parse time.
+# Waiting items are (code, dotted rule, origin).
+_GENERIC_ADD = """\
+dotted += 1
+symbol = DOTTED_NEXT[dotted]
+mids = items_j.get(code)
+if mids is None:
+    items_j[code] = [mid]
+    if symbol is None:
+        complete_j.setdefault(DOTTED_LHS[dotted] * stride + item_origin, []).append(DOTTED_RULE[dotted])
+    else:
+        waiting_j.setdefault(symbol, []).append((code, dotted, item_origin))
+{count}
+elif new_split:
+    mids.append(mid)
+if symbol is None:
+    stack_append(code)
+"""
+
+# Counts a new item against the budgets.
+_COUNT = f"""\
+num_items += 1
+if num_items > item_limit:
+    raise ParseBudgetExceeded(STATUS_EDGES_EXCEEDED, num_items, chart)
+if deadline and num_items % {CLOCK_CHECK_INTERVAL} == 0 and clock() > deadline:
+    raise ParseBudgetExceeded(STATUS_TIME_EXCEEDED, num_items, chart)"""
+
+
+def _indent(text, depth):
+    pad = '    ' * depth
+    return '\n'.join(pad + line if line else line for line in text.splitlines())
+
+
+def grammar_fingerprint(compiled):
+    """
+    Fingerprint of everything the generated code depends on: the rule
+    tables of an EarleyGrammar and the constants written into the source.
+    """
+    return fingerprint(GENERATOR_VERSION, CLOCK_CHECK_INTERVAL, len(compiled.labels),
+                       compiled.rule_lhs, compiled.rule_rhs)
+
+
+def _predict(compiled, label, top_down):
+    """
+    Unrolled prediction of the rules `label` starts, at `origin`: created
+    the first time the span is completed (new_split), pushed again later.
+    """
+    created = []
+    pushed = []
+    for rule in compiled.first_rules[label]:
+        lhs = compiled.rule_lhs[rule]
+        rhs = compiled.rule_rhs[rule]
+        dotted = compiled.rule_base[rule] + 1
+        if len(rhs) == 1:
+            new_item = (f"complete_j.setdefault({lhs} * stride + origin, []).append({rule})\n"
+                        f"stack_append(code)\n")
+            pushed.append(f"stack_append({dotted} * stride + origin)\n")
+        else:
+            new_item = f"waiting_j.setdefault({rhs[1]}, []).append((code, {dotted}, origin))\n"
+        add = f"code = {dotted} * stride + origin\nitems_j[code] = [origin]\n{new_item}{_COUNT}\n"
+        if top_down:
+            add = f"if {lhs} in allowed:\n{_indent(add, 1)}\n"
+            if len(rhs) == 1:
+                pushed[-1] = f"if {lhs} in allowed:\n{_indent(pushed[-1], 1)}\n"
+        created.append(add)
+    source = f"if new_split:\n{_indent(''.join(created), 1)}\n"
+    if pushed:
+        source += f"else:\n{_indent(''.join(pushed), 1)}\n"
+    return source
+
+
+def _dispatch(compiled, labels, top_down):
+    """Balanced comparison tree over `labels` (sorted), unrolling the rules each label starts."""
+    if len(labels) == 1:
+        label = labels[0]
+        return f"if label == {label}:\n{_indent(_predict(compiled, label, top_down), 1)}\n"
+    half = len(labels) // 2
+    return (f"if label < {labels[half]}:\n{_indent(_dispatch(compiled, labels[:half], top_down), 1)}\n"
+            f"else:\n{_indent(_dispatch(compiled, labels[half:], top_down), 1)}\n")
+
+
+def generate_source(compiled):
+    """Python source of the fill() specialized to an EarleyGrammar."""
+    left_corners = '(' + ''.join(f"frozenset({sorted(corners)!r}), " for corners in compiled.left_corners) + ')'
+    source = _HEADER.format(
+        fingerprint=grammar_fingerprint(compiled), num_labels=len(compiled.labels),
+        rule_base=tuple(compiled.rule_base), dotted_next=tuple(compiled.dotted_next),
+        dotted_lhs=tuple(compiled.dotted_lhs), dotted_rule=tuple(compiled.dotted_rule),
+        left_corners=left_corners)
+    generic_add = _indent(_GENERIC_ADD.format(count=_indent(_COUNT, 1)), 4)
+    starting = [label for label in range(len(compiled.labels)) if compiled.first_rules[label]]
+    for top_down in (False, True):
+        dispatch = _indent(_dispatch(compiled, starting, top_down), 3) if starting else ''
+        source += _FILL_LOOP.format(
+            name='_fill_top_down' if top_down else '_fill_bottom_up',
+            predicted='predicted, ' if top_down else '',
+            allowed='            allowed = predicted[origin]\n' if top_down else '',
+            next_predicted=_NEXT_PREDICTED if top_down else '',
+            leaf_add=generic_add, terminal_add=generic_add, dispatch=dispatch, waiting_add=generic_add)
+    return source
+
+
+def _module_from_source(name, source, filename):
+    module = types.ModuleType(name)
+    module.__file__ = filename
+    exec(compile(source, filename, 'exec'), module.__dict__)
+    return module
+
+
+def _prune_generated(directory, keep):
+    """Removes all but the `keep` most recently used generated modules (and their bytecode)."""
+    paths = [os.path.join(directory, filename) for filename in os.listdir(directory)
+             if filename.startswith('earley_') and filename.endswith('.py')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        for stale in (path, importlib.util.cache_from_source(path)):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def load_generated(compiled, directory=DEFAULT_GENERATED_DIR, keep=MAX_GENERATED_MODULES):
+    """
+    The generated module for an EarleyGrammar, from `directory` if it was
+    generated before, otherwise generated and written there. A module that
+    fails to load, e.g. one left by an older generator, is regenerated, and
+    only the `keep` most recently used modules are kept. If the directory
+    cannot be written, the module is only built in memory.
+    """
+    key = grammar_fingerprint(compiled)
+    name = f'earley_{key}'
+    path = os.path.join(directory, name + '.py')
+    if os.path.exists(path):
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(module)
+        except Exception as e:
+            print(f"Warning: regenerating parser module '{path}', which does not load: {e}")
+        else:
+            if getattr(module, 'FINGERPRINT', None) == key:
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return module
+
+    source = generate_source(compiled)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with AtomicWriter(path, newline='\n') as f:
+            f.write(source)
+        print(f"Generated a parser specialized to this grammar in '{path}'.")
+    except OSError as e:
+        print(f"Warning: could not save generated parser '{path}': {e}")
+    else:
+        try:
+            _prune_generated(directory, keep)
+        except OSError as e:
+            print(f"Warning: could not remove old generated parsers from '{directory}': {e}")
+    return _module_from_source(name, source, path)
+
+
+def benchmark(grammar, token_lists, known_terminals=None, generated_dir=DEFAULT_GENERATED_DIR,
+              time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET):
+    """
+    Parses `token_lists` with nltk's ChartParser, the table-driven Earley
+    loop and the generated one. Returns the seconds per engine for full
+    parses (the first tree, without chunk fallback) and the number of
+    sentences whose outcome with chunk fallback, as a corpus run gets it,
+    differs between the generated loop and each of the others.
+    """
+    compiled = EarleyGrammar(grammar)
+    generated = load_generated(compiled, generated_dir)
+    parsers = {
+        'chart': BudgetedChartParser(grammar, time_budget=time_budget, edge_budget=edge_budget),
+        'earley': EarleyChartParser(grammar, time_budget=time_budget, edge_budget=edge_budget, compiled=compiled),
+        'generated': EarleyChartParser(grammar, time_budget=time_budget, edge_budget=edge_budget,
+                                       compiled=compiled, generated=generated),
+    }
+    seconds = {}
+    outcomes = {}
+    for engine, parser in parsers.items():
+        start_time = time.perf_counter()
+        for tokens in token_lists:
+            parse_with_budget(parser, tokens, known_terminals)
+        seconds[engine] = time.perf_counter() - start_time
+        outcomes[engine] = [parse_with_budget(parser, tokens, known_terminals, fallback=True)
+                            for tokens in token_lists]
+
+    differ = {'chart': 0, 'earley': 0}
+    for i, tokens in enumerate(token_lists):
+        ours = outcomes['generated'][i]
+        for engine in differ:
+            theirs = outcomes[engine][i]
+            if ours[0].startswith('Budget') or theirs[0].startswith('Budget'):
+                continue
+            if (ours[0], ours[1], ours[3]) != (theirs[0], theirs[1], theirs[3]):
+                differ[engine] += 1
+    return seconds, differ
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Generate the grammar-specialized Earley parser and benchmark it against nltk's ChartParser.")
+    arg_parser.add_argument('corpus', nargs='?', default='Appendix_A_Parallel_Corpus_Tagalog_English.tsv')
+    arg_parser.add_argument('--sample', type=int, default=0,
+                            help="Sentences to parse, spread over the corpus (0 = all).")
+    arg_parser.add_argument('--generated-dir', default=DEFAULT_GENERATED_DIR)
+    arg_parser.add_argument('--grammar', default='Appendix_D_Resource_Grammar_Tagalog_CFG.cfg')
+    arg_parser.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+    args = arg_parser.parse_args(argv)
+
+    token_lists = spread_sample(read_corpus_tokens([args.corpus]), args.sample)
+    grammar_cfg = load_grammar(args.grammar)
+    corpus_tokens = sorted(set(t for tokens in token_lists for t in tokens if t))
+    productions, _ = build_productions(grammar_cfg, load_lexicon(args.lexicon), corpus_tokens)
+    grammar = CFG(grammar_cfg.start(), productions)
+    terminals = set(prod.rhs()[0] for prod in productions if prod.is_lexical())
+    try:
+        seconds, differ = benchmark(grammar, token_lists, terminals, args.generated_dir)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"{len(token_lists)} sentences: chart {seconds['chart']:.2f}s, earley {seconds['earley']:.2f}s, "
+          f"generated {seconds['generated']:.2f}s "
+          f"({seconds['chart'] / max(seconds['generated'], 1e-9):.2f}x over chart, "
+          f"{seconds['earley'] / max(seconds['generated'], 1e-9):.2f}x over earley).")
+    print(f"Outcomes that differ: {differ['chart']} from chart, {differ['earley']} from earley.")
+    return 1 if differ['earley'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import argparse
+import json
+import math
+import sys
+import time
+from collections import Counter, defaultdict, namedtuple
+
+from nltk import CFG, Tree
+
+from corpus_ingest import iter_tsv_rows
+from parse_budget import (parse_corpus, ParseBudgetExceeded, STATUS_PARSED,
+                          STATUS_TIME_EXCEEDED, STATUS_EDGES_EXCEEDED,
+                          DEFAULT_TIME_BUDGET, DEFAULT_EDGE_BUDGET)
+from translator_core import load_grammar, load_lexicon, build_productions, tokenize_sentence
+
+# Probabilistic mode: rule probabilities are estimated by relative frequency
+# from the trees the grammar assigns to the corpora, then a beam-pruned
+# Viterbi parser returns only the single most probable tree instead of
+# whichever tree the chart parser happens to enumerate first.
+
+DEFAULT_MODEL_FILE = 'pcfg_rule_counts.json'
+DEFAULT_TRAINING_CORPORA = [
+    'Appendix_A_Parallel_Corpus_Tagalog_English.tsv',
+    'Sentence pairs in Tagalog-English (UNREDUCED).tsv',
+]
+DEFAULT_SMOOTHING = 0.5
+DEFAULT_BEAM_WIDTH = 12
+DEFAULT_BEAM_THRESHOLD = 1e-5
+
+
+def count_productions(trees):
+    """Counts rule uses (keyed by the rule's string form) over parse trees."""
+    counts = Counter()
+    for tree in trees:
+        if tree is not None:
+            counts.update(str(prod) for prod in tree.productions())
+    return counts
+
+
+def rule_log_probabilities(productions, counts, smoothing=DEFAULT_SMOOTHING):
+    """
+    Relative-frequency estimate with add-`smoothing` per rule, normalized per
+    left-hand side. Rules that were never used keep a small probability so
+    the grammar's coverage does not change. Returns {production: log_prob}.
+    """
+    by_lhs = defaultdict(list)
+    for prod in productions:
+        by_lhs[prod.lhs()].append(prod)
+    log_probs = {}
+    for prods in by_lhs.values():
+        total = sum(counts.get(str(prod), 0) for prod in prods) + smoothing * len(prods)
+        for prod in prods:
+            mass = counts.get(str(prod), 0) + smoothing
+            if mass > 0:
+                log_probs[prod] = math.log(mass / total)
+    return log_probs
+
+
+def load_model(filepath):
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"Error: PCFG model file not found at '{filepath}'. Run 'python pcfg_model.py train' first.")
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        print(f"Error parsing PCFG model file '{filepath}': {e}")
+        sys.exit(1)
+
+
+class ViterbiEdge(namedtuple('ViterbiEdge', 'start end lhs')):
+    def span(self):
+        return (self.start, self.end)
+
+
+class ViterbiChart:
+    """
+    Best-scoring constituents per span, as filled by ViterbiBeamParser.
+
+    Offers the parts of the nltk Chart interface used by parse_budget and
+    chunk_fallback (`leaves`, `num_leaves`, `parses`, `select`, `trees`), so
+    a probabilistic parse can go through the same budget and chunk fallback
+    code as the chart parser.
+    """
+
+    def __init__(self, tokens, cells):
+        self._tokens = list(tokens)
+        self._cells = cells
+
+    def leaves(self):
+        return list(self._tokens)
+
+    def num_leaves(self):
+        return len(self._tokens)
+
+    def score(self, start, end, lhs):
+        entry = self._cells.get((start, end), {}).get(lhs)
+        return entry[0] if entry else None
+
+    def _build(self, start, end, lhs, tree_class):
+        score, children = self._cells[(start, end)][lhs]
+        return tree_class(lhs.symbol(), [
+            self._build(*child, tree_class) if isinstance(child, tuple) else child
+            for child in children
+        ])
+
+    def parses(self, root, tree_class=Tree):
+        if root in self._cells.get((0, len(self._tokens)), {}):
+            yield self._build(0, len(self._tokens), root, tree_class)
+
+    def select(self, is_complete=True, lhs=None):
+        for (start, end), cell in self._cells.items():
+            for label in cell:
+                if lhs is None or label == lhs:
+                    yield ViterbiEdge(start, end, label)
+
+    def trees(self, edge, tree_class=Tree, complete=False):
+        return iter([self._build(edge.start, edge.end, edge.lhs, tree_class)])
+
+
+class ViterbiBeamParser:
+    """
+    CKY-style Viterbi parser over a probabilistic version of the grammar.
+
+    Rules with more than two right-hand-side symbols are handled with
+    dotted prefix items, so the long flat S rules need no CNF conversion.
+    After each span is complete, only the `beam_width` best labels within
+    `beam_threshold` of the span's best score stay active for larger spans.
+    Time and item budgets work like those of BudgetedChartParser.
+    """
+
+    def __init__(self, grammar, log_probs, beam_width=DEFAULT_BEAM_WIDTH,
+                 beam_threshold=DEFAULT_BEAM_THRESHOLD,
+                 time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET):
+        self._grammar = grammar
+        self.beam_width = beam_width
+        self.beam_log_threshold = math.log(beam_threshold) if beam_threshold else -math.inf
+        self.time_budget = time_budget
+        self.edge_budget = edge_budget
+
+        self._lexical = defaultdict(list)
+        self._unary = defaultdict(list)
+        self._rules = []
+        self._rules_by_first = defaultdict(list)
+        for prod, log_prob in log_probs.items():
+            rhs = prod.rhs()
+            if prod.is_lexical():
+                if len(rhs) == 1:
+                    self._lexical[rhs[0]].append((prod.lhs(), log_prob))
+            elif len(rhs) == 1:
+                self._unary[rhs[0]].append((prod.lhs(), log_prob))
+            elif len(rhs) > 1:
+                self._rules_by_first[rhs[0]].append(len(self._rules))
+                self._rules.append((prod.lhs(), rhs, log_prob))
+
+    def grammar(self):
+        return self._grammar
+
+    def _close_unary(self, cell, start, end):
+        agenda = list(cell)
+        while agenda:
+            child = agenda.pop()
+            child_score = cell[child][0]
+            for lhs, log_prob in self._unary.get(child, ()):
+                score = child_score + log_prob
+                if lhs not in cell or score > cell[lhs][0]:
+                    cell[lhs] = (score, ((start, end, child),))
+                    agenda.append(lhs)
+
+    def _prune(self, entries, width):
+        if not entries:
+            return entries
+        best = max(score for score, _ in entries.values())
+        floor = best + self.beam_log_threshold
+        kept = [(key, value) for key, value in entries.items() if value[0] >= floor]
+        if len(kept) > width:
+            kept.sort(key=lambda item: item[1][0], reverse=True)
+            kept = kept[:width]
+        return dict(kept)
+
+    def _prefixes(self, prefix_items):
+        by_next = defaultdict(list)
+        for (rule_id, dot), (score, children) in prefix_items.items():
+            by_next[self._rules[rule_id][1][dot]].append((rule_id, dot, score, children))
+        return by_next
+
+    def chart_parse(self, tokens):
+        tokens = list(tokens)
+        n = len(tokens)
+        deadline = time.perf_counter() + self.time_budget if self.time_budget else None
+        cells = {}
+        active = {}
+        prefixes = {}
+        items = 0
+
+        for length in range(1, n + 1):
+            if deadline and time.perf_counter() > deadline:
+                raise ParseBudgetExceeded(STATUS_TIME_EXCEEDED, items, ViterbiChart(tokens, cells))
+            for start in range(n - length + 1):
+                end = start + length
+                cell = {}
+                prefix_items = {}
+                if length == 1:
+                    for lhs, log_prob in self._lexical.get(tokens[start], ()):
+                        if lhs not in cell or log_prob > cell[lhs][0]:
+                            cell[lhs] = (log_prob, (tokens[start],))
+                for mid in range(start + 1, end):
+                    left = prefixes.get((start, mid))
+                    right = active.get((mid, end))
+                    if not left or not right:
+                        continue
+                    for symbol, waiting in left.items():
+                        right_entry = right.get(symbol)
+                        if right_entry is None:
+                            continue
+                        for rule_id, dot, score, children in waiting:
+                            lhs, rhs, _ = self._rules[rule_id]
+                            score += right_entry[0]
+                            children += ((mid, end, symbol),)
+                            if dot + 1 == len(rhs):
+                                if lhs not in cell or score > cell[lhs][0]:
+                                    cell[lhs] = (score, children)
+                            else:
+                                key = (rule_id, dot + 1)
+                                if key not in prefix_items or score > prefix_items[key][0]:
+                                    prefix_items[key] = (score, children)
+                self._close_unary(cell, start, end)
+                cells[(start, end)] = cell
+                active_cell = self._prune(cell, self.beam_width)
+                active[(start, end)] = active_cell
+                for symbol, (score, _) in active_cell.items():
+                    for rule_id in self._rules_by_first.get(symbol, ()):
+                        key = (rule_id, 1)
+                        item_score = score + self._rules[rule_id][2]
+                        if key not in prefix_items or item_score > prefix_items[key][0]:
+                            prefix_items[key] = (item_score, ((start, end, symbol),))
+                prefix_items = self._prune(prefix_items, self.beam_width * 4)
+                prefixes[(start, end)] = self._prefixes(prefix_items)
+                items += len(cell) + len(prefix_items)
+                if self.edge_budget and items > self.edge_budget:
+                    raise ParseBudgetExceeded(STATUS_EDGES_EXCEEDED, items, ViterbiChart(tokens, cells))
+        return ViterbiChart(tokens, cells)
+
+    def parse(self, tokens):
+        return self.chart_parse(tokens).parses(self._grammar.start())
+
+
+def viterbi_parser_factory(log_probs, beam_width=DEFAULT_BEAM_WIDTH, beam_threshold=DEFAULT_BEAM_THRESHOLD):
+    """Parser factory for parse_budget.parse_corpus."""
+    def make_parser(grammar, time_budget, edge_budget):
+        return ViterbiBeamParser(grammar, log_probs, beam_width=beam_width, beam_threshold=beam_threshold,
+                                 time_budget=time_budget, edge_budget=edge_budget)
+    return make_parser
+
+
+def read_corpus_tokens(filepaths):
+    token_lists = []
+    for filepath in filepaths:
+        for _, fields in iter_tsv_rows(filepath):
+            if len(fields) > 1:
+                token_lists.append(tokenize_sentence(fields[1]))
+    return token_lists
+
+
+def train(corpora, grammar_file, lexicon_file, output_file, iterations=1, workers=1,
+          time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET,
+          smoothing=DEFAULT_SMOOTHING, beam_width=DEFAULT_BEAM_WIDTH):
+    """
+    Estimates rule counts from the corpora. The first pass counts the first
+    tree of the chart parser; each further iteration re-parses with the
+    current model and recounts its Viterbi trees (hard EM).
+    """
+    token_lists = read_corpus_tokens(corpora)
+    corpus_tokens = sorted(set(t for toks in token_lists for t in toks if t))
+    grammar_cfg = load_grammar(grammar_file)
+    productions, _ = build_productions(grammar_cfg, load_lexicon(lexicon_file), corpus_tokens)
+    grammar = CFG(grammar_cfg.start(), productions)
+    terminals = set(prod.rhs()[0] for prod in productions if prod.is_lexical())
+
+    counts = Counter()
+    make_parser = None
+    for iteration in range(iterations):
+        start_time = time.time()
+        outcomes = parse_corpus(token_lists, grammar, known_terminals=terminals, workers=workers,
+                                time_budget=time_budget, edge_budget=edge_budget, make_parser=make_parser)
+        trees = [tree for status, tree, elapsed, chunks in outcomes if status == STATUS_PARSED]
+        counts = count_productions(trees)
+        print(f"Iteration {iteration + 1}: {len(trees)}/{len(token_lists)} sentences parsed "
+              f"in {time.time() - start_time:.1f} seconds.")
+        make_parser = viterbi_parser_factory(rule_log_probabilities(productions, counts, smoothing),
+                                             beam_width=beam_width)
+
+    model = {
+        'corpora': list(corpora),
+        'sentences': len(token_lists),
+        'parsed': len(trees),
+        'iterations': iterations,
+        'counts': dict(counts.most_common()),
+    }
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(model, f, ensure_ascii=False, indent=1)
+    print(f"Rule counts written to '{output_file}'.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate PCFG rule probabilities from corpus parses.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    tr = sub.add_parser('train', help="Parse the corpora and write rule counts.")
+    tr.add_argument('corpora', nargs='*', default=DEFAULT_TRAINING_CORPORA)
+    tr.add_argument('-o', '--output', default=DEFAULT_MODEL_FILE)
+    tr.add_argument('--grammar', default='Appendix_D_Resource_Grammar_Tagalog_CFG.cfg')
+    tr.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+    tr.add_argument('--iterations', type=int, default=2,
+                    help="1 counts chart-parser trees; each extra iteration recounts Viterbi trees.")
+    tr.add_argument('--workers', type=int, default=1)
+    tr.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET)
+    tr.add_argument('--edge-budget', type=int, default=DEFAULT_EDGE_BUDGET)
+    tr.add_argument('--smoothing', type=float, default=DEFAULT_SMOOTHING)
+    tr.add_argument('--beam-width', type=int, default=DEFAULT_BEAM_WIDTH)
+    args = parser.parse_args(argv)
+
+    train(args.corpora, args.grammar, args.lexicon, args.output, iterations=args.iterations,
+          workers=args.workers, time_budget=args.time_budget, edge_budget=args.edge_budget,
+          smoothing=args.smoothing, beam_width=args.beam_width)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import argparse
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+
+from nltk import CFG
+
+from parse_budget import parse_corpus, STATUS_PARSED, DEFAULT_TIME_BUDGET, DEFAULT_EDGE_BUDGET
+from pcfg_model import read_corpus_tokens, DEFAULT_TRAINING_CORPORA
+from translator_core import load_grammar, load_lexicon, build_productions
+from corpus_columns import TokenizedCorpus
+from skeleton_cache import SkeletonCache
+from earley_parser import earley_parser_factory
+
+# POS pre-tagger.
+# A word with several lexicon tags puts all of them into the chart, and
+# every edge built on it is built once per tag. A bigram HMM trained on the
+# tag sequences of the corpus parses scores each token's lexicon tags in
+# context (forward-backward posteriors), and only the `max_tags` most
+# probable ones are parsed. Pruning works on POS skeletons (see
+# skeleton_cache.py): a pruned token gets the signature of its kept tags.
+# A sentence that does not parse with the pruned tags is parsed again with
+# all of them, so pruning can change which tree is found first, but a
+# sentence only loses its parse if the retry runs out of budget.
+
+DEFAULT_TAGGER_FILE = 'pos_tagger_model.json'
+DEFAULT_MAX_TAGS = 1
+DEFAULT_SMOOTHING = 0.1
+
+_START = '<s>'
+_END = '</s>'
+
+
+def count_tag_sequences(trees):
+    """Tag bigram counts {previous: {tag: n}} and emission counts {tag: {word: n}} of parse trees."""
+    transitions = defaultdict(Counter)
+    emissions = defaultdict(Counter)
+    for tree in trees:
+        previous = _START
+        for word, tag in tree.pos():
+            transitions[previous][tag] += 1
+            emissions[tag][str(word)] += 1
+            previous = tag
+        transitions[previous][_END] += 1
+    return transitions, emissions
+
+
+class BigramTagger:
+    """
+    Bigram HMM over POS tags with add-`smoothing` estimates. It only
+    ranks the tags the lexicon allows for each token; it never adds one.
+    """
+
+    def __init__(self, transitions, emissions, smoothing=DEFAULT_SMOOTHING):
+        self._transitions = transitions
+        self._emissions = emissions
+        self._transition_totals = {tag: sum(counts.values()) for tag, counts in transitions.items()}
+        self._emission_totals = {tag: sum(counts.values()) for tag, counts in emissions.items()}
+        self._num_tags = len(set(emissions) | {_END})
+        self._smoothing = smoothing
+
+    @classmethod
+    def load(cls, filepath, smoothing=DEFAULT_SMOOTHING):
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                model = json.load(f)
+        except FileNotFoundError:
+            print(f"Error: POS tagger model not found at '{filepath}'. Run 'python pos_tagger.py train' first.")
+            sys.exit(1)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing POS tagger model '{filepath}': {e}")
+            sys.exit(1)
+        return cls(model['transitions'], model['emissions'], smoothing)
+
+    def transition(self, previous, tag):
+        counts = self._transitions.get(previous, {})
+        return ((counts.get(tag, 0) + self._smoothing)
+                / (self._transition_totals.get(previous, 0) + self._smoothing * self._num_tags))
+
+    def emission(self, tag, word):
+        counts = self._emissions.get(tag, {})
+        return ((counts.get(word, 0) + self._smoothing)
+                / (self._emission_totals.get(tag, 0) + self._smoothing * (len(counts) + 1)))
+
+    def posteriors(self, tokens, candidates):
+        """
+        For each token, [(tag, posterior probability)] over its candidate
+        tags (a non-empty tuple per token), by forward-backward.
+        """
+        n = len(tokens)
+        forward = []
+        previous = {_START: 1.0}
+        for word, tags in zip(tokens, candidates):
+            scores = {tag: self.emission(tag, word) * sum(p * self.transition(prev, tag)
+                                                          for prev, p in previous.items())
+                      for tag in tags}
+            total = sum(scores.values()) or 1.0
+            previous = {tag: score / total for tag, score in scores.items()}
+            forward.append(previous)
+
+        backward = [None] * n
+        following = {tag: self.transition(tag, _END) for tag in candidates[-1]}
+        backward[-1] = following
+        for i in range(n - 2, -1, -1):
+            emitted = {tag: self.emission(tag, tokens[i + 1]) * b for tag, b in following.items()}
+            scores = {tag: sum(self.transition(tag, nxt) * e for nxt, e in emitted.items())
+                      for tag in candidates[i]}
+            total = sum(scores.values()) or 1.0
+            following = {tag: score / total for tag, score in scores.items()}
+            backward[i] = following
+
+        result = []
+        for tags, f, b in zip(candidates, forward, backward):
+            scores = [(tag, f[tag] * b[tag]) for tag in tags]
+            total = sum(score for _, score in scores) or 1.0
+            result.append([(tag, score / total) for tag, score in scores])
+        return result
+
+    def top_tags(self, tokens, candidates, max_tags=DEFAULT_MAX_TAGS):
+        """The `max_tags` most probable candidate tags of each token, as sets."""
+        kept = []
+        for scores in self.posteriors(tokens, candidates):
+            ranked = sorted(range(len(scores)), key=lambda i: -scores[i][1])
+            kept.append({scores[i][0] for i in ranked[:max_tags]})
+        return kept
+
+
+def prune_skeletons(tagger, cache, skeletons, token_lists, max_tags=DEFAULT_MAX_TAGS):
+    """
+    Skeletons with only the `max_tags` best tags of each token; `cache` is
+    a SkeletonCache built with the same `max_tags`. Sentences with unknown
+    tokens cannot parse, so they keep all their tags (and chunks).
+    """
+    pruned = []
+    for skeleton, tokens in zip(skeletons, token_lists):
+        candidates = [cache.tags(signature) for signature in skeleton]
+        if not skeleton or cache.unknown in skeleton or all(len(tags) <= max_tags for tags in candidates):
+            pruned.append(skeleton)
+            continue
+        kept = tagger.top_tags([str(token) for token in tokens], candidates, max_tags)
+        pruned.append(tuple(cache.restrict(signature, keep) if len(tags) > len(keep) else signature
+                            for signature, tags, keep in zip(skeleton, candidates, kept)))
+    return pruned
+
+
+def _load_corpus(corpora, grammar_file, lexicon_file, limit=0):
+    texts = [' '.join(tokens) for tokens in read_corpus_tokens(corpora) if tokens]
+    if limit:
+        texts = texts[:limit]
+    corpus = TokenizedCorpus.from_texts(texts)
+    grammar_cfg = load_grammar(grammar_file)
+    productions, _ = build_productions(grammar_cfg, load_lexicon(lexicon_file), corpus.vocabulary_words())
+    return corpus, CFG(grammar_cfg.start(), productions)
+
+
+def _parse_skeletons(cache, corpus, workers, time_budget, edge_budget, fallback, make_parser,
+                     skeletons=None, full_skeletons=None):
+    def parse(inputs, fallback=fallback):
+        return parse_corpus(inputs, cache.grammar, known_terminals=cache.known_terminals, workers=workers,
+                            time_budget=time_budget, edge_budget=edge_budget, fallback=fallback,
+                            make_parser=make_parser)
+
+    def parse_pruned(inputs):
+        return parse(inputs, fallback=False)
+
+    if skeletons is None:
+        skeletons = cache.skeletons(corpus)
+    return cache.parse(skeletons, corpus.token_lists(), parse, full_skeletons, parse_pruned)
+
+
+def train(corpora, grammar_file, lexicon_file, output_file, workers=1, engine='earley',
+          time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET):
+    """Parses the corpora and writes the tag bigram and emission counts of the parsed sentences."""
+    corpus, grammar = _load_corpus(corpora, grammar_file, lexicon_file)
+    make_parser = earley_parser_factory() if engine == 'earley' else None
+    start_time = time.time()
+    outcomes = _parse_skeletons(SkeletonCache(grammar), corpus, workers, time_budget, edge_budget, False,
+                                make_parser)
+    trees = [tree for status, tree, elapsed, chunks in outcomes if status == STATUS_PARSED]
+    print(f"{len(trees)}/{len(corpus)} sentences parsed in {time.time() - start_time:.1f} seconds.")
+    transitions, emissions = count_tag_sequences(trees)
+    model = {
+        'corpora': list(corpora),
+        'sentences': len(corpus),
+        'parsed': len(trees),
+        'transitions': {tag: dict(counts.most_common()) for tag, counts in transitions.items()},
+        'emissions': {tag: dict(counts.most_common()) for tag, counts in emissions.items()},
+    }
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(model, f, ensure_ascii=False, indent=1)
+    print(f"Tag counts written to '{output_file}'.")
+
+
+def evaluate(corpus_file, grammar_file, lexicon_file, model_file, max_tags=DEFAULT_MAX_TAGS, limit=0,
+             workers=1, engine='earley', time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET):
+    """
+    Parses the corpus with all tags and with pre-tagging (both with chunk
+    fallback and the skeleton cache) and prints times, how many sentences
+    still parse with the pruned tags alone (the coverage pruning would lose
+    without the retry), and how many first trees change.
+    """
+    corpus, grammar = _load_corpus([corpus_file], grammar_file, lexicon_file, limit)
+    tagger = BigramTagger.load(model_file)
+
+    def factory():
+        return earley_parser_factory() if engine == 'earley' else None
+
+    start_time = time.perf_counter()
+    full = _parse_skeletons(SkeletonCache(grammar), corpus, workers, time_budget, edge_budget, True, factory())
+    full_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    cache = SkeletonCache(grammar, max_tags=max_tags)
+    skeletons = cache.skeletons(corpus)
+    pruned = prune_skeletons(tagger, cache, skeletons, corpus.token_lists(), max_tags)
+    tagged = _parse_skeletons(cache, corpus, workers, time_budget, edge_budget, True, factory(),
+                              pruned, skeletons)
+    tagged_seconds = time.perf_counter() - start_time
+
+    parsed = sum(outcome[0] == STATUS_PARSED for outcome in full)
+    lost = sum(a[0] == STATUS_PARSED and b[0] != STATUS_PARSED for a, b in zip(full, tagged))
+    retry_needed = sum(a[0] == STATUS_PARSED and p != s and not cache.parses(p)
+                       for a, p, s in zip(full, pruned, skeletons))
+    changed = sum(a[0] == b[0] == STATUS_PARSED and a[1] != b[1] for a, b in zip(full, tagged))
+    print(f"{len(corpus)} sentences, {engine} parser, {parsed} parsed with all tags.")
+    print(f"All tags: {full_seconds:.2f}s; top {max_tags} tag(s): {tagged_seconds:.2f}s "
+          f"({full_seconds / max(tagged_seconds, 1e-9):.2f}x).")
+    print(f"{cache.pruned} sentences pruned, {cache.pruned - cache.retried} of them parsed with the pruned tags; "
+          f"{cache.retried} retried with all tags.")
+    print(f"Without the retry {retry_needed} parses ({retry_needed / max(parsed, 1):.1%}) would be lost; "
+          f"with it {lost} are lost and {changed} first trees change.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bigram POS pre-tagger that prunes lexical ambiguity.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    tr = sub.add_parser('train', help="Parse the corpora and write tag bigram and emission counts.")
+    tr.add_argument('corpora', nargs='*', default=DEFAULT_TRAINING_CORPORA)
+    tr.add_argument('-o', '--output', default=DEFAULT_TAGGER_FILE)
+    ev = sub.add_parser('evaluate', help="Compare parsing with all tags and with pre-tagging.")
+    ev.add_argument('corpus', nargs='?', default='Sentence pairs in Tagalog-English (UNREDUCED).tsv')
+    ev.add_argument('--model', default=DEFAULT_TAGGER_FILE)
+    ev.add_argument('--max-tags', type=int, default=DEFAULT_MAX_TAGS)
+    ev.add_argument('--limit', type=int, default=0, help="Only use the first N sentences (0 = all).")
+    for command in (tr, ev):
+        command.add_argument('--grammar', default='Appendix_D_Resource_Grammar_Tagalog_CFG.cfg')
+        command.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+        command.add_argument('--parser', choices=['chart', 'earley'], default='earley')
+        command.add_argument('--workers', type=int, default=1)
+        command.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET)
+        command.add_argument('--edge-budget', type=int, default=DEFAULT_EDGE_BUDGET)
+    args = parser.parse_args(argv)
+
+    if args.command == 'train':
+        train(args.corpora, args.grammar, args.lexicon, args.output, workers=args.workers, engine=args.parser,
+              time_budget=args.time_budget, edge_budget=args.edge_budget)
+    else:
+        evaluate(args.corpus, args.grammar, args.lexicon, args.model, max_tags=args.max_tags, limit=args.limit,
+                 workers=args.workers, engine=args.parser, time_budget=args.time_budget,
+                 edge_budget=args.edge_budget)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
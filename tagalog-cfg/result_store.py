@@ -0,0 +1,192 @@
+import hashlib
+import os
+import pickle
+from collections import defaultdict
+
+from nltk import Nonterminal
+
+from corpus_ingest import AtomicWriter
+from parse_budget import STATUS_TIME_EXCEEDED
+
+# Incremental result store for corpus runs.
+# Parse outcomes are stored per token sequence together with the grammar
+# they were produced with. On the next run only sentences whose result can
+# depend on a changed production are parsed again: a production can take
+# part in a parse of a sentence only if every symbol on its right-hand side
+# is derivable bottom-up from the sentence's tokens, so a sentence whose
+# derivable rule set contains no added or removed production keeps its
+# previous tree, status and fallback chunks. Translations are not stored;
+# they are dictionary lookups redone at output time, so dictionary edits
+# never cause a re-parse.
+
+DEFAULT_STORE_FILE = 'translation_results.store'
+STORE_VERSION = 1
+
+
+def fingerprint(*parts):
+    """Short stable digest of the repr of `parts`."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def file_fingerprint(filepath):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def production_key(prod):
+    """Hashable, picklable form of a production that does not depend on nltk object identity."""
+    return (str(prod.lhs()), tuple(('N', str(sym)) if isinstance(sym, Nonterminal) else ('T', sym)
+                                   for sym in prod.rhs()))
+
+
+class RuleReachability:
+    """
+    Bottom-up derivability over a fixed production set. For a token
+    sequence, `touches(tokens)` says whether any of the `watched`
+    productions could take part in one of its parses.
+    """
+
+    def __init__(self, production_keys, watched):
+        self._rules = list(production_keys)
+        self._watched = [key in watched for key in self._rules]
+        self._uses = defaultdict(list)
+        self._arity = []
+        for index, (lhs, rhs) in enumerate(self._rules):
+            symbols = set(rhs)
+            self._arity.append(len(symbols))
+            for symbol in symbols:
+                self._uses[symbol].append(index)
+        self._always = [index for index, arity in enumerate(self._arity) if arity == 0]
+
+    def touches(self, tokens):
+        missing = {}
+        derived = set()
+        agenda = [('T', tok) for tok in set(tokens)]
+        fired = list(self._always)
+        while agenda or fired:
+            for index in fired:
+                if self._watched[index]:
+                    return True
+                symbol = ('N', self._rules[index][0])
+                if symbol not in derived:
+                    agenda.append(symbol)
+            fired = []
+            while agenda:
+                symbol = agenda.pop()
+                if symbol in derived:
+                    continue
+                derived.add(symbol)
+                for index in self._uses.get(symbol, ()):
+                    left = missing.get(index, self._arity[index]) - 1
+                    missing[index] = left
+                    if left == 0:
+                        fired.append(index)
+        return False
+
+
+class ResultStore:
+    """
+    Parse outcomes (status, tree, chunks) keyed by token tuple, valid for
+    the production set in `productions` and the parser settings in
+    `config`. Trees and chunks are kept with string leaves.
+    """
+
+    def __init__(self, config=None, productions=(), start=None, entries=None):
+        self.config = config
+        self.productions = set(productions)
+        self.start = start
+        self.entries = entries if entries is not None else {}
+
+    @classmethod
+    def load(cls, filepath):
+        if not os.path.exists(filepath):
+            return cls()
+        try:
+            with open(filepath, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            print(f"Warning: could not read result store '{filepath}' ({e}); starting a new one.")
+            return cls()
+        if data.get('version') != STORE_VERSION:
+            print(f"Warning: result store '{filepath}' has an unsupported format; starting a new one.")
+            return cls()
+        return cls(data['config'], data['productions'], data['start'], data['entries'])
+
+    def save(self, filepath):
+        data = {
+            'version': STORE_VERSION,
+            'config': self.config,
+            'productions': self.productions,
+            'start': self.start,
+            'entries': self.entries,
+        }
+        with AtomicWriter(filepath, binary=True) as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def changed_productions(self, productions, start, config, rescore_lhs=False):
+        """
+        Keys of the productions added or removed since the store was built,
+        or None when nothing stored can be reused (different start symbol or
+        parser settings). With `rescore_lhs` (PCFG mode, where probabilities
+        are normalized per left-hand side) every production sharing a
+        left-hand side with a changed one counts as changed.
+        """
+        if not self.entries or str(start) != self.start or config != self.config:
+            return None
+        current = set(production_key(prod) for prod in productions)
+        changed = current ^ self.productions
+        if rescore_lhs and changed:
+            changed_lhs = set(lhs for lhs, rhs in changed)
+            changed |= set(key for key in current | self.productions if key[0] in changed_lhs)
+        return changed
+
+    def plan(self, token_lists, productions, start, config, rescore_lhs=False):
+        """
+        Splits the corpus into sentences that must be parsed and stored
+        outcomes that can be reused. Returns (to_parse, reused), where
+        `to_parse` is a list of sentence indexes and `reused` maps sentence
+        indexes to stored (status, tree, chunks).
+        """
+        changed = self.changed_productions(productions, start, config, rescore_lhs)
+        if changed is None:
+            return list(range(len(token_lists))), {}
+        reachability = RuleReachability(
+            set(production_key(prod) for prod in productions) | self.productions, changed) if changed else None
+        verdicts = {}
+        to_parse = []
+        reused = {}
+        for index, tokens in enumerate(token_lists):
+            key = tuple(tokens)
+            entry = self.entries.get(key)
+            if entry is None:
+                to_parse.append(index)
+                continue
+            if reachability is not None:
+                affected = verdicts.get(key)
+                if affected is None:
+                    affected = verdicts[key] = reachability.touches(key)
+                if affected:
+                    to_parse.append(index)
+                    continue
+            reused[index] = entry
+        return to_parse, reused
+
+    def update(self, token_lists, outcomes, productions, start, config):
+        """Replaces the store contents with this run's outcomes, one per sentence."""
+        self.config = config
+        self.productions = set(production_key(prod) for prod in productions)
+        self.start = str(start)
+        entries = {}
+        for tokens, (status, tree, chunks) in zip(token_lists, outcomes):
+            # A time-budget result depends on machine load, not on the grammar.
+            if status != STATUS_TIME_EXCEEDED:
+                entries[tuple(tokens)] = (status, tree, chunks)
+        self.entries = entries
+
@@ -0,0 +1,98 @@
+import csv
+from collections import Counter
+
+from nltk import Nonterminal, Production
+
+# Aggregate rule-usage profile of a corpus run.
+# For every structural production it records how many final trees use it
+# (coverage) and how many chart edges it created (cost). Parse time is
+# attributed to productions in proportion to their share of each chart's
+# edges, which ranks the rules that cost the most for the least coverage.
+
+DEFAULT_REPORT_FILE = 'rule_usage_report.csv'
+
+
+def _is_structural(rhs):
+    return bool(rhs) and all(isinstance(sym, Nonterminal) for sym in rhs)
+
+
+class RuleProfile:
+    """Counters keyed by (lhs, rhs) of structural productions; cheap to pickle and merge."""
+
+    def __init__(self):
+        self.sentences = 0
+        self.parsed = 0
+        self.tree_uses = Counter()
+        self.covered_sentences = Counter()
+        self.chart_edges = Counter()
+        self.edge_seconds = Counter()
+
+    def record(self, chart, tree, elapsed):
+        self.sentences += 1
+        if tree is not None:
+            self.parsed += 1
+            used = [(prod.lhs(), prod.rhs()) for prod in tree.productions() if _is_structural(prod.rhs())]
+            self.tree_uses.update(used)
+            self.covered_sentences.update(set(used))
+        # Only nltk charts keep one edge per dotted rule; other parsers
+        # (e.g. the Viterbi parser) contribute tree usage only.
+        if chart is None or not hasattr(chart, 'edges'):
+            return
+        edges = Counter()
+        for edge in chart.edges():
+            if hasattr(edge, 'rhs') and _is_structural(edge.rhs()):
+                edges[(edge.lhs(), edge.rhs())] += 1
+        total = sum(edges.values())
+        self.chart_edges.update(edges)
+        if total:
+            for key, count in edges.items():
+                self.edge_seconds[key] += elapsed * count / total
+
+    def merge(self, other):
+        self.sentences += other.sentences
+        self.parsed += other.parsed
+        self.tree_uses.update(other.tree_uses)
+        self.covered_sentences.update(other.covered_sentences)
+        self.chart_edges.update(other.chart_edges)
+        self.edge_seconds.update(other.edge_seconds)
+        return self
+
+    def ranked(self, productions=None):
+        """
+        Rows sorted by estimated parse seconds per covered sentence, most
+        expensive first. With `productions`, every structural production is
+        listed, including rules that never produced an edge.
+        """
+        keys = set(self.chart_edges) | set(self.tree_uses)
+        if productions is not None:
+            keys |= {(prod.lhs(), prod.rhs()) for prod in productions if _is_structural(prod.rhs())}
+        rows = []
+        for key in keys:
+            seconds = self.edge_seconds.get(key, 0.0)
+            covered = self.covered_sentences.get(key, 0)
+            rows.append({
+                'Rule': str(Production(*key)),
+                'Tree Uses': self.tree_uses.get(key, 0),
+                'Sentences Covered': covered,
+                'Chart Edges': self.chart_edges.get(key, 0),
+                'Est. Parse Seconds': round(seconds, 6),
+                'Seconds per Covered Sentence': round(seconds / covered, 6) if covered else round(seconds, 6),
+            })
+        rows.sort(key=lambda row: (row['Sentences Covered'] > 0, -row['Seconds per Covered Sentence'],
+                                   -row['Chart Edges'], row['Rule']))
+        return rows
+
+    def write_report(self, filepath, productions=None):
+        rows = self.ranked(productions)
+        with open(filepath, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else ['Rule'])
+            writer.writeheader()
+            writer.writerows(rows)
+        return rows
+
+
+def print_report(rows, top=15):
+    print(f"{'Rule':<40} {'Uses':>6} {'Sents':>6} {'Edges':>8} {'Seconds':>9}")
+    for row in rows[:top]:
+        print(f"{row['Rule']:<40} {row['Tree Uses']:>6} {row['Sentences Covered']:>6} "
+              f"{row['Chart Edges']:>8} {row['Est. Parse Seconds']:>9.4f}")
@@ -0,0 +1,367 @@
+import argparse
+import csv
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+
+# Sharded corpus runs.
+# A large corpus is cut into byte-balanced row ranges (line_index.py) and
+# described by a manifest: the corpus, the translator options shared by all
+# shards, the fingerprint of the grammar, lexicon and dictionary, and per
+# shard its id, row range, byte range and a digest of its bytes. A worker,
+# on any machine that sees the corpus and the resources, translates one
+# shard with 'CFG Based Translator.py --rows' into a segment: the shard's
+# CSV, its log, and a descriptor JSON written last, which records what was
+# run and where, and carries the coverage and timing counts. The merge step
+# checks every descriptor against the manifest and concatenates the CSVs
+# in shard order into the final output. 'run' is a local coordinator that
+# works through the shards with several worker processes and then merges,
+# standing in for a set of nodes.
+
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST_FILE = 'shards.json'
+DEFAULT_SHARDS = 4
+TRANSLATOR_SCRIPT = 'CFG Based Translator.py'
+RESOURCE_FILES = (
+    'Appendix_D_Resource_Grammar_Tagalog_CFG.cfg',
+    'Appendix_B_Resource_Lexicon_Tagalog_POS.tsv',
+    'Appendix_C_Resource_Dictionary_Tagalog_English.json',
+)
+# Set per shard by the worker, or files every shard would write at once,
+# so they cannot be shared options.
+_SHARD_OPTIONS = ('--data', '--rows', '--output', '--stats', '--checkpoint', '--resume',
+                  '--result-store', '--profile-rules')
+
+
+def run_statistics(statuses, parse_times, wall_seconds):
+    """Coverage and timing counts of one run, as written by the translator's --stats."""
+    return {
+        'sentences': len(statuses),
+        'statuses': dict(Counter(statuses)),
+        'attempted': len(parse_times),
+        'parse_seconds': sum(parse_times),
+        'wall_seconds': wall_seconds,
+    }
+
+
+def resource_files(options):
+    """The grammar, lexicon and dictionary a run with translator `options` reads; --lexicon replaces Appendix B."""
+    lexicon = RESOURCE_FILES[1]
+    for i, option in enumerate(options):
+        if option == '--lexicon' and i + 1 < len(options):
+            lexicon = options[i + 1]
+        elif option.startswith('--lexicon='):
+            lexicon = option.split('=', 1)[1]
+    return (RESOURCE_FILES[0], lexicon, RESOURCE_FILES[2])
+
+
+def resource_fingerprint(files=RESOURCE_FILES):
+    """Fingerprint of the grammar, lexicon and dictionary a run translates with."""
+    from result_store import fingerprint, file_fingerprint
+    return fingerprint(*[(os.path.basename(path), file_fingerprint(path)) for path in files])
+
+
+def default_segments_dir(manifest_path):
+    return os.path.splitext(manifest_path)[0] + '_segments'
+
+
+def plan_shards(corpus, count, options, manifest_path):
+    """Writes the manifest of `corpus` cut into `count` shards and returns it."""
+    from corpus_ingest import AtomicWriter
+    from line_index import LineIndex
+    index = LineIndex.open(corpus)
+    shards = []
+    for number, (start, stop) in enumerate(index.shards(count)):
+        if start == stop:
+            continue
+        shards.append({
+            'id': f'shard-{number:04d}',
+            'rows': [start, stop],
+            'bytes': list(index.byte_range(start, stop)),
+            'digest': index.fingerprint(start, stop),
+        })
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'corpus': corpus,
+        'rows': len(index),
+        'grammar_fingerprint': resource_fingerprint(resource_files(options)),
+        'options': list(options),
+        'shards': shards,
+    }
+    with AtomicWriter(manifest_path) as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(manifest_path):
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"'{manifest_path}' is not a version {MANIFEST_VERSION} shard manifest")
+    return manifest
+
+
+def manifest_key(manifest):
+    """Fingerprint of everything in the manifest that a segment's content depends on."""
+    from result_store import fingerprint
+    return fingerprint(manifest['grammar_fingerprint'], manifest['options'],
+                       [(shard['id'], shard['digest']) for shard in manifest['shards']])
+
+
+def _segment_paths(segments_dir, shard_id):
+    base = os.path.join(segments_dir, shard_id)
+    return {'descriptor': base + '.json', 'output': base + '.csv', 'stats': base + '.stats.json',
+            'log': base + '.log'}
+
+
+def load_segment(manifest, segments_dir, shard):
+    """
+    The descriptor of `shard`'s segment, or None if there is no finished
+    segment. Raises ValueError if the segment does not belong to this
+    manifest or its CSV does not match the descriptor.
+    """
+    from result_store import file_fingerprint
+    paths = _segment_paths(segments_dir, shard['id'])
+    try:
+        with open(paths['descriptor'], 'r', encoding='utf-8') as f:
+            descriptor = json.load(f)
+    except FileNotFoundError:
+        return None
+    if descriptor.get('manifest') != manifest_key(manifest) or descriptor.get('rows') != shard['rows']:
+        raise ValueError(f"segment '{paths['descriptor']}' was produced for a different manifest")
+    if not os.path.exists(paths['output']) or file_fingerprint(paths['output']) != descriptor['output_digest']:
+        raise ValueError(f"the output of segment '{paths['descriptor']}' is missing or was changed")
+    return descriptor
+
+
+def work_shard(manifest, shard_id, segments_dir):
+    """
+    Translates one shard into its segment in `segments_dir`. Returns the
+    descriptor; raises ValueError if this machine's corpus or resources
+    differ from the manifest's and RuntimeError if the translator fails.
+    """
+    from corpus_ingest import AtomicWriter
+    from line_index import LineIndex
+    from result_store import file_fingerprint
+    shards = {shard['id']: shard for shard in manifest['shards']}
+    if shard_id not in shards:
+        raise ValueError(f"no shard '{shard_id}' in the manifest")
+    shard = shards[shard_id]
+    if resource_fingerprint(resource_files(manifest['options'])) != manifest['grammar_fingerprint']:
+        raise ValueError("the grammar, lexicon or dictionary differ from the ones the manifest was planned with")
+    start, stop = shard['rows']
+    index = LineIndex.open(manifest['corpus'])
+    if stop > len(index) or index.fingerprint(start, stop) != shard['digest']:
+        raise ValueError(f"rows {start}:{stop} of '{manifest['corpus']}' differ from the planned shard")
+
+    os.makedirs(segments_dir, exist_ok=True)
+    paths = _segment_paths(segments_dir, shard_id)
+    translator = os.path.join(os.path.dirname(os.path.abspath(__file__)), TRANSLATOR_SCRIPT)
+    command = [sys.executable, translator, '--data', manifest['corpus'], '--rows', f'{start}:{stop}',
+               '--output', paths['output'], '--stats', paths['stats'], '--examples', '0'] + manifest['options']
+    started = time.time()
+    with open(paths['log'], 'w', encoding='utf-8') as log:
+        returncode = subprocess.call(command, stdout=log, stderr=subprocess.STDOUT)
+    finished = time.time()
+    if returncode != 0 or not os.path.exists(paths['stats']):
+        raise RuntimeError(f"the translator failed on {shard_id} (exit code {returncode}); see '{paths['log']}'")
+    with open(paths['stats'], 'r', encoding='utf-8') as f:
+        statistics = json.load(f)
+
+    descriptor = {
+        'manifest': manifest_key(manifest),
+        'shard': shard_id,
+        'corpus': manifest['corpus'],
+        'rows': shard['rows'],
+        'bytes': shard['bytes'],
+        'grammar_fingerprint': manifest['grammar_fingerprint'],
+        'options': manifest['options'],
+        'host': socket.gethostname(),
+        'pid': os.getpid(),
+        'started': started,
+        'finished': finished,
+        'output': os.path.basename(paths['output']),
+        'output_digest': file_fingerprint(paths['output']),
+        'statistics': statistics,
+    }
+    # The descriptor marks the segment as finished, so it is written last.
+    with AtomicWriter(paths['descriptor']) as f:
+        json.dump(descriptor, f, indent=2)
+    return descriptor
+
+
+def merge_segments(manifest, segments_dir, output_path):
+    """
+    Concatenates the segments' CSVs in shard order into `output_path` and
+    returns the combined statistics. Raises ValueError if a segment is
+    missing or does not belong to the manifest.
+    """
+    from corpus_ingest import AtomicWriter
+    descriptors = []
+    for shard in manifest['shards']:
+        descriptor = load_segment(manifest, segments_dir, shard)
+        if descriptor is None:
+            raise ValueError(f"segment {shard['id']} is not finished")
+        descriptors.append(descriptor)
+
+    header = None
+    with AtomicWriter(output_path) as out:
+        writer = csv.writer(out)
+        for descriptor in descriptors:
+            with open(os.path.join(segments_dir, descriptor['output']), 'r', encoding='utf-8', newline='') as f:
+                reader = csv.reader(f)
+                segment_header = next(reader, None)
+                if header is None:
+                    header = segment_header
+                    writer.writerow(header)
+                elif segment_header != header:
+                    raise ValueError(f"segment {descriptor['shard']} has different columns")
+                writer.writerows(reader)
+
+    statuses = Counter()
+    for descriptor in descriptors:
+        statuses.update(descriptor['statistics']['statuses'])
+    worker_seconds = [descriptor['statistics']['wall_seconds'] for descriptor in descriptors]
+    return {
+        'shards': len(descriptors),
+        'hosts': sorted(set(descriptor['host'] for descriptor in descriptors)),
+        'sentences': sum(descriptor['statistics']['sentences'] for descriptor in descriptors),
+        'statuses': dict(statuses),
+        'attempted': sum(descriptor['statistics']['attempted'] for descriptor in descriptors),
+        'parse_seconds': sum(descriptor['statistics']['parse_seconds'] for descriptor in descriptors),
+        'worker_seconds': sum(worker_seconds),
+        'slowest_shard_seconds': max(worker_seconds, default=0.0),
+        'elapsed_seconds': (max((d['finished'] for d in descriptors), default=0.0)
+                            - min((d['started'] for d in descriptors), default=0.0)),
+    }
+
+
+def print_statistics(statistics):
+    from parse_budget import STATUS_PARSED
+    sentences = statistics['sentences']
+    parsed = statistics['statuses'].get(STATUS_PARSED, 0)
+    print(f"Merged {statistics['shards']} shards from {len(statistics['hosts'])} host(s): "
+          f"{parsed}/{sentences} sentences parsed ({parsed / max(sentences, 1):.1%}).")
+    for status, count in sorted(statistics['statuses'].items(), key=lambda item: -item[1]):
+        print(f"  {status}: {count}")
+    print(f"Parse time {statistics['parse_seconds']:.1f}s over {statistics['attempted']} attempted sentences "
+          f"({statistics['parse_seconds'] / max(statistics['attempted'], 1):.4f}s each); worker time "
+          f"{statistics['worker_seconds']:.1f}s, slowest shard {statistics['slowest_shard_seconds']:.1f}s, "
+          f"elapsed {statistics['elapsed_seconds']:.1f}s.")
+
+
+def run_local(manifest_path, manifest, segments_dir, processes):
+    """
+    Works through the unfinished shards with up to `processes` local
+    'work' processes. Returns the ids of the shards that failed.
+    """
+    pending = []
+    for shard in manifest['shards']:
+        try:
+            finished = load_segment(manifest, segments_dir, shard) is not None
+        except ValueError:
+            finished = False
+        if not finished:
+            pending.append(shard['id'])
+    print(f"{len(manifest['shards']) - len(pending)} of {len(manifest['shards'])} shards already done; "
+          f"running {len(pending)} with {processes} processes.")
+    running = {}
+    failed = []
+    while pending or running:
+        while pending and len(running) < processes:
+            shard_id = pending.pop(0)
+            running[shard_id] = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), 'work', manifest_path, '--shard', shard_id,
+                 '--segments', segments_dir])
+        time.sleep(0.05)
+        for shard_id, process in list(running.items()):
+            if process.poll() is not None:
+                del running[shard_id]
+                if process.returncode != 0:
+                    failed.append(shard_id)
+    return failed
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Translator options for 'plan' follow a '--'.
+    options = []
+    if '--' in argv:
+        options = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    arg_parser = argparse.ArgumentParser(
+        description="Sharded corpus runs: plan a manifest, work shards, merge segments.",
+        epilog="Example: python shard_runner.py plan CORPUS --shards 8 -- --workers 2 --no-chunk-fallback")
+    arg_parser.add_argument('command', choices=['plan', 'work', 'merge', 'run'])
+    arg_parser.add_argument('path', help="Corpus TSV for 'plan', the manifest otherwise.")
+    arg_parser.add_argument('--manifest', default=DEFAULT_MANIFEST_FILE, help="Manifest written by 'plan'.")
+    arg_parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS, help="Number of shards ('plan').")
+    arg_parser.add_argument('--shard', help="Shard id to translate ('work').")
+    arg_parser.add_argument('--segments', default=None, metavar='DIR',
+                            help="Segment directory (default: '<manifest>_segments').")
+    arg_parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="Local worker processes ('run').")
+    arg_parser.add_argument('--output', default='translation_analysis_output.csv',
+                            help="Merged CSV ('merge', 'run').")
+    arg_parser.add_argument('--stats', default=None, metavar='JSON', help="Also write the merged statistics here.")
+    args = arg_parser.parse_args(argv)
+
+    if args.command == 'plan':
+        shared = [option for option in options if option.split('=')[0] in _SHARD_OPTIONS]
+        if shared:
+            print(f"Error: cannot pass {', '.join(shared)} to the shards: each shard sets its own, "
+                  f"or every shard would write the same file.")
+            return 1
+        try:
+            manifest = plan_shards(args.path, args.shards, options, args.manifest)
+        except FileNotFoundError as e:
+            print(f"Error: File not found: {e.filename}")
+            return 1
+        for shard in manifest['shards']:
+            print(f"{shard['id']}: rows {shard['rows'][0]}:{shard['rows'][1]}, "
+                  f"bytes {shard['bytes'][0]}-{shard['bytes'][1]}")
+        print(f"Wrote {len(manifest['shards'])} shards of '{args.path}' to '{args.manifest}'.")
+        return 0
+    if options:
+        print("Error: translator options are only given to 'plan'.")
+        return 1
+
+    try:
+        manifest = load_manifest(args.path)
+    except (OSError, ValueError) as e:
+        print(f"Error reading the manifest: {e}")
+        return 1
+    segments_dir = args.segments or default_segments_dir(args.path)
+    try:
+        if args.command == 'work':
+            if not args.shard:
+                print("Error: 'work' needs --shard ID.")
+                return 1
+            descriptor = work_shard(manifest, args.shard, segments_dir)
+            print(f"{args.shard}: {descriptor['statistics']['sentences']} sentences in "
+                  f"{descriptor['finished'] - descriptor['started']:.1f}s on {descriptor['host']}.")
+            return 0
+        if args.command == 'run':
+            failed = run_local(args.path, manifest, segments_dir, max(1, args.processes))
+            if failed:
+                print(f"Error: {len(failed)} shards failed: {', '.join(failed)}. Rerun to retry them.")
+                return 1
+        statistics = merge_segments(manifest, segments_dir, args.output)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}")
+        return 1
+    print_statistics(statistics)
+    print(f"Merged output written to {args.output}")
+    if args.stats:
+        from corpus_ingest import AtomicWriter
+        with AtomicWriter(args.stats) as f:
+            json.dump(statistics, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import itertools
+import sys
+import time
+
+import numpy as np
+from nltk import CFG, Production, Tree
+
+from parse_budget import STATUS_PARSED
+
+# POS-sequence skeleton cache.
+# Lexical productions only map a word to its POS tags, so two sentences
+# whose words have the same tags, position by position, fill the same chart
+# and get the same trees up to the leaves. Every word is replaced by the ID
+# of its tag signature (the tags of its lexical rules in grammar order, and
+# their log probabilities for the Viterbi parser), each distinct sequence
+# of signatures (a skeleton) is parsed once against the structural rules
+# and one `tag -> signature` rule per tag, and every sentence with that
+# skeleton gets a copy of the result with its own words spliced back in.
+# The rules keep their grammar order, so ties are broken as before and the
+# output is identical to parsing each sentence.
+
+
+def splice(tree, leaves):
+    """Copy of `tree` whose leaves are taken in order from the iterator `leaves`."""
+    if not isinstance(tree, Tree):
+        return next(leaves)
+    return Tree(tree.label(), [splice(child, leaves) for child in tree])
+
+
+class SkeletonCache:
+    """
+    Skeleton grammar and parse results of a parse grammar. With
+    `log_probs` ({production: log_prob}, as for the Viterbi parsers) the
+    signatures include each tag's probability and `self.log_probs` holds the
+    matching skeleton rule probabilities. Signature IDs start at 1 (nltk
+    treats a falsy leaf as missing); `self.unknown` stands for every token
+    without lexical rules. With `max_tags`, every subset of at most that
+    many tags of a signature also gets an ID, for restrict().
+    """
+
+    def __init__(self, grammar, log_probs=None, max_tags=0):
+        structural = []
+        entries = {}
+        for prod in grammar.productions():
+            rhs = prod.rhs()
+            if not prod.is_lexical():
+                structural.append(prod)
+            elif len(rhs) == 1:
+                entry = entries.setdefault(rhs[0], [])
+                if log_probs is None:
+                    entry.append((prod.lhs(),))
+                elif prod in log_probs:
+                    entry.append((prod.lhs(), log_probs[prod]))
+            else:
+                raise ValueError(f"rule '{prod}' mixes words and tags, so its sentences have no skeleton")
+
+        signature_ids = {}
+        self._signature_of = {}
+        for terminal, entry in entries.items():
+            self._signature_of[terminal] = signature_ids.setdefault(tuple(entry), len(signature_ids) + 1)
+        self.num_signatures = len(signature_ids)
+        if max_tags > 0:
+            for signature in list(signature_ids):
+                for size in range(1, min(max_tags, len(signature) - 1) + 1):
+                    for subset in itertools.combinations(signature, size):
+                        signature_ids.setdefault(subset, len(signature_ids) + 1)
+        self.unknown = len(signature_ids) + 1
+        self.known_terminals = set(signature_ids.values())
+        self._signatures = [None] + list(signature_ids)
+        self._signature_ids = signature_ids
+
+        productions = list(structural)
+        self.log_probs = {prod: log_probs[prod] for prod in structural if prod in log_probs} \
+            if log_probs is not None else None
+        for signature, signature_id in signature_ids.items():
+            for entry in signature:
+                prod = Production(entry[0], [signature_id])
+                productions.append(prod)
+                if self.log_probs is not None:
+                    self.log_probs[prod] = entry[1]
+        self.grammar = CFG(grammar.start(), productions)
+        self._outcomes = {}
+        self._unparsed = set()
+        self.sentences = 0
+        self.pruned = 0
+        self.retried = 0
+
+    def tags(self, signature_id):
+        """Tag names of a signature, in grammar order; () for the unknown token."""
+        if signature_id == self.unknown:
+            return ()
+        return tuple(entry[0].symbol() for entry in self._signatures[signature_id])
+
+    def signature(self, terminal, default=None):
+        """Signature ID of a terminal; `default` (self.unknown if None) for one without lexical rules."""
+        return self._signature_of.get(terminal, self.unknown if default is None else default)
+
+    def restrict(self, signature_id, tags):
+        """ID of the signature keeping only the given tags (created with `max_tags`)."""
+        signature = self._signatures[signature_id]
+        return self._signature_ids[tuple(entry for entry in signature if entry[0].symbol() in tags)]
+
+    def signature_table(self, vocabulary, id_terminals=False):
+        """
+        Signature ID of every vocabulary ID, as an array. The grammar's
+        terminals are words, or vocabulary IDs with `id_terminals`.
+        """
+        signature_of = self._signature_of
+        terminals = range(len(vocabulary)) if id_terminals else vocabulary.words()
+        return np.fromiter((signature_of.get(terminal, self.unknown) for terminal in terminals),
+                           dtype=np.int32, count=len(vocabulary))
+
+    def skeletons(self, corpus, id_terminals=False):
+        """Skeleton (tuple of signature IDs) of every sentence of a TokenizedCorpus."""
+        if not len(corpus):
+            return []
+        signatures = self.signature_table(corpus.vocabulary, id_terminals)[corpus.token_ids]
+        return [tuple(chunk.tolist()) for chunk in np.split(signatures, corpus.offsets[1:-1])]
+
+    def _parse_new(self, skeletons, parse_skeletons):
+        new = list(dict.fromkeys(skeleton for skeleton in skeletons if skeleton not in self._outcomes))
+        if new:
+            for skeleton, outcome in zip(new, parse_skeletons([list(skeleton) for skeleton in new])):
+                self._outcomes[skeleton] = outcome
+        return set(new)
+
+    def parses(self, skeleton):
+        """True if `skeleton` has a cached full parse."""
+        outcome = self._outcomes.get(skeleton)
+        return outcome is not None and outcome[0] == STATUS_PARSED
+
+    def parse(self, skeletons, token_lists, parse_skeletons, full_skeletons=None, parse_pruned=None):
+        """
+        Outcomes (status, tree, elapsed, chunks) for sentences with the given
+        skeletons and tokens. Skeletons without a cached result are passed,
+        once each, to `parse_skeletons` (a list of token lists -> outcomes,
+        e.g. parse_corpus over self.grammar). The parse time is reported on
+        the first sentence of each skeleton; the others get 0.0.
+
+        When `skeletons` have pruned tags (see pos_tagger.py), the pruned
+        ones are parsed with `parse_pruned`, which need not compute fallback
+        chunks, and a sentence whose pruned skeleton does not parse gets the
+        outcome of its skeleton in `full_skeletons`.
+        """
+        timed = set()
+        if full_skeletons is not None:
+            new = list(dict.fromkeys(
+                skeleton for skeleton, full in zip(skeletons, full_skeletons)
+                if skeleton != full and skeleton not in self._outcomes and skeleton not in self._unparsed))
+            if new:
+                for skeleton, outcome in zip(new, parse_pruned([list(skeleton) for skeleton in new])):
+                    if outcome[0] == STATUS_PARSED:
+                        self._outcomes[skeleton] = outcome
+                        timed.add(skeleton)
+                    else:
+                        self._unparsed.add(skeleton)
+            chosen = []
+            for skeleton, full in zip(skeletons, full_skeletons):
+                if skeleton != full:
+                    self.pruned += 1
+                    if not self.parses(skeleton):
+                        self.retried += 1
+                        skeleton = full
+                chosen.append(skeleton)
+            skeletons = chosen
+        timed |= self._parse_new(skeletons, parse_skeletons)
+        self.sentences += len(skeletons)
+
+        outcomes = []
+        for skeleton, tokens in zip(skeletons, token_lists):
+            status, tree, elapsed, chunks = self._outcomes[skeleton]
+            if tree is not None:
+                tree = splice(tree, iter(tokens))
+            if chunks:
+                leaves = iter(tokens)
+                chunks = [splice(chunk, leaves) for chunk in chunks]
+            if skeleton in timed:
+                timed.discard(skeleton)
+            else:
+                elapsed = 0.0
+            outcomes.append((status, tree, elapsed, chunks))
+        return outcomes
+
+    def __len__(self):
+        return len(self._outcomes)
+
+
+def benchmark(corpus_file, grammar_file, lexicon_file, limit=0, engine='earley', model_file=None, workers=1):
+    """
+    Parses the corpus once per sentence and once per skeleton, checks that
+    both give the same outcomes, and prints the unique-skeleton ratio and
+    the speedup.
+    """
+    from translator_core import load_grammar, load_lexicon, build_productions
+    from corpus_columns import TokenizedCorpus
+    from parse_budget import parse_corpus, DEFAULT_TIME_BUDGET, DEFAULT_EDGE_BUDGET
+    from pcfg_model import load_model, rule_log_probabilities, read_corpus_tokens
+    from chart_arena import arena_parser_factory
+    from earley_parser import earley_parser_factory
+
+    texts = [' '.join(tokens) for tokens in read_corpus_tokens([corpus_file]) if tokens]
+    if limit:
+        texts = texts[:limit]
+    corpus = TokenizedCorpus.from_texts(texts)
+    token_lists = corpus.token_lists()
+    grammar_cfg = load_grammar(grammar_file)
+    productions, _ = build_productions(grammar_cfg, load_lexicon(lexicon_file), corpus.vocabulary_words())
+    grammar = CFG(grammar_cfg.start(), productions)
+    terminals = set(prod.rhs()[0] for prod in productions if prod.is_lexical())
+
+    log_probs = None
+    if model_file:
+        log_probs = rule_log_probabilities(productions, load_model(model_file)['counts'])
+        max_length = int(corpus.lengths().max(initial=0))
+
+        def factory(probs):
+            return arena_parser_factory(probs, max_length=max_length)
+        engine = 'pcfg'
+    elif engine == 'earley':
+        def factory(probs):
+            return earley_parser_factory()
+    else:
+        def factory(probs):
+            return None
+
+    def run(inputs, parse_grammar, known_terminals, make_parser):
+        return parse_corpus(inputs, parse_grammar, known_terminals=known_terminals, workers=workers,
+                            time_budget=DEFAULT_TIME_BUDGET, edge_budget=DEFAULT_EDGE_BUDGET, fallback=True,
+                            make_parser=make_parser)
+
+    print(f"{len(token_lists)} sentences, {engine} parser, {workers} worker(s).")
+    start_time = time.perf_counter()
+    direct = run(token_lists, grammar, terminals, factory(log_probs))
+    direct_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    cache = SkeletonCache(grammar, log_probs)
+    skeletons = cache.skeletons(corpus)
+    make_parser = factory(cache.log_probs)
+    cached = cache.parse(skeletons, token_lists,
+                         lambda inputs: run(inputs, cache.grammar, cache.known_terminals, make_parser))
+    cached_seconds = time.perf_counter() - start_time
+
+    differences = sum((a[0], a[1], a[3]) != (b[0], b[1], b[3]) for a, b in zip(direct, cached))
+    print(f"{len(cache)} distinct skeletons over {cache.num_signatures} tag signatures "
+          f"({len(cache) / max(len(token_lists), 1):.1%} of sentences).")
+    print(f"Per sentence: {direct_seconds:.2f}s; per skeleton: {cached_seconds:.2f}s "
+          f"({direct_seconds / max(cached_seconds, 1e-9):.2f}x). {differences} outcomes differ.")
+    return differences
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Compare parsing every sentence with parsing each POS skeleton once.")
+    parser.add_argument('corpus', nargs='?', default='Sentence pairs in Tagalog-English (UNREDUCED).tsv')
+    parser.add_argument('--limit', type=int, default=0, help="Only use the first N sentences (0 = all).")
+    parser.add_argument('--parser', choices=['chart', 'earley'], default='earley')
+    parser.add_argument('--pcfg', nargs='?', const='pcfg_rule_counts.json', default=None, metavar='MODEL',
+                        help="Benchmark the arena Viterbi parser with rule probabilities from MODEL.")
+    parser.add_argument('--grammar', default='Appendix_D_Resource_Grammar_Tagalog_CFG.cfg')
+    parser.add_argument('--lexicon', default='Appendix_B_Resource_Lexicon_Tagalog_POS.tsv')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+    differences = benchmark(args.corpus, args.grammar, args.lexicon, args.limit, args.parser, args.pcfg,
+                            args.workers)
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
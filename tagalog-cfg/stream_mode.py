@@ -0,0 +1,304 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from translator_core import (load_grammar, load_lexicon, load_dictionary, build_productions, tokenize_sentence,
+                             simple_lexical_translate, rewrite_leaves)
+from parse_budget import parse_with_budget, STATUS_PARSED
+from chunk_fallback import chunk_leaves, format_chunks
+from skeleton_cache import SkeletonCache
+from tree_serializer import serialize_tree
+
+# Line-oriented translation for shell pipelines and sidecar processes.
+# 'CFG Based Translator.py --stream' builds the grammar, the skeleton
+# grammar and the parser once, then translates every line of stdin as one
+# sentence and writes one JSON object (or TSV row) per line to stdout,
+# flushed right away. Sentences are parsed through the skeleton cache, so
+# a line whose POS sequence was seen before costs only the splice and the
+# dictionary lookups. With --morphology and --fuzzy, a word missing from
+# the lexicon gets the tags and translation of the known words sharing its
+# root, or else of its nearest known spelling; each distinct word is
+# resolved once. Words left unresolved stand for a default N, as corpus
+# words do in a batch run. With several workers, lines are read ahead and
+# parsed by a pool of forked processes, and results are still written in
+# input order. Nothing here imports pandas, and all progress messages go
+# to stderr. With --metrics-port, throughput, queue depth, parse statuses,
+# cache hits and per-stage latencies are served for Prometheus (see
+# metrics.py).
+
+STREAM_FORMATS = ('json', 'tsv')
+TSV_FIELDS = ('input', 'status', 'translation', 'rewritten', 'tree')
+# Stands for every word missing from the lexicon: it is added as N like the
+# unknown words of a batch corpus, and its POS signature is theirs.
+_UNKNOWN_WORD = '<unknown>'
+
+
+class StreamTranslator:
+    """Grammar, skeleton cache and parser of a stream run, built once."""
+
+    def __init__(self, args, grammar_file, lexicon_file, dictionary_file):
+        from nltk import CFG
+        grammar_cfg = load_grammar(grammar_file)
+        lexicon_data = load_lexicon(lexicon_file)
+        dictionary = load_dictionary(dictionary_file)
+        # Resolved words get their borrowed translations added to this copy; they are borrowed from
+        # `dictionary` only, so a translation does not depend on the lines seen before.
+        self._dictionary = dictionary
+        self.dictionary = dict(dictionary)
+        self._lexicon_words = set(word for pos, word in lexicon_data)
+        self._analyzer = self._resolver = None
+        self._tag_words = {}
+        stand_in_entries = []
+        if args.morphology:
+            from morphology import MorphAnalyzer
+            self._analyzer = MorphAnalyzer(lexicon_data, dictionary)
+            # A word analyzed through its root gets the tags of all the known words sharing it, which
+            # no single known word may have; every such tag list gets a stand-in word with exactly those.
+            for tags in self._analyzer.inherited_tag_sets():
+                word = self._tag_words[tags] = f"<{'+'.join(tags)}>"
+                stand_in_entries.extend((pos, word) for pos in tags)
+        if args.fuzzy is not None:
+            from fuzzy_lexicon import FuzzyResolver
+            self._resolver = FuzzyResolver(lexicon_data, dictionary, args.fuzzy)
+        self._parsed_as = {}
+
+        productions, _ = build_productions(grammar_cfg, lexicon_data + stand_in_entries, [_UNKNOWN_WORD])
+        grammar = CFG(grammar_cfg.start(), productions)
+        self.time_budget = args.time_budget
+        self.edge_budget = args.edge_budget
+        self.fallback = args.chunk_fallback
+
+        log_probs = None
+        if args.pcfg:
+            from pcfg_model import load_model, rule_log_probabilities
+            log_probs = rule_log_probabilities(grammar.productions(), load_model(args.pcfg)['counts'])
+        self.cache = SkeletonCache(grammar, log_probs)
+        self._unknown_signature = self.cache.signature(_UNKNOWN_WORD)
+        self.engine = self._engine(args, grammar)
+        self.parser = self._make_parser(args)(self.cache.grammar, self.time_budget, self.edge_budget)
+
+    def _engine(self, args, grammar):
+        if args.pcfg or args.parser != 'auto':
+            return 'pcfg' if args.pcfg else args.parser
+        from earley_parser import load_selection, grammar_key, DEFAULT_SELECTION_FILE
+        # Lines are parsed as POS skeletons, so the choice benchmarked on skeletons applies.
+        selection = load_selection(DEFAULT_SELECTION_FILE).get(
+            grammar_key(grammar.productions(), grammar.start(), skeletons=True))
+        if selection is None:
+            print("Note: no parser has been benchmarked on POS skeletons for this grammar yet (run a batch "
+                  "with --parser auto, or 'python earley_parser.py --skeletons'); using the chart parser.")
+            return 'chart'
+        return selection['engine']
+
+    def _make_parser(self, args):
+        if self.engine == 'pcfg':
+            if args.chart_arena:
+                from chart_arena import arena_parser_factory
+                return arena_parser_factory(self.cache.log_probs, beam_width=args.beam_width)
+            from pcfg_model import viterbi_parser_factory
+            return viterbi_parser_factory(self.cache.log_probs, beam_width=args.beam_width)
+        if self.engine == 'earley':
+            from earley_parser import EarleyGrammar, earley_parser_factory
+            from parser_codegen import load_generated
+            compiled = EarleyGrammar(self.cache.grammar)
+            generated = load_generated(compiled) if args.codegen else None
+            return earley_parser_factory(top_down=not self.fallback, compiled=compiled, generated=generated)
+        from parse_budget import BudgetedChartParser
+        return BudgetedChartParser
+
+    def _resolve(self, token):
+        """
+        The word `token` is parsed as: itself if it is in the lexicon, else
+        the stand-in for the tags it inherits through its root (--morphology)
+        or its nearest known spelling (--fuzzy), in that order as in a batch
+        run. A translation found the same way is added to the dictionary.
+        Memoized.
+        """
+        try:
+            return self._parsed_as[token]
+        except KeyError:
+            pass
+        word = token
+        translation = None
+        if self._analyzer is not None:
+            if token not in self._lexicon_words:
+                word = self._tag_words.get(tuple(self._analyzer.tags(token)), token)
+            if token not in self.dictionary:
+                translation = self._analyzer.translation(token)
+        if self._resolver is not None:
+            nearest = self._resolver.resolve(token)
+            if word == token and nearest in self._lexicon_words:
+                word = nearest
+            if translation is None and token not in self.dictionary:
+                translation = self._dictionary.get(nearest)
+        if translation is not None:
+            self.dictionary.setdefault(token, translation)
+        self._parsed_as[token] = word
+        return word
+
+    def _parse_skeletons(self, skeletons):
+        return [parse_with_budget(self.parser, skeleton, self.cache.known_terminals, self.fallback)
+                for skeleton in skeletons]
+
+    def translate(self, line):
+        """
+        (result dict, stages) for one input line. `stages` holds the seconds
+        spent parsing, rewriting and looking up translations, and whether
+        the skeleton was already cached, for the metrics.
+        """
+        tokens = tokenize_sentence(line)
+        words = tokens
+        if self._analyzer is not None or self._resolver is not None:
+            words = [self._resolve(token) for token in tokens]
+        skeleton = tuple(self.cache.signature(word, self._unknown_signature) for word in words)
+        start_time = time.perf_counter()
+        cached = len(self.cache)
+        status, tree, _, chunks = self.cache.parse([skeleton], [tokens], self._parse_skeletons)[0]
+        parsed_time = time.perf_counter()
+        result = {'input': line, 'status': status, 'translation': '', 'rewritten': '', 'tree': ''}
+        leaves = None
+        if status == STATUS_PARSED:
+            leaves = rewrite_leaves(tree)
+            result['tree'] = serialize_tree(tree)
+        elif chunks:
+            leaves = chunk_leaves(chunks)
+            result['chunks'] = format_chunks(chunks)
+        if leaves is not None:
+            result['rewritten'] = ' '.join(leaves)
+        rewritten_time = time.perf_counter()
+        if leaves is not None:
+            result['translation'] = simple_lexical_translate(leaves, self.dictionary)
+        elif tokens:
+            result['translation'] = simple_lexical_translate(tokens, self.dictionary)
+        else:
+            result['translation'] = "[No tokens]"
+        end_time = time.perf_counter()
+        result['seconds'] = round(end_time - start_time, 6)
+        stages = (parsed_time - start_time, rewritten_time - parsed_time, end_time - rewritten_time,
+                  len(self.cache) == cached)
+        return result, stages
+
+
+def format_result(result, output_format):
+    if output_format == 'json':
+        return json.dumps(result, ensure_ascii=False)
+    return '\t'.join(str(result.get(field, '')).replace('\t', ' ') for field in TSV_FIELDS)
+
+
+def _write_results(outcomes, stdout, output_format, metrics=None):
+    for result, stages in outcomes:
+        stdout.write(format_result(result, output_format) + '\n')
+        stdout.flush()
+        if metrics is not None:
+            _record(metrics, result, stages)
+
+
+_worker_translator = None
+
+
+def _init_worker(translator):
+    global _worker_translator
+    _worker_translator = translator
+
+
+def _translate_task(line):
+    return _worker_translator.translate(line)
+
+
+_LINES_READ = ('tagalog_lines_read_total',)
+_LINES_WRITTEN = ('tagalog_lines_written_total',)
+_CACHE_HIT = ('tagalog_skeleton_cache_lookups_total', ('result', 'hit'))
+_CACHE_MISS = ('tagalog_skeleton_cache_lookups_total', ('result', 'miss'))
+_STAGE_SERIES = tuple(('tagalog_stage_seconds', ('stage', stage))
+                      for stage in ('parse', 'rewrite', 'simple_lexical_translate'))
+_status_series = {}
+
+
+def _input_lines(stream, metrics=None):
+    # With a pool this runs in its task-feeding thread, which owns `metrics`.
+    for line in stream:
+        if metrics is not None:
+            metrics.inc(_LINES_READ)
+        yield line.rstrip('\r\n')
+
+
+def stream_registry():
+    """(registry, reader shard, result shard) of the stream metrics."""
+    from metrics import MetricsRegistry
+    registry = MetricsRegistry()
+    registry.counter('tagalog_lines_read_total', "Input lines read from stdin.")
+    registry.counter('tagalog_lines_written_total', "Results written to stdout.")
+    registry.counter('tagalog_sentences_total', "Translated sentences by parse status.")
+    registry.counter('tagalog_skeleton_cache_lookups_total', "Skeleton cache lookups by result (hit or miss).")
+    registry.histogram('tagalog_stage_seconds', "Seconds per sentence in the parse, rewrite and "
+                                                "simple_lexical_translate stages.")
+    reader = registry.shard()
+    writer = registry.shard()
+    registry.gauge('tagalog_queue_depth', "Lines read but not yet written.",
+                   lambda: reader.cells.get(_LINES_READ, 0) - writer.cells.get(_LINES_WRITTEN, 0))
+    return registry, reader, writer
+
+
+def _record(metrics, result, stages):
+    status = result['status']
+    status_key = _status_series.get(status)
+    if status_key is None:
+        from metrics import series
+        status_key = _status_series[status] = series('tagalog_sentences_total', status=status)
+    metrics.inc(_LINES_WRITTEN)
+    metrics.inc(status_key)
+    metrics.inc(_CACHE_HIT if stages[3] else _CACHE_MISS)
+    for key, seconds in zip(_STAGE_SERIES, stages):
+        metrics.observe(key, seconds)
+
+
+def run_stream(args, grammar_file, lexicon_file, dictionary_file, stdin=None, stdout=None):
+    """Translates stdin line by line to stdout; returns the exit code."""
+    stdin = stdin if stdin is not None else sys.stdin
+    stdout = stdout if stdout is not None else sys.stdout
+    for stream in (stdin, stdout):
+        if hasattr(stream, 'reconfigure'):
+            stream.reconfigure(encoding='utf-8')
+    start_time = time.time()
+    # Setup messages from the shared modules must not end up among the results.
+    with contextlib.redirect_stdout(sys.stderr):
+        translator = StreamTranslator(args, grammar_file, lexicon_file, dictionary_file)
+    print(f"Stream mode: '{translator.engine}' parser ready in {time.time() - start_time:.2f}s; "
+          f"reading sentences from stdin.", file=sys.stderr)
+
+    reader_metrics = result_metrics = None
+    if args.metrics_port is not None:
+        from metrics import serve_metrics
+        registry, reader_metrics, result_metrics = stream_registry()
+        try:
+            server = serve_metrics(registry, args.metrics_port)
+        except OSError as e:
+            print(f"Error: could not serve metrics on port {args.metrics_port}: {e}", file=sys.stderr)
+            return 1
+        host, port = server.server_address[:2]
+        print(f"Metrics at http://{host}:{port}/metrics", file=sys.stderr)
+
+    workers = args.workers
+    if workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        print("Warning: Parallel parsing needs the 'fork' start method; parsing sequentially.", file=sys.stderr)
+        workers = 1
+    lines = _input_lines(stdin, reader_metrics)
+    try:
+        if workers <= 1:
+            outcomes = map(translator.translate, lines)
+            _write_results(outcomes, stdout, args.stream_format, result_metrics)
+        else:
+            ctx = multiprocessing.get_context('fork')
+            with ctx.Pool(workers, initializer=_init_worker, initargs=(translator,)) as pool:
+                _write_results(pool.imap(_translate_task, lines, chunksize=1), stdout, args.stream_format,
+                               result_metrics)
+    except BrokenPipeError:
+        # The reader went away (e.g. '| head'); output still buffered would fail again at exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stdout.fileno())
+        return 0
+    except KeyboardInterrupt:
+        return 130
+    return 0
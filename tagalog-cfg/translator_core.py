@@ -0,0 +1,148 @@
+import csv
+import json
+import sys
+
+from nltk import CFG, Tree, Nonterminal, Production
+
+# Resource loading and sentence-level translation steps shared by the
+# translator script and the helper modules: grammar construction,
+# tokenization, the tree rewrite rules and lexical transfer.
+
+def load_grammar(filepath):
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            grammar_string = f.read()
+        return CFG.fromstring(grammar_string)
+    except FileNotFoundError:
+        print(f"Error: Grammar file not found at '{filepath}'.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error loading grammar from '{filepath}': {e}")
+        sys.exit(1)
+
+def load_lexicon(filepath):
+    lexicon = []
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f, delimiter='\t')
+            for row in reader:
+                if row and len(row) == 2:
+                    pos, word = row
+                    lexicon.append((pos, word))
+                elif row:
+                    print(f"Warning: Skipping malformed lexicon line: {row}")
+            return lexicon
+    except FileNotFoundError:
+        print(f"Error: Lexicon file not found at '{filepath}'.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error loading lexicon from '{filepath}': {e}")
+        sys.exit(1)
+
+def load_dictionary(filepath):
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            translation_dict = json.load(f)
+        return translation_dict
+    except FileNotFoundError:
+        print(f"Error: Dictionary file not found at '{filepath}'.")
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        print(f"Error parsing JSON dictionary file '{filepath}': {e}")
+        print("Please ensure the file is valid JSON format.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error loading dictionary from '{filepath}': {e}")
+        sys.exit(1)
+
+def build_productions(grammar_cfg, lexicon_data, corpus_tokens=()):
+    """
+    Combines the structural rules of `grammar_cfg` with one lexical rule per
+    lexicon entry. Corpus tokens missing from the lexicon are added as `N`.
+    Returns (all_productions, number_of_tokens_added_as_N).
+    """
+    structural_productions = grammar_cfg.productions()
+
+    lexical_productions = []
+    words_in_lexicon = set()
+    processed_productions = set(structural_productions)
+
+    for pos_str, word in lexicon_data:
+        lhs = Nonterminal(pos_str)
+        rhs = [word]
+        production = Production(lhs, rhs)
+        if production not in processed_productions:
+            lexical_productions.append(production)
+            processed_productions.add(production)
+            words_in_lexicon.add(word)
+
+    all_productions = structural_productions + lexical_productions
+
+    added_as_default_N = 0
+    for tok in corpus_tokens:
+        if tok not in words_in_lexicon:
+            lhs = Nonterminal('N'); rhs = [tok]
+            production = Production(lhs, rhs)
+            if production not in processed_productions:
+                all_productions.append(production)
+                processed_productions.add(production)
+                added_as_default_N += 1
+    return all_productions, added_as_default_N
+
+def tokenize_sentence(s):
+    if not isinstance(s, str): return []
+    s = s.lower()
+    return s.split()
+
+def simple_lexical_translate(tagalog_words, dictionary):
+    if not isinstance(tagalog_words, list):
+        return "[Error: Input not a list]"
+    english_words = []
+    for word in tagalog_words:
+        translated = dictionary.get(str(word).lower(), f"[{word}]")
+        if translated:
+            english_words.append(translated)
+    return finish_translation(english_words)
+
+def finish_translation(english_words):
+    if not english_words:
+        return "[N/A]"
+    sentence = " ".join(english_words).replace(" ?", "?").replace(" .", ".").replace(" ,", ",").replace(" !", "!")
+    if sentence:
+        return sentence[0].upper() + sentence[1:]
+    return sentence
+
+def _rewritten_children(tree):
+    """Children of `tree` after applying the rewrite rules at its root."""
+    if tree.label() == "S" and len(tree) == 2:
+        child1, child2 = tree
+        if isinstance(child1, Tree) and child1.label() == "VP" and \
+           isinstance(child2, Tree) and child2.label() == "NP":
+            return [child2, child1]
+
+    if tree.label() == "S" and len(tree) == 3:
+        child1, child2, child3 = tree
+        is_ay_phrase = (isinstance(child2, Tree) and child2.label() == 'AY')
+
+        if isinstance(child1, Tree) and child1.label() == "NP" and \
+           is_ay_phrase and \
+           isinstance(child3, Tree) and child3.label() == "VP":
+            return [child1, child3]
+
+    return tree
+
+def rewrite(tree):
+    if not isinstance(tree, Tree):
+        return tree
+    return Tree(tree.label(), [rewrite(child) for child in _rewritten_children(tree)])
+
+def rewrite_leaves(tree, leaves=None):
+    """Leaves of rewrite(tree), in order, without building the rewritten tree."""
+    if leaves is None:
+        leaves = []
+    if not isinstance(tree, Tree):
+        leaves.append(tree)
+        return leaves
+    for child in _rewritten_children(tree):
+        rewrite_leaves(child, leaves)
+    return leaves
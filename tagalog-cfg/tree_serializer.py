@@ -0,0 +1,35 @@
+from nltk import Tree
+
+# Single-pass bracketed tree serialization for the CSV output.
+# nltk's str(tree)/pformat() first renders every subtree flat to test it
+# against the margin and then renders it again over several lines, which is
+# quadratic in the tree depth; the output then needs replace() passes to
+# become a single line. This writes the flat bracketed form, e.g.
+# "(S (NP (N bata)) (VP (V kumain)))", in one traversal. It is the same
+# string nltk produces for any tree that fits within its margin.
+
+
+def write_tree(tree, write, leaf=str):
+    """
+    Writes the bracketed form of `tree` through `write` (e.g. a list's
+    append or a file's write). `leaf` renders each leaf, which lets
+    ID-leaved trees be written without decoding them into a new tree first.
+    """
+    label = tree.label()
+    write('(')
+    write(label if isinstance(label, str) else repr(label))
+    if not len(tree):
+        write(' ')
+    for child in tree:
+        write(' ')
+        if isinstance(child, Tree):
+            write_tree(child, write, leaf)
+        else:
+            write(leaf(child))
+    write(')')
+
+
+def serialize_tree(tree, leaf=str):
+    parts = []
+    write_tree(tree, parts.append, leaf)
+    return ''.join(parts)